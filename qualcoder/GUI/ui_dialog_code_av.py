@@ -32,9 +32,8 @@ class Ui_Dialog_code_av(object):
         self.splitter = QtWidgets.QSplitter(self.splitter_2)
         self.splitter.setOrientation(QtCore.Qt.Horizontal)
         self.splitter.setObjectName("splitter")
-        self.treeWidget = QtWidgets.QTreeWidget(self.splitter)
-        self.treeWidget.setObjectName("treeWidget")
-        self.treeWidget.headerItem().setText(0, "Codes")
+        self.treeView = QtWidgets.QTreeView(self.splitter)
+        self.treeView.setObjectName("treeView")
         self.textEdit = QtWidgets.QTextEdit(self.splitter)
         self.textEdit.setTabChangesFocus(True)
         self.textEdit.setObjectName("textEdit")
@@ -55,9 +55,8 @@ class Ui_Dialog_code_image(object):
         self.splitter = QtWidgets.QSplitter(self.groupBox)
         self.splitter.setOrientation(QtCore.Qt.Horizontal)
         self.splitter.setObjectName("splitter")
-        self.treeWidget = QtWidgets.QTreeWidget(self.splitter)
-        self.treeWidget.setObjectName("treeWidget")
-        self.treeWidget.headerItem().setText(0, "1")
+        self.treeView = QtWidgets.QTreeView(self.splitter)
+        self.treeView.setObjectName("treeView")
         self.scrollArea = QtWidgets.QScrollArea(self.splitter)
         self.scrollArea.setWidgetResizable(True)
         self.scrollArea.setObjectName("scrollArea")
@@ -64,17 +64,16 @@ class Ui_Dialog_codes(object):
         self.splitter.setObjectName("splitter")
         self.leftsplitter = QtWidgets.QSplitter(self.splitter)
         self.leftsplitter.setOrientation(QtCore.Qt.Vertical)
-        self.treeWidget = QtWidgets.QTreeWidget(self.leftsplitter)
+        self.treeView = QtWidgets.QTreeView(self.leftsplitter)
         self.listWidgetLinks = QtWidgets.QListWidget(self.leftsplitter)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
         sizePolicy.setHorizontalStretch(0)
         sizePolicy.setVerticalStretch(0)
-        sizePolicy.setHeightForWidth(self.treeWidget.sizePolicy().hasHeightForWidth())
-        self.treeWidget.setSizePolicy(sizePolicy)
-        self.treeWidget.setMinimumSize(QtCore.QSize(200, 0))
-        self.treeWidget.setBaseSize(QtCore.QSize(200, 0))
-        self.treeWidget.setObjectName("treeWidget")
-        self.treeWidget.headerItem().setText(0, "1")
+        sizePolicy.setHeightForWidth(self.treeView.sizePolicy().hasHeightForWidth())
+        self.treeView.setSizePolicy(sizePolicy)
+        self.treeView.setMinimumSize(QtCore.QSize(200, 0))
+        self.treeView.setBaseSize(QtCore.QSize(200, 0))
+        self.treeView.setObjectName("treeView")
         self.textEdit = QtWidgets.QTextEdit(self.splitter)
         self.textEdit.setObjectName("textEdit")
         self.gridLayout.addWidget(self.splitter, 1, 0, 1, 1)
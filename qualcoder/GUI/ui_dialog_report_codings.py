@@ -57,6 +57,9 @@ class Ui_Dialog_reportCodings(object):
         self.pushButton_export_csv = QtWidgets.QPushButton(self.groupBox)
         self.pushButton_export_csv.setGeometry(QtCore.QRect(760, 90, 211, 27))
         self.pushButton_export_csv.setObjectName("pushButton_export_csv")
+        self.pushButton_export_csv_rows = QtWidgets.QPushButton(self.groupBox)
+        self.pushButton_export_csv_rows.setGeometry(QtCore.QRect(980, 90, 141, 27))
+        self.pushButton_export_csv_rows.setObjectName("pushButton_export_csv_rows")
         self.verticalLayout.addWidget(self.groupBox)
         self.label_selections = QtWidgets.QLabel(Dialog_reportCodings)
         self.label_selections.setMinimumSize(QtCore.QSize(0, 50))
@@ -75,12 +78,17 @@ class Ui_Dialog_reportCodings(object):
         self.treeWidget = QtWidgets.QTreeWidget(self.splitter)
         self.treeWidget.setObjectName("treeWidget")
         self.treeWidget.headerItem().setText(0, "Code Tree")
-        self.textEdit = QtWidgets.QTextEdit(self.splitter)
+        self.splitter_results = QtWidgets.QSplitter(self.splitter)
+        self.splitter_results.setOrientation(QtCore.Qt.Vertical)
+        self.splitter_results.setObjectName("splitter_results")
+        self.listView_results = QtWidgets.QListView(self.splitter_results)
+        self.listView_results.setUniformItemSizes(True)
+        self.listView_results.setObjectName("listView_results")
+        self.textEdit = QtWidgets.QTextEdit(self.splitter_results)
+        self.textEdit.setReadOnly(True)
         self.textEdit.setObjectName("textEdit")
-        self.tableWidget = QtWidgets.QTableWidget(self.splitter)
-        self.tableWidget.setObjectName("tableWidget")
-        self.tableWidget.setColumnCount(0)
-        self.tableWidget.setRowCount(0)
+        self.tableView = QtWidgets.QTableView(self.splitter)
+        self.tableView.setObjectName("tableView")
         self.gridLayout.addWidget(self.splitter, 0, 0, 1, 1)
         self.verticalLayout.addWidget(self.groupBox_2)
 
@@ -93,7 +101,8 @@ class Ui_Dialog_reportCodings(object):
         Dialog_reportCodings.setTabOrder(self.pushButton_search, self.pushButton_exporthtml)
         Dialog_reportCodings.setTabOrder(self.pushButton_exporthtml, self.pushButton_exporttext)
         Dialog_reportCodings.setTabOrder(self.pushButton_exporttext, self.treeWidget)
-        Dialog_reportCodings.setTabOrder(self.treeWidget, self.textEdit)
+        Dialog_reportCodings.setTabOrder(self.treeWidget, self.listView_results)
+        Dialog_reportCodings.setTabOrder(self.listView_results, self.textEdit)
 
     def retranslateUi(self, Dialog_reportCodings):
         _translate = QtCore.QCoreApplication.translate
@@ -108,6 +117,8 @@ class Ui_Dialog_reportCodings(object):
         self.pushButton_attributeselect.setText(_translate("Dialog_reportCodings", "Attribute selection"))
         self.pushButton_exportodt.setText(_translate("Dialog_reportCodings", "Export ODT file"))
         self.pushButton_export_csv.setText(_translate("Dialog_reportCodings", "Export csv file"))
+        self.pushButton_export_csv_rows.setToolTip(_translate("Dialog_reportCodings", "One row for each coding, with all details"))
+        self.pushButton_export_csv_rows.setText(_translate("Dialog_reportCodings", "Export csv rows"))
         self.label_selections.setText(_translate("Dialog_reportCodings", "Search selections:"))
 
 
@@ -23,6 +23,9 @@ class Ui_Dialog_reportComparisons(object):
         self.pushButton_exporttext = QtWidgets.QPushButton(self.groupBox)
         self.pushButton_exporttext.setGeometry(QtCore.QRect(660, 20, 211, 41))
         self.pushButton_exporttext.setObjectName("pushButton_exporttext")
+        self.pushButton_exportcsv = QtWidgets.QPushButton(self.groupBox)
+        self.pushButton_exportcsv.setGeometry(QtCore.QRect(660, 70, 211, 41))
+        self.pushButton_exportcsv.setObjectName("pushButton_exportcsv")
         self.pushButton_run = QtWidgets.QPushButton(self.groupBox)
         self.pushButton_run.setGeometry(QtCore.QRect(370, 20, 231, 41))
         self.pushButton_run.setObjectName("pushButton_run")
@@ -51,17 +54,25 @@ class Ui_Dialog_reportComparisons(object):
         self.treeWidget.setObjectName("treeWidget")
         self.treeWidget.headerItem().setText(0, "1")
         self.gridLayout.addWidget(self.treeWidget, 0, 0, 1, 1)
+        self.tableWidget = QtWidgets.QTableWidget(self.groupBox_2)
+        self.tableWidget.setMaximumSize(QtCore.QSize(16777215, 200))
+        self.tableWidget.setObjectName("tableWidget")
+        self.tableWidget.setColumnCount(0)
+        self.tableWidget.setRowCount(0)
+        self.gridLayout.addWidget(self.tableWidget, 1, 0, 1, 1)
         self.verticalLayout.addWidget(self.groupBox_2)
 
         self.retranslateUi(Dialog_reportComparisons)
         QtCore.QMetaObject.connectSlotsByName(Dialog_reportComparisons)
         Dialog_reportComparisons.setTabOrder(self.comboBox_coders, self.pushButton_run)
         Dialog_reportComparisons.setTabOrder(self.pushButton_run, self.pushButton_exporttext)
+        Dialog_reportComparisons.setTabOrder(self.pushButton_exporttext, self.pushButton_exportcsv)
 
     def retranslateUi(self, Dialog_reportComparisons):
         _translate = QtCore.QCoreApplication.translate
         Dialog_reportComparisons.setWindowTitle(_translate("Dialog_reportComparisons", "Coder Comparisons"))
         self.pushButton_exporttext.setText(_translate("Dialog_reportComparisons", "Export text file"))
+        self.pushButton_exportcsv.setText(_translate("Dialog_reportComparisons", "Export csv file"))
         self.pushButton_run.setText(_translate("Dialog_reportComparisons", "Run Comparisons"))
         self.label_2.setText(_translate("Dialog_reportComparisons", "Coders:"))
         self.pushButton_clear.setText(_translate("Dialog_reportComparisons", "Clear selection"))
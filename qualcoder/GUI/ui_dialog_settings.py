@@ -39,6 +39,9 @@ class Ui_Dialog_settings(object):
         self.checkBox = QtWidgets.QCheckBox(Dialog_settings)
         self.checkBox.setGeometry(QtCore.QRect(410, 180, 151, 22))
         self.checkBox.setObjectName("checkBox")
+        self.checkBox_fast_pdf = QtWidgets.QCheckBox(Dialog_settings)
+        self.checkBox_fast_pdf.setGeometry(QtCore.QRect(410, 230, 291, 22))
+        self.checkBox_fast_pdf.setObjectName("checkBox_fast_pdf")
         self.label_directory = QtWidgets.QLabel(Dialog_settings)
         self.label_directory.setGeometry(QtCore.QRect(30, 410, 671, 21))
         self.label_directory.setObjectName("label_directory")
@@ -70,9 +73,19 @@ class Ui_Dialog_settings(object):
         self.comboBox_language.setGeometry(QtCore.QRect(200, 110, 241, 33))
         self.comboBox_language.setObjectName("comboBox_language")
         self.checkBox_auto_backup = QtWidgets.QCheckBox(Dialog_settings)
-        self.checkBox_auto_backup.setGeometry(QtCore.QRect(30, 270, 511, 23))
+        self.checkBox_auto_backup.setGeometry(QtCore.QRect(30, 270, 421, 23))
         self.checkBox_auto_backup.setChecked(True)
         self.checkBox_auto_backup.setObjectName("checkBox_auto_backup")
+        self.label_backups_kept = QtWidgets.QLabel(Dialog_settings)
+        self.label_backups_kept.setGeometry(QtCore.QRect(460, 270, 181, 23))
+        self.label_backups_kept.setAlignment(QtCore.Qt.AlignRight|QtCore.Qt.AlignTrailing|QtCore.Qt.AlignVCenter)
+        self.label_backups_kept.setObjectName("label_backups_kept")
+        self.spinBox_backups_kept = QtWidgets.QSpinBox(Dialog_settings)
+        self.spinBox_backups_kept.setGeometry(QtCore.QRect(650, 262, 71, 38))
+        self.spinBox_backups_kept.setMinimum(1)
+        self.spinBox_backups_kept.setMaximum(99)
+        self.spinBox_backups_kept.setProperty("value", 5)
+        self.spinBox_backups_kept.setObjectName("spinBox_backups_kept")
         self.checkBox_backup_AV_files = QtWidgets.QCheckBox(Dialog_settings)
         self.checkBox_backup_AV_files.setGeometry(QtCore.QRect(30, 300, 651, 61))
         self.checkBox_backup_AV_files.setChecked(True)
@@ -88,8 +101,10 @@ class Ui_Dialog_settings(object):
         Dialog_settings.setTabOrder(self.fontComboBox, self.spinBox)
         Dialog_settings.setTabOrder(self.spinBox, self.spinBox_treefontsize)
         Dialog_settings.setTabOrder(self.spinBox_treefontsize, self.checkBox)
-        Dialog_settings.setTabOrder(self.checkBox, self.checkBox_auto_backup)
-        Dialog_settings.setTabOrder(self.checkBox_auto_backup, self.checkBox_backup_AV_files)
+        Dialog_settings.setTabOrder(self.checkBox, self.checkBox_fast_pdf)
+        Dialog_settings.setTabOrder(self.checkBox_fast_pdf, self.checkBox_auto_backup)
+        Dialog_settings.setTabOrder(self.checkBox_auto_backup, self.spinBox_backups_kept)
+        Dialog_settings.setTabOrder(self.spinBox_backups_kept, self.checkBox_backup_AV_files)
         Dialog_settings.setTabOrder(self.checkBox_backup_AV_files, self.pushButton_choose_directory)
 
     def retranslateUi(self, Dialog_settings):
@@ -98,6 +113,8 @@ class Ui_Dialog_settings(object):
         self.label_coderName.setText(_translate("Dialog_settings", "This Coder Name"))
         self.label.setText(_translate("Dialog_settings", "General font and size"))
         self.checkBox.setText(_translate("Dialog_settings", "Show IDs"))
+        self.checkBox_fast_pdf.setToolTip(_translate("Dialog_settings", "<html><head/><body><p>Skip the ordering of text boxes in the layout analysis of pdf pages. Faster for long pdfs, but the text of multi column pages may be out of order.</p></body></html>"))
+        self.checkBox_fast_pdf.setText(_translate("Dialog_settings", "Fast pdf import"))
         self.label_directory.setText(_translate("Dialog_settings", "/"))
         self.pushButton_choose_directory.setText(_translate("Dialog_settings", "Default project directory"))
         self.label_2.setText(_translate("Dialog_settings", "Coders"))
@@ -105,6 +122,8 @@ class Ui_Dialog_settings(object):
         self.label_4.setText(_translate("Dialog_settings", "Language"))
         self.comboBox_language.setToolTip(_translate("Dialog_settings", "<html><head/><body><p>Close and open the software for the change in language to occur.</p></body></html>"))
         self.checkBox_auto_backup.setText(_translate("Dialog_settings", "Backup project folder every time project is opened"))
+        self.label_backups_kept.setText(_translate("Dialog_settings", "Backups kept"))
+        self.spinBox_backups_kept.setToolTip(_translate("Dialog_settings", "<html><head/><body><p>The oldest project backups beyond this number are deleted after each backup.</p></body></html>"))
         self.checkBox_backup_AV_files.setText(_translate("Dialog_settings", "Backup video and audio files. Uncheck to speed up backups.\n"
 "Not recommended unless you have many large files slowing the backup.\n"
 "You must store these files elsewhere."))
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (c) 2019 Colin Curtain
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Author: Colin Curtain (ccbogel)
+https://github.com/ccbogel/QualCoder
+'''
+
+
+
+def merge_intervals(intervals):
+    """ Sorted, disjoint (pos0, pos1) intervals covering the same characters. """
+
+    merged = []
+    for pos0, pos1 in sorted(intervals):
+        if merged and pos0 <= merged[-1][1]:
+            if pos1 > merged[-1][1]:
+                merged[-1][1] = pos1
+        elif pos1 > pos0:
+            merged.append([pos0, pos1])
+    return merged
+
+
+def covered(merged):
+    return sum(pos1 - pos0 for pos0, pos1 in merged)
+
+
+def overlap(merged0, merged1):
+    """ Number of characters in both lists of merged intervals, by sweeping
+    both lists together. """
+
+    i = 0
+    j = 0
+    both = 0
+    while i < len(merged0) and j < len(merged1):
+        start = max(merged0[i][0], merged1[j][0])
+        end = min(merged0[i][1], merged1[j][1])
+        if end > start:
+            both += end - start
+        if merged0[i][1] < merged1[j][1]:
+            i += 1
+        else:
+            j += 1
+    return both
+
+
+def summarise(counts):
+    """ Percentages and Cohen's Kappa from character counts.
+    Kappa compares the observed agreement, characters both coded or both not
+    coded, with the agreement expected from each coder's proportion of coded
+    characters. Kappa is 'zerodiv' when it is undefined. """
+
+    total = dict(counts)
+    characters = total['characters']
+    if characters == 0:
+        total.update({'agreement': 0, 'dual_percent': 0, 'uncoded_percent': 0,
+            'disagreement': 0, 'kappa': "zerodiv"})
+        return total
+    total['agreement'] = round(100 * (total['dual_coded'] + total['uncoded']) / characters, 2)
+    total['dual_percent'] = round(100 * total['dual_coded'] / characters, 2)
+    total['uncoded_percent'] = round(100 * total['uncoded'] / characters, 2)
+    total['disagreement'] = round(100 - total['agreement'], 2)
+    Po = (total['dual_coded'] + total['uncoded']) / characters
+    p0 = total['coded0'] / characters
+    p1 = total['coded1'] / characters
+    Pe = p0 * p1 + (1 - p0) * (1 - p1)
+    total['kappa'] = "zerodiv"
+    if Pe != 1:
+        total['kappa'] = round((Po - Pe) / (1 - Pe), 4)
+    return total
+
+
+def coverage_histogram(coder_intervals, characters):
+    """ Number of characters coded by exactly k coders, for k = 0 to the number
+    of coders, from each coder's merged intervals, by sweeping the interval ends. """
+
+    events = []
+    for merged in coder_intervals:
+        for pos0, pos1 in merged:
+            events.append((pos0, 1))
+            events.append((pos1, -1))
+    events.sort()
+    histogram = [0] * (len(coder_intervals) + 1)
+    depth = 0
+    last = 0
+    for pos, change in events:
+        histogram[depth] += pos - last
+        depth += change
+        last = pos
+    histogram[0] += characters - last
+    return histogram
+
+
+def fleiss_kappa(histogram):
+    """ Fleiss' kappa for coded or not coded characters, rated by every coder.
+    histogram[k] is the number of characters coded by k coders.
+    Returns None when it is undefined, as when no coder coded anything. """
+
+    n = len(histogram) - 1
+    characters = sum(histogram)
+    if n < 2 or characters == 0:
+        return None
+    P = sum(count * (k * (k - 1) + (n - k) * (n - k - 1)) for k, count in enumerate(histogram))
+    P /= characters * n * (n - 1)
+    p = sum(k * count for k, count in enumerate(histogram)) / (characters * n)
+    Pe = p * p + (1 - p) * (1 - p)
+    if Pe == 1:
+        return None
+    return round((P - Pe) / (1 - Pe), 4)
+
+
+def krippendorff_alpha(histogram):
+    """ Krippendorff's alpha, nominal, with each character a unit rated coded or
+    not coded by every coder. histogram[k] is the number of characters coded by
+    k coders. Returns None when it is undefined. """
+
+    n = len(histogram) - 1
+    if n < 2:
+        return None
+    # coincidences of coded with not coded values, pairable values of each kind
+    o_mixed = sum(count * k * (n - k) for k, count in enumerate(histogram)) / (n - 1)
+    n_coded = sum(k * count for k, count in enumerate(histogram))
+    n_uncoded = sum((n - k) * count for k, count in enumerate(histogram))
+    if n_coded == 0 or n_uncoded == 0:
+        return None
+    return round(1 - (n_coded + n_uncoded - 1) * o_mixed / (n_coded * n_uncoded), 4)
+
+
+def histogram_statistics(histogram):
+    """ Agreement statistics from the number of characters coded by 0 to n coders:
+    'agreement', percentage of agreeing coder pairs over all characters;
+    'all_coded' and 'none_coded', percentages of characters;
+    'fleiss' and 'alpha', Fleiss' kappa and Krippendorff's alpha. """
+
+    n = len(histogram) - 1
+    characters = sum(histogram)
+    result = {'histogram': histogram, 'fleiss': fleiss_kappa(histogram),
+        'alpha': krippendorff_alpha(histogram), 'agreement': 0, 'all_coded': 0, 'none_coded': 0}
+    if characters > 0 and n > 1:
+        agreeing_pairs = sum(count * (k * (k - 1) + (n - k) * (n - k - 1)) // 2
+            for k, count in enumerate(histogram))
+        result['agreement'] = round(100 * agreeing_pairs / (characters * n * (n - 1) // 2), 2)
+        result['all_coded'] = round(100 * histogram[n] / characters, 2)
+        result['none_coded'] = round(100 * histogram[0] / characters, 2)
+    return result
+
+
+def coder_agreement(codings, file_lengths, coders, cids):
+    """ Agreement between any number of coders for every code, in one pass over
+    the codings. Each coder's codings for a code in a file are merged into
+    disjoint intervals, so the work depends on the number of codings, not on
+    the length of the text. Characters coded twice by the same coder count once.
+    codings: (cid, fid, owner, pos0, pos1) rows. file_lengths: {fid: number of
+    characters}, the files to compare. coders: the coder names. cids: the codes
+    to report, including uncoded ones.
+    Returns {cid: statistics}, with the histogram_statistics over all files and:
+    'files', {fid: histogram_statistics} for files coded with this code;
+    'cohen', {(coder, coder): Cohen's kappa} for each pair of coders;
+    'mean_cohen', the mean of the pairwise kappas.
+    Undefined statistics are None. """
+
+    intervals = {}  # (cid, fid) -> [intervals of each coder]
+    for cid, fid, owner, pos0, pos1 in codings:
+        if fid not in file_lengths or owner not in coders:
+            continue
+        length = file_lengths[fid]
+        pos0 = max(0, min(pos0, length))
+        pos1 = max(0, min(pos1, length))
+        if (cid, fid) not in intervals:
+            intervals[(cid, fid)] = [[] for coder in coders]
+        intervals[(cid, fid)][coders.index(owner)].append((pos0, pos1))
+
+    n = len(coders)
+    characters = sum(file_lengths.values())
+    pairs = [(a, b) for a in range(n) for b in range(a + 1, n)]
+    totals = {}
+    for cid in cids:
+        totals[cid] = {'histogram': [characters] + [0] * n, 'coded': [0] * n,
+            'pairs': dict((pair, 0) for pair in pairs), 'files': {}}
+    for (cid, fid), coder_intervals in intervals.items():
+        if cid not in totals:
+            continue
+        merged = [merge_intervals(i) for i in coder_intervals]
+        histogram = coverage_histogram(merged, file_lengths[fid])
+        total = totals[cid]
+        total['files'][fid] = histogram_statistics(histogram)
+        # the file's characters were counted as uncoded to start with
+        total['histogram'][0] -= file_lengths[fid]
+        for k, count in enumerate(histogram):
+            total['histogram'][k] += count
+        for i in range(n):
+            total['coded'][i] += covered(merged[i])
+        for a, b in pairs:
+            total['pairs'][(a, b)] += overlap(merged[a], merged[b])
+
+    results = {}
+    for cid, total in totals.items():
+        result = histogram_statistics(total['histogram'])
+        result['files'] = total['files']
+        result['cohen'] = {}
+        result['mean_cohen'] = None
+        for a, b in pairs:
+            both = total['pairs'][(a, b)]
+            coded_a = total['coded'][a]
+            coded_b = total['coded'][b]
+            counts = {'dual_coded': both, 'single_coded': coded_a + coded_b - 2 * both,
+                'uncoded': characters - (coded_a + coded_b - both), 'characters': characters,
+                'coded0': coded_a, 'coded1': coded_b}
+            kappa = summarise(counts)['kappa']
+            result['cohen'][(coders[a], coders[b])] = None if kappa == "zerodiv" else kappa
+        kappas = [k for k in result['cohen'].values() if k is not None]
+        if kappas != []:
+            result['mean_cohen'] = round(sum(kappas) / len(kappas), 4)
+        results[cid] = result
+    return results
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (c) 2019 Colin Curtain
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Author: Colin Curtain (ccbogel)
+https://github.com/ccbogel/QualCoder
+'''
+
+
+import datetime
+import logging
+import re
+import sqlite3
+
+from PyQt5 import QtCore, QtWidgets
+from PyQt5.QtCore import pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+
+def compile_patterns(patterns, regex=False, whole_word=False, ignore_case=False):
+    """ Compile a list of phrases, or of regular expressions, into one regular
+    expression, so each text is scanned once however many patterns there are.
+    Literal phrases are tried longest first, so where phrases start at the same
+    place the longest one is coded.
+    Raises re.error for an invalid regular expression. """
+
+    patterns = [p for p in patterns if p != ""]
+    if not regex:
+        patterns = [re.escape(p) for p in sorted(set(patterns), key=len, reverse=True)]
+    pattern = "|".join("(?:" + p + ")" for p in patterns)
+    if whole_word:
+        pattern = r"\b(?:" + pattern + r")\b"
+    flags = re.IGNORECASE if ignore_case else 0
+    return re.compile(pattern, flags)
+
+
+class DialogAutoCode(QtWidgets.QDialog):
+    """ Get the autocode phrases or regular expressions, one per line, and the
+    matching options. """
+
+    def __init__(self, code_name, parent=None):
+        super(DialogAutoCode, self).__init__(parent)
+        self.pattern = None
+        self.setWindowTitle(_("Automatic coding"))
+        self.resize(400, 300)
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.addWidget(QtWidgets.QLabel(_("Autocode files with the current code for this text:") \
+            + "\n" + code_name + "\n" + _("One phrase per line")))
+        self.textEdit = QtWidgets.QPlainTextEdit(self)
+        layout.addWidget(self.textEdit)
+        self.checkBox_regex = QtWidgets.QCheckBox(_("Regular expressions"), self)
+        self.checkBox_whole_word = QtWidgets.QCheckBox(_("Whole words only"), self)
+        self.checkBox_ignore_case = QtWidgets.QCheckBox(_("Ignore case"), self)
+        self.checkBox_dry_run = QtWidgets.QCheckBox(_("Count matches before coding"), self)
+        for checkBox in (self.checkBox_regex, self.checkBox_whole_word,
+                self.checkBox_ignore_case, self.checkBox_dry_run):
+            layout.addWidget(checkBox)
+        buttonBox = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel)
+        buttonBox.accepted.connect(self.accept)
+        buttonBox.rejected.connect(self.reject)
+        layout.addWidget(buttonBox)
+        self.textEdit.setFocus(True)
+
+    def accept(self):
+        """ Compile the patterns, an invalid regular expression keeps the dialog open. """
+
+        patterns = self.textEdit.toPlainText().split("\n")
+        if self.checkBox_regex.isChecked() is False:
+            patterns = [p.strip() for p in patterns]
+        patterns = [p for p in patterns if p != ""]
+        if patterns == []:
+            return
+        try:
+            self.pattern = compile_patterns(patterns, self.checkBox_regex.isChecked(),
+                self.checkBox_whole_word.isChecked(), self.checkBox_ignore_case.isChecked())
+        except re.error as e:
+            QtWidgets.QMessageBox.warning(None, _("Regular expression"), str(e))
+            return
+        super(DialogAutoCode, self).accept()
+
+    def dry_run(self):
+        return self.checkBox_dry_run.isChecked()
+
+
+class AutoCodeWorker(QtCore.QThread):
+    """ Finds the matches of a compiled pattern in a background thread.
+    The worker reads the files through its own connection to the project
+    database, as sqlite connections can not be shared between threads, and
+    only reads. The matches of each file are sent in batches to the GUI thread,
+    once the whole file is searched, and the GUI thread writes them with
+    insert_coded_rows.
+    In a dry run only the number of matches in each file is sent.
+    Call requestInterruption to cancel, files already searched stay coded and the
+    file being searched is not coded. """
+
+    # list of code_text rows: cid, fid, seltext, pos0, pos1, owner, memo, date
+    found = pyqtSignal(list)
+    # dry run: file id and number of matches
+    counted = pyqtSignal(int, int)
+    # number of files searched so far
+    file_done = pyqtSignal(int)
+
+    batch_size = 5000
+    cancelled = False
+
+    def __init__(self, database, cid, pattern, file_ids, owner, dry_run=False, parent=None):
+        super(AutoCodeWorker, self).__init__(parent)
+        self.database = database
+        self.cid = cid
+        self.pattern = pattern
+        self.file_ids = file_ids
+        self.owner = owner
+        self.dry_run = dry_run
+
+    def run(self):
+        conn = sqlite3.connect(self.database)
+        try:
+            cur = conn.cursor()
+            for done, fid in enumerate(self.file_ids):
+                if self.isInterruptionRequested():
+                    self.cancelled = True
+                    break
+                cur.execute("select fulltext from source where id=? and mediapath is Null", [fid])
+                # fetchall finishes the statement, so no read lock is held while searching
+                result = cur.fetchall()
+                if result != [] and result[0][0] is not None:
+                    self.search(fid, result[0][0])
+                if self.cancelled:
+                    break
+                self.file_done.emit(done + 1)
+        except sqlite3.Error as e:
+            logger.error("Autocode " + str(e))
+        finally:
+            conn.close()
+
+    def search(self, fid, text):
+        """ Send the matches in one file, or nothing if cancelled during the search. """
+
+        date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        count = 0
+        rows = []
+        for m in self.pattern.finditer(text):
+            if self.isInterruptionRequested():
+                self.cancelled = True
+                return
+            # empty matches of a regular expression are not coded
+            if m.end() == m.start():
+                continue
+            count += 1
+            if not self.dry_run:
+                rows.append((self.cid, fid, m.group(), m.start(), m.end(), self.owner, "", date))
+        if self.dry_run:
+            self.counted.emit(fid, count)
+            return
+        for i in range(0, len(rows), self.batch_size):
+            self.found.emit(rows[i:i + self.batch_size])
+
+
+def insert_coded_rows(conn, rows):
+    """ Insert code_text rows in one transaction. Segments already coded with
+    this code by this coder are skipped by the unique constraint.
+    Returns the number of rows inserted. """
+
+    cur = conn.cursor()
+    before = conn.total_changes
+    try:
+        cur.executemany("insert or ignore into code_text (cid,fid,seltext,pos0,pos1,owner,memo,date) \
+            values(?,?,?,?,?,?,?,?)", rows)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return conn.total_changes - before
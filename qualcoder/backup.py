@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (c) 2019 Colin Curtain
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Author: Colin Curtain (ccbogel)
+https://github.com/ccbogel/QualCoder
+'''
+
+
+
+import datetime
+import logging
+import os
+import shutil
+import sqlite3
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import pyqtSignal
+
+from .file_import import READ_SIZE, reflink
+
+logger = logging.getLogger(__name__)
+
+# project database files, the database is copied with the sqlite backup API
+DATABASE_FILES = ('data.qda', 'data.qda-journal', 'data.qda-wal', 'data.qda-shm')
+AV_SUFFIXES = ('.mp3', '.wav', '.mkv', '.mp4', '.mov', '.ogg', '.wmv')
+
+
+class BackupRestarted(Exception):
+    """ Raised from the sqlite backup progress to stop a backup that keeps restarting. """
+
+
+class BackupWorker(QtCore.QThread):
+    """ Saves a datetime stamped backup of a project folder, next to the project folder,
+    while the project is in use.
+    data.qda is copied with the sqlite online backup API, a few pages at a time, so
+    the backup is consistent and the GUI can write to the project between steps.
+    Each write starts the copy again, so after backup_restarts restarts the database
+    is copied in one step, which holds a read lock until it is copied.
+    Files unchanged since an earlier backup, by size and modification time, are hard
+    links to the file of the latest such backup, so they take no disk space and are
+    not read.
+    Other files are reflinks where the file system supports it, else copies.
+    The backup is written to a .part folder and renamed when complete. Then the oldest
+    backups beyond the backups_kept setting are removed, which only frees the files
+    that no other backup links to.
+    Call requestInterruption to cancel, the partial backup is removed. """
+
+    # backup path, or "" if cancelled or failed, and error message
+    saved = pyqtSignal(str, str)
+
+    # database pages copied in each step of the sqlite backup, and seconds between steps
+    backup_pages = 1024
+    backup_sleep = 0.05
+    backup_restarts = 10
+    cancelled = False
+
+    def __init__(self, project_path, av_files=True, backups_kept=5, parent=None):
+        super(BackupWorker, self).__init__(parent)
+        self.project_path = project_path
+        self.av_files = av_files
+        self.backups_kept = backups_kept
+        folder, name = os.path.split(project_path[0:-4])
+        self.folder = folder
+        self.prefix = name + "_BACKUP_"
+
+    def run(self):
+        nowdate = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        backup = os.path.join(self.folder, self.prefix + nowdate + ".qda")
+        partial = backup + ".part"
+        try:
+            previous = self.backups()[::-1]
+            for name in os.listdir(self.folder):
+                if name.startswith(self.prefix) and name.endswith(".qda.part"):
+                    shutil.rmtree(os.path.join(self.folder, name))
+            os.mkdir(partial)
+            self.backup_database(partial)
+            self.backup_files(previous, partial)
+            self.cancelled = self.isInterruptionRequested()
+            if not self.cancelled:
+                os.rename(partial, backup)
+        except (OSError, sqlite3.Error) as e:
+            logger.error("Backup " + str(e))
+            shutil.rmtree(partial, ignore_errors=True)
+            self.saved.emit("", str(e))
+            return
+        if self.cancelled:
+            shutil.rmtree(partial, ignore_errors=True)
+            self.saved.emit("", "")
+            return
+        for old in self.backups()[:-self.backups_kept]:
+            shutil.rmtree(old, ignore_errors=True)
+        self.saved.emit(backup, "")
+
+    def backups(self):
+        """ Paths of the complete backups of the project, oldest first. """
+
+        backups = []
+        for name in os.listdir(self.folder):
+            if name.startswith(self.prefix) and name.endswith(".qda"):
+                backups.append(os.path.join(self.folder, name))
+        return sorted(backups)
+
+    def backup_database(self, partial):
+        """ Copy data.qda with the sqlite online backup API, through separate connections. """
+
+        source = sqlite3.connect(self.project_path + "/data.qda")
+        destination = sqlite3.connect(partial + "/data.qda")
+        self.remaining = None
+        self.restarts = 0
+        try:
+            try:
+                source.backup(destination, pages=self.backup_pages, progress=self.backup_progress,
+                    sleep=self.backup_sleep)
+            except BackupRestarted:
+                logger.debug("Backup restarted " + str(self.restarts) + " times, copying in one step")
+                source.backup(destination)
+        finally:
+            destination.close()
+            source.close()
+
+    def backup_progress(self, status, remaining, total):
+        """ Called after each step of the database backup. More pages remaining than
+        after the last step means the copy started again. """
+
+        if self.remaining is not None and remaining > self.remaining:
+            self.restarts += 1
+            if self.restarts >= self.backup_restarts:
+                raise BackupRestarted()
+        self.remaining = remaining
+
+    def backup_files(self, previous, partial):
+        """ Link or copy all project files other than the database into the backup.
+        previous is the list of earlier backups, newest first. """
+
+        for root, dirs, files in os.walk(self.project_path):
+            folder = os.path.relpath(root, self.project_path)
+            if folder != ".":
+                os.makedirs(os.path.join(partial, folder), exist_ok=True)
+            for name in files:
+                if self.isInterruptionRequested():
+                    return
+                if folder == "." and name in DATABASE_FILES:
+                    continue
+                if not self.av_files and name.lower().endswith(AV_SUFFIXES):
+                    continue
+                source = os.path.join(root, name)
+                destination = os.path.join(partial, folder, name)
+                if not any(self.link(source, os.path.join(last, folder, name), destination) for last in previous):
+                    self.copy(source, destination)
+
+    def link(self, source, last, destination):
+        """ Hard link to the file of an earlier backup if the project file is unchanged.
+        Returns False if it changed or the file system has no hard links. """
+
+        try:
+            stat = os.stat(source)
+            last_stat = os.stat(last)
+            if stat.st_size != last_stat.st_size or stat.st_mtime_ns != last_stat.st_mtime_ns:
+                return False
+            os.link(last, destination)
+            return True
+        except OSError:
+            return False
+
+    def copy(self, source, destination):
+        """ Reflink or copy a file, with its modification time, so the next backup can
+        link to it. A copy stops part way if the backup is cancelled. """
+
+        if not reflink(source, destination):
+            with open(source, 'rb') as src, open(destination, 'wb') as dst:
+                while not self.isInterruptionRequested():
+                    data = src.read(READ_SIZE)
+                    if not data:
+                        break
+                    dst.write(data)
+        shutil.copystat(source, destination)
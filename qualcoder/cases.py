@@ -79,15 +79,16 @@ class DialogCases(QtWidgets.QDialog):
     caseTextViewed = []
     attributes = []
 
-    def __init__(self, settings, parent_textEdit):
+    def __init__(self, app, parent_textEdit):
 
         sys.excepthook = exception_handler
-        self.settings = settings
+        self.app = app
+        self.settings = app.settings
         self.parent_textEdit = parent_textEdit
         QtWidgets.QDialog.__init__(self)
         self.ui = Ui_Dialog_cases()
         self.ui.setupUi(self)
-        newfont = QtGui.QFont(settings['font'], settings['fontsize'], QtGui.QFont.Normal)
+        newfont = QtGui.QFont(self.settings['font'], self.settings['fontsize'], QtGui.QFont.Normal)
         self.setFont(newfont)
         self.load_cases_and_attributes()
         self.ui.pushButton_add.clicked.connect(self.add_case)
@@ -623,23 +624,13 @@ class DialogCases(QtWidgets.QDialog):
                 path = self.settings['path'] + c['mediapath']
                 url = QtCore.QUrl(path)
                 document = self.ui.textBrowser.document()
-                image = QtGui.QImageReader(path).read()
+                # scaled to max 400 wide or high
+                image = self.app.get_thumbnails().image(c['mediapath'], None, 400)
                 document.addResource(QtGui.QTextDocument.ImageResource, url, QtCore.QVariant(image))
                 cursor = self.ui.textBrowser.textCursor()
                 image_format = QtGui.QTextImageFormat()
-                scaler = 1.0
-                scaler_w =1.0
-                scaler_h = 1.0
-                if image.width() > 400:
-                    scaler_w = 400 / image.width()
-                if image.height() > 400:
-                    scaler_h = 400 / image.height()
-                if scaler_w < scaler_h:
-                    scaler = scaler_w
-                else:
-                    scaler = scaler_h
-                image_format.setWidth(image.width() * scaler)
-                image_format.setHeight(image.height() * scaler)
+                image_format.setWidth(image.width())
+                image_format.setHeight(image.height())
                 image_format.setName(url.toString())
                 cursor.insertImage(image_format)
                 self.ui.textBrowser.append("<br />")
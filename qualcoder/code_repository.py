@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (c) 2019 Colin Curtain
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Author: Colin Curtain (ccbogel)
+https://github.com/ccbogel/QualCoder
+'''
+
+import datetime
+import logging
+import sqlite3
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+
+def item_key(item):
+    """ 'catid:n' for a category dictionary, 'cid:n' for a code dictionary. """
+
+    if 'supercatid' in item:
+        return 'catid:' + str(item['catid'])
+    return 'cid:' + str(item['cid'])
+
+
+class CodeRepository(QtCore.QObject):
+    """ Categories and codes of the open project, loaded once and held by App.
+    Changes to code_cat and code_name are made through the methods below, which
+    update the database and the cached dictionaries, then emit a signal so that open
+    dialogs update their views instead of querying the database again.
+    The categories and codes lists are only changed in place, so references held by
+    dialogs and models stay valid. """
+
+    item_added = pyqtSignal(str)
+    item_changed = pyqtSignal(str)
+    item_moved = pyqtSignal(str, object)
+    item_removed = pyqtSignal(str)
+    data_reset = pyqtSignal()
+
+    def __init__(self, conn, parent=None):
+        super(CodeRepository, self).__init__(parent)
+        self.conn = conn
+        self.categories = []
+        self.codes = []
+        self._items = {}
+        self.load()
+
+    def load(self):
+        """ Load categories and codes from the database. Called from init, and to
+        pick up changes made outside the repository, such as a project import. """
+
+        cur = self.conn.cursor()
+        cur.execute("select name, catid, owner, date, memo, supercatid from code_cat order by name")
+        self.categories[:] = [{'name': row[0], 'catid': row[1], 'owner': row[2],
+            'date': row[3], 'memo': row[4], 'supercatid': row[5]} for row in cur.fetchall()]
+        cur.execute("select name, memo, owner, date, cid, catid, color from code_name")
+        self.codes[:] = [{'name': row[0], 'memo': row[1], 'owner': row[2], 'date': row[3],
+            'cid': row[4], 'catid': row[5], 'color': row[6]} for row in cur.fetchall()]
+        self._items = {}
+        for item in self.categories + self.codes:
+            self._items[item_key(item)] = item
+        self.data_reset.emit()
+
+    def item(self, key):
+        """ The category or code dictionary for a 'catid:n' or 'cid:n' key, or None. """
+
+        return self._items.get(key)
+
+    def code(self, cid):
+        return self._items.get('cid:' + str(cid))
+
+    def category(self, catid):
+        return self._items.get('catid:' + str(catid))
+
+    def parent_key(self, key):
+        """ Key of the category holding this item, None for top level items.
+        Items pointing to a category that does not exist are top level. """
+
+        item = self._items[key]
+        catid = item['supercatid'] if key[0:3] == 'cat' else item['catid']
+        if catid is None or 'catid:' + str(catid) not in self._items:
+            return None
+        return 'catid:' + str(catid)
+
+    def is_ancestor(self, key, other_key):
+        """ True if key is other_key or one of the categories above it. """
+
+        seen = set()
+        while other_key is not None and other_key not in seen:
+            if other_key == key:
+                return True
+            seen.add(other_key)
+            other_key = self.parent_key(other_key)
+        return False
+
+    def add_code(self, name, owner, color, catid=None, memo=""):
+        """ Add a new code. Names are checked for duplicates by the caller.
+        returns: the code dictionary """
+
+        item = {'name': name, 'memo': memo, 'owner': owner,
+        'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'catid': catid, 'color': color}
+        cur = self.conn.cursor()
+        cur.execute("insert into code_name (name,memo,owner,date,catid,color) values(?,?,?,?,?,?)"
+            , (item['name'], item['memo'], item['owner'], item['date'], item['catid'], item['color']))
+        self.conn.commit()
+        item['cid'] = cur.lastrowid
+        self.codes.append(item)
+        self._items[item_key(item)] = item
+        self.item_added.emit(item_key(item))
+        return item
+
+    def add_category(self, name, owner, supercatid=None, memo=""):
+        """ Add a new category. Names are checked for duplicates by the caller.
+        returns: the category dictionary """
+
+        item = {'name': name, 'memo': memo, 'owner': owner,
+        'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'supercatid': supercatid}
+        cur = self.conn.cursor()
+        cur.execute("insert into code_cat (name, memo, owner, date, supercatid) values(?,?,?,?,?)"
+            , (item['name'], item['memo'], item['owner'], item['date'], item['supercatid']))
+        self.conn.commit()
+        item['catid'] = cur.lastrowid
+        self.categories.append(item)
+        self._items[item_key(item)] = item
+        self.item_added.emit(item_key(item))
+        return item
+
+    def _update(self, key, field, value):
+        item = self._items[key]
+        cur = self.conn.cursor()
+        if key[0:3] == 'cat':
+            cur.execute("update code_cat set " + field + "=? where catid=?", (value, item['catid']))
+        else:
+            cur.execute("update code_name set " + field + "=? where cid=?", (value, item['cid']))
+        self.conn.commit()
+        item[field] = value
+
+    def rename(self, key, name):
+        self._update(key, 'name', name)
+        self.item_changed.emit(key)
+
+    def set_memo(self, key, memo):
+        self._update(key, 'memo', memo)
+        self.item_changed.emit(key)
+
+    def set_color(self, key, color):
+        self._update(key, 'color', color)
+        self.item_changed.emit(key)
+
+    def move(self, key, parent_key):
+        """ Move a category or code into the category parent_key, None for top level.
+        returns: False if the parent is a code or the move would put a category inside itself """
+
+        if parent_key is not None and (parent_key[0:3] == 'cid' or self.is_ancestor(key, parent_key)):
+            return False
+        catid = None if parent_key is None else self._items[parent_key]['catid']
+        self._update(key, 'supercatid' if key[0:3] == 'cat' else 'catid', catid)
+        self.item_moved.emit(key, parent_key)
+        return True
+
+    def merge_codes(self, key, into_key):
+        """ Move all text, image and A/V codings of a code to another code and delete it.
+        The database is rolled back if a coding already exists for the other code.
+        raises: sqlite3.Error """
+
+        old_cid = self._items[key]['cid']
+        new_cid = self._items[into_key]['cid']
+        cur = self.conn.cursor()
+        try:
+            for table in ("code_text", "code_image", "code_av"):
+                cur.execute("update " + table + " set cid=? where cid=?", [new_cid, old_cid])
+            cur.execute("delete from code_name where cid=?", [old_cid, ])
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        self._remove(key)
+
+    def delete(self, key):
+        """ Delete a code and its text, image and A/V codings. Or delete a category,
+        its codes and sub-categories are moved to the top level. """
+
+        item = self._items[key]
+        cur = self.conn.cursor()
+        if key[0:3] == 'cid':
+            cur.execute("delete from code_name where cid=?", [item['cid'], ])
+            for table in ("code_text", "code_image", "code_av"):
+                cur.execute("delete from " + table + " where cid=?", [item['cid'], ])
+            self.conn.commit()
+            self._remove(key)
+            return
+        children = [k for k in self._items if k != key and self.parent_key(k) == key]
+        cur.execute("update code_name set catid=null where catid=?", [item['catid'], ])
+        cur.execute("update code_cat set supercatid=null where supercatid=?", [item['catid'], ])
+        cur.execute("delete from code_cat where catid=?", [item['catid'], ])
+        self.conn.commit()
+        for child_key in children:
+            child = self._items[child_key]
+            child['supercatid' if child_key[0:3] == 'cat' else 'catid'] = None
+            self.item_moved.emit(child_key, None)
+        self._remove(key)
+
+    def _remove(self, key):
+        item = self._items.pop(key)
+        if key[0:3] == 'cat':
+            self.categories.remove(item)
+        else:
+            self.codes.remove(item)
+        self.item_removed.emit(key)
@@ -25,28 +25,29 @@ Author: Colin Curtain (ccbogel)
 https://github.com/ccbogel/QualCoder
 '''
 
-from copy import deepcopy
+from bisect import bisect_left, bisect_right
 import datetime
 import logging
 import os
 from random import randint
 import re
+import sqlite3
 import sys
 import traceback
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.Qt import QHelpEvent
 from PyQt5.QtCore import Qt  # for context menu
-from PyQt5.QtGui import QBrush
 
 from .add_item_name import DialogAddItemName, DialogLinkTo
-from .color_selector import DialogColorSelect
+from .auto_code import AutoCodeWorker, DialogAutoCode, insert_coded_rows
+from .code_tree import CodeTreeMixin
 from .color_selector import colors
-from .confirm_delete import DialogConfirmDelete
 from .GUI.ui_dialog_codes import Ui_Dialog_codes
 from .memo import DialogMemo
 from .select_file import DialogSelectFile
 from .helpers import CodedMediaMixin
+from .intervals import IntervalIndex, flatten_runs
 from .qtmodels import DictListModel, ListObjectModel
 
 path = os.path.abspath(os.path.dirname(__file__))
@@ -63,7 +64,7 @@ def exception_handler(exception_type, value, tb_obj):
     QtWidgets.QMessageBox.critical(None, _('Uncaught Exception'), text)
 
 
-class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
+class DialogCodeText(CodedMediaMixin, CodeTreeMixin, QtWidgets.QWidget):
     ''' Code management. Add, delete codes. Mark and unmark text.
     Add memos and colors to codes.
     Trialled using setHtml for documents, but on marking text Html formattin was replaced, also
@@ -79,10 +80,15 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
     filenames = []
     filename = {}  # contains filename and file id returned from SelectFile
     sourceText = None
+    # files longer than this, in characters, are highlighted as they are scrolled into view
+    large_text = 200000
     code_text = []
     annotations = []
     search_indices = []
     search_index = 0
+    auto_code_worker = None
+    auto_code_inserted = 0
+    auto_code_counts = {}
     eventFilter = None
 
     def __init__(self, app, parent_textEdit):
@@ -96,6 +102,8 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         self.categories = []
         self.filenames = []
         self.codeslistmodel = DictListModel({})
+        self.code_text_index = IntervalIndex()
+        self.formats = {}
         self.annotations = []
         self.search_indices = []
         self.search_index = 0
@@ -116,8 +124,6 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         self.ui.setupUi(self)
         newfont = QtGui.QFont(self.settings['font'], self.settings['fontsize'], QtGui.QFont.Normal)
         self.setFont(newfont)
-        treefont = QtGui.QFont(self.settings['font'], self.settings['treefontsize'], QtGui.QFont.Normal)
-        self.ui.treeWidget.setFont(treefont)
         self.ui.label_coder.setText("Coder: " + self.settings['codername'])
         self.ui.label_file.setText("File: Not selected")
         self.ui.textEdit.setPlainText("")
@@ -125,7 +131,9 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         self.ui.textEdit.setToolTip("")
         self.ui.textEdit.setMouseTracking(True)
         self.ui.textEdit.setReadOnly(True)
+        self.highlighter = CodingHighlighter(self.ui.textEdit, self.formatted_runs)
         self.eventFilterTT = ToolTip_EventFilter()
+        self.eventFilterTT.set_index(self.code_text_index, self.app.code_repository)
         self.ui.textEdit.installEventFilter(self.eventFilterTT)
         self.ui.textEdit.setContextMenuPolicy(Qt.CustomContextMenu)
         self.ui.textEdit.customContextMenuRequested.connect(self.textEdit_menu)
@@ -136,27 +144,21 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         self.ui.lineEdit_search.textEdited.connect(self.search_for_text)
         self.ui.pushButton_search_results.setEnabled(False)
         self.ui.pushButton_search_results.pressed.connect(self.move_to_next_search_text)
-        self.ui.treeWidget.setDragEnabled(True)
-        self.ui.treeWidget.setAcceptDrops(True)
-        self.ui.treeWidget.setDragDropMode(QtWidgets.QAbstractItemView.InternalMove)
-        self.ui.treeWidget.viewport().installEventFilter(self)
-        self.ui.treeWidget.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.ui.treeWidget.customContextMenuRequested.connect(self.tree_menu)
-        self.ui.treeWidget.itemClicked.connect(self.fill_code_label)
+        self.setup_code_tree()
+        self.ui.treeView.clicked.connect(self.fill_code_label)
         self.ui.listWidgetLinks.setContextMenuPolicy(Qt.CustomContextMenu)
         self.ui.listWidgetLinks.customContextMenuRequested.connect(self.linkstree_menu)
         self.ui.splitter.setSizes([150, 400])
-        self.fill_tree()
         self.fill_links()
 
     def fill_code_label(self):
         """ Fill code label with currently selected item's code name. """
 
-        current = self.ui.treeWidget.currentItem()
-        if current.text(1)[0:3] == 'cat':
+        code_ = self.selected_code()
+        if code_ is None:
             self.ui.label_code.setText(_("NO CODE SELECTED"))
             return
-        self.ui.label_code.setText("Code: " + current.text(0))
+        self.ui.label_code.setText("Code: " + code_['name'])
 
     def fill_links(self):
         for link in self.linktypes:
@@ -166,112 +168,21 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         w = QtWidgets.QListWidgetItem(linkname,parent=self.ui.listWidgetLinks)
         self.ui.listWidgetLinks.addItem(w)
 
-    def fill_tree(self):
-        """ Fill tree widget, top level items are main categories and unlinked codes. """
-
-        cats = deepcopy(self.categories)
-        codes = deepcopy(self.codes)
-        self.ui.treeWidget.clear()
-        self.ui.treeWidget.setColumnCount(3)
-        self.ui.treeWidget.setHeaderLabels([_("Name"), _("Id"), _("Memo")])
-        self.ui.treeWidget.setColumnHidden(1, True)
-        self.ui.treeWidget.header().setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
-        self.ui.treeWidget.header().setStretchLastSection(False)
-        # add top level categories
-        remove_list = []
-        for c in cats:
-            if c['supercatid'] is None:
-                memo = ""
-                if c['memo'] != "":
-                    memo = _("Memo")
-                top_item = QtWidgets.QTreeWidgetItem([c['name'], 'catid:' + str(c['catid']), memo])
-                top_item.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-                top_item.setToolTip(0, c['owner'] + "\n" + c['date'])
-                self.ui.treeWidget.addTopLevelItem(top_item)
-                remove_list.append(c)
-        for item in remove_list:
-            #try:
-            cats.remove(item)
-            #except Exception as e:
-            #    logger.debug(e, item)
-
-        ''' add child categories. look at each unmatched category, iterate through tree
-         to add as child, then remove matched categories from the list '''
-        count = 0
-        while len(cats) > 0 or count < 10000:
-            remove_list = []
-            #logger.debug("Cats: " + str(cats))
-            for c in cats:
-                it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
-                item = it.value()
-                while item:  # while there is an item in the list
-                    if item.text(1) == 'catid:' + str(c['supercatid']):
-                        memo = ""
-                        if c['memo'] != "":
-                            memo = _("Memo")
-                        child = QtWidgets.QTreeWidgetItem([c['name'], 'catid:' + str(c['catid']), memo])
-                        child.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-                        child.setToolTip(0, c['owner'] + "\n" + c['date'])
-                        item.addChild(child)
-                        remove_list.append(c)
-                    it += 1
-                    item = it.value()
-            for item in remove_list:
-                cats.remove(item)
-            count += 1
-
-        # add unlinked codes as top level items
-        remove_items = []
-        for c in codes:
-            if c['catid'] is None:
-                memo = ""
-                if c['memo'] != "":
-                    memo = _("Memo")
-                top_item = QtWidgets.QTreeWidgetItem([c['name'], 'cid:' + str(c['cid']), memo])
-                top_item.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-                top_item.setToolTip(0, c['owner'] + "\n" + c['date'])
-                top_item.setBackground(0, QBrush(QtGui.QColor(c['color']), Qt.SolidPattern))
-                top_item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled | Qt.ItemIsDragEnabled)
-                self.ui.treeWidget.addTopLevelItem(top_item)
-                remove_items.append(c)
-        for item in remove_items:
-            codes.remove(item)
-
-        # add codes as children
-        for c in codes:
-            it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
-            item = it.value()
-            while item:
-                if item.text(1) == 'catid:' + str(c['catid']):
-                    memo = ""
-                    if c['memo'] != "":
-                        memo = _("Memo")
-                    child = QtWidgets.QTreeWidgetItem([c['name'], 'cid:' + str(c['cid']), memo])
-                    child.setBackground(0, QBrush(QtGui.QColor(c['color']), Qt.SolidPattern))
-                    child.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-                    child.setToolTip(0, c['owner'] + "\n" + c['date'])
-                    child.setFlags(Qt.ItemIsSelectable | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled | Qt.ItemIsDragEnabled)
-                    item.addChild(child)
-                    c['catid'] = -1  # make unmatchable
-                it += 1
-                item = it.value()
-        self.ui.treeWidget.expandAll()
-
     def get_codes_categories(self):
-        """ Called from init, delete category/code. """
+        """ Called from init. """
 
-        self.categories = []
-        cur = self.app.conn.cursor()
-        cur.execute("select name, catid, owner, date, memo, supercatid from code_cat")
-        result = cur.fetchall()
-        for row in result:
-            self.categories.append({'name': row[0], 'catid': row[1], 'owner': row[2],
-            'date': row[3], 'memo': row[4], 'supercatid': row[5]})
-
-        self.codes = self.app.get_code_names()
+        CodeTreeMixin.get_codes_categories(self)
         self.linktypes = self.app.get_linktypes()
         self.codeslistmodel.reset_data({x['cid']:x for x in self.codes})
-         
+
+    def codes_changed(self):
+        """ Called after a code is renamed, recoloured, merged or deleted.
+        Reload the codings of the loaded file, as merges and deletes change their cids. """
+
+        self.coded_in_text()
+        if self.filename != {}:
+            self.get_coded_text()
+        self.highlight()
 
     def search_for_text(self):
         """ On text changed in lineEdit_search, find indices of matching text.
@@ -333,13 +244,11 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         cb.setText(selectedText, mode=cb.Clipboard)
 
     def tree_menu(self, position):
-        """ Context menu for treewidget items.
+        """ Context menu for treeView items.
         Add, rename, memo, move or delete code or category. Change code color. """
 
         menu = QtWidgets.QMenu()
-        selected = self.ui.treeWidget.currentItem()
-        #logger.debug("Selected parent: " + selected.parent())
-        #index = self.ui.treeWidget.currentIndex()
+        selected = self.selected_key()
         ActionItemAddCode = menu.addAction(_("Add a new code"))
         ActionItemAddCategory = menu.addAction(_("Add a new category"))
         ActionItemRename = menu.addAction(_("Rename"))
@@ -348,11 +257,11 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         ActionItemChangeColor = None
         ActionShowCodedMedia = None
         ActionLinkTo = None
-        if selected is not None and selected.text(1)[0:3] == 'cid':
+        if selected is not None and selected[0:3] == 'cid':
             ActionItemChangeColor = menu.addAction(_("Change code color"))
             ActionShowCodedMedia = menu.addAction(_("Show coded text and media"))
             ActionLinkTo = menu.addAction(_("Link to"))
-        action = menu.exec_(self.ui.treeWidget.mapToGlobal(position))
+        action = menu.exec_(self.ui.treeView.mapToGlobal(position))
         if action is not None :
             if selected is not None and action == ActionItemChangeColor:
                 self.change_code_color(selected)
@@ -367,23 +276,17 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
             elif selected is not None and action == ActionItemDelete:
                 self.delete_category_or_code(selected)
             elif selected is not None and action == ActionShowCodedMedia :
-                found = None
-                tofind = int(selected.text(1)[4:])
-                for code in self.codes:
-                    if code['cid'] == tofind:
-                        found = code
-                        break
-                if found:
-                    self.coded_media(found)
+                self.coded_media(self.code_model.item(selected))
             elif selected is not None and action == ActionLinkTo:
-                self.link_to(selected)
+                self.link_to(self.code_model.item(selected))
 
     def link_to(self,item):
         """ Use add_item dialog to get new code text. Add_code_name dialog checks for
         duplicate code name. A random color is selected for the code.
         New code is added to data and database. """
 
-        myname = item.text(0)
+        myname = item['name']
+        self.codeslistmodel.reset_data({x['cid']:x for x in self.codes})
         linksmodel = ListObjectModel(self.linktypes,key='name')
         ui = DialogLinkTo(self.codeslistmodel.makeProxy('name'),linksmodel,myname)
         ui.exec_()
@@ -408,15 +311,13 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         Add, rename, memo, move or delete code or category. Change code color. """
 
         menu = QtWidgets.QMenu()
-        selected = self.ui.treeWidget.currentItem()
-        #logger.debug("Selected parent: " + selected.parent())
-        #index = self.ui.treeWidget.currentIndex()
+        selected = self.ui.listWidgetLinks.currentItem()
         ActionItemAddLink = menu.addAction(_("Add a new link"))
         ActionItemRename = menu.addAction(_("Rename"))
         ActionItemEditMemo = menu.addAction(_("View or edit memo"))
         ActionItemDelete = menu.addAction(_("Delete"))
         ActionItemChangeColor = menu.addAction(_("Change code color"))
-        action = menu.exec_(self.ui.treeWidget.mapToGlobal(position))
+        action = menu.exec_(self.ui.listWidgetLinks.mapToGlobal(position))
         if action is not None :
             if selected is not None and action == ActionItemChangeColor:
                 print('not yet')
@@ -434,100 +335,17 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
                 # self.delete_category_or_code(selected)
 
     def eventFilter(self, object, event):
-        """ Using this event filter to identfiy treeWidgetItem drop events.
+        """ Using this event filter to identfiy treeView drop events.
         http://doc.qt.io/qt-5/qevent.html#Type-enum
         QEvent::Drop 63 A drag and drop operation is completed (QDropEvent).
         https://stackoverflow.com/questions/28994494/why-does-qtreeview-not-fire-a-drop-or-move-event-during-drag-and-drop
         """
 
-        if object is self.ui.treeWidget.viewport():
+        if object is self.ui.treeView.viewport():
             if event.type() == QtCore.QEvent.Drop:
-                item = self.ui.treeWidget.currentItem()
-                parent = self.ui.treeWidget.itemAt(event.pos())
-                self.item_moved_update_data(item, parent)
-                self.get_codes_categories()
-                self.fill_tree()
+                return self.code_tree_drop(event)
         return False
 
-    def item_moved_update_data(self, item, parent):
-        """ Called from drop event in treeWidget view port.
-        identify code or category to move.
-        Also merge codes if one code is dropped on another code. """
-
-        # find the category in the list
-        if item.text(1)[0:3] == 'cat':
-            found = -1
-            for i in range(0, len(self.categories)):
-                if self.categories[i]['catid'] == int(item.text(1)[6:]):
-                    found = i
-            if found == -1:
-                return
-            if parent is None:
-                self.categories[found]['supercatid'] = None
-            else:
-                if parent.text(1).split(':')[0] == 'cid':
-                    # parent is code (leaf) cannot add child
-                    return
-                supercatid = int(parent.text(1).split(':')[1])
-                if supercatid == self.categories[found]['catid']:
-                    # something went wrong
-                    return
-                self.categories[found]['supercatid'] = supercatid
-            cur = self.app.conn.cursor()
-            cur.execute("update code_cat set supercatid=? where catid=?",
-            [self.categories[found]['supercatid'], self.categories[found]['catid']])
-            self.app.conn.commit()
-
-        # find the code in the list
-        if item.text(1)[0:3] == 'cid':
-            found = -1
-            for i in range(0, len(self.codes)):
-                if self.codes[i]['cid'] == int(item.text(1)[4:]):
-                    found = i
-            if found == -1:
-                return
-            if parent is None:
-                self.codes[found]['catid'] = None
-            else:
-                if parent.text(1).split(':')[0] == 'cid':
-                    # parent is code (leaf) cannot add child, but can merge
-                    self.merge_codes(self.codes[found], parent)
-                    return
-                catid = int(parent.text(1).split(':')[1])
-                self.codes[found]['catid'] = catid
-
-            cur = self.app.conn.cursor()
-            cur.execute("update code_name set catid=? where cid=?",
-            [self.codes[found]['catid'], self.codes[found]['cid']])
-            self.app.conn.commit()
-
-    def merge_codes(self, item, parent):
-        """ Merge code or category with another code or category.
-        Called by item_moved_update_data when a code is moved onto another code. """
-
-        msg = _("Merge code: ") + item['name'] + _(" into code: ") + parent.text(0)
-        reply = QtWidgets.QMessageBox.question(None, _('Merge codes'),
-        msg, QtWidgets.QMessageBox.Yes, QtWidgets.QMessageBox.No)
-        if reply == QtWidgets.QMessageBox.No:
-            return
-        cur = self.app.conn.cursor()
-        old_cid = item['cid']
-        new_cid = int(parent.text(1).split(':')[1])
-        try:
-            cur.execute("update code_text set cid=? where cid=?", [new_cid, old_cid])
-            self.app.conn.commit()
-        except Exception as e:
-            e = str(e)
-            msg = _("Cannot merge codes, unmark overlapping text first. ") + e
-            QtWidgets.QInformationDialog(None, _("Cannot merge"), msg)
-            return
-        cur.execute("delete from code_name where cid=?", [old_cid, ])
-        self.app.conn.commit()
-        msg = msg.replace("\n", " ")
-        self.parent_textEdit.append(msg)
-        # update filter for tooltip
-        self.eventFilterTT.setCodes(self.code_text, self.codes)
-
     def add_link(self):
         """ Use add_item dialog to get new code text. Add_code_name dialog checks for
         duplicate code name. A random color is selected for the code.
@@ -560,266 +378,12 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         self.add_to_linktypes_list(item['name'])
         self.parent_textEdit.append(_("New link: ") + item['name'])
 
-    def add_code(self):
-        """ Use add_item dialog to get new code text. Add_code_name dialog checks for
-        duplicate code name. A random color is selected for the code.
-        New code is added to data and database. """
-
-        ui = DialogAddItemName(self.codes, _("Add new code"))
-        ui.exec_()
-        newCodeText = ui.get_new_name()
-        if newCodeText is None:
-            return
-        code_color = colors[randint(0, len(colors) - 1)]
-        item = {'name': newCodeText, 'memo': "", 'owner': self.settings['codername'],
-        'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),'catid': None,
-        'color': code_color}
-        cur = self.app.conn.cursor()
-        cur.execute("insert into code_name (name,memo,owner,date,catid,color) values(?,?,?,?,?,?)"
-            , (item['name'], item['memo'], item['owner'], item['date'], item['catid'], item['color']))
-        self.app.conn.commit()
-        cur.execute("select last_insert_rowid()")
-        cid = cur.fetchone()[0]
-        item['cid'] = cid
-        self.codes.append(item)
-        top_item = QtWidgets.QTreeWidgetItem([item['name'], 'cid:' + str(item['cid']), ""])
-        top_item.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-        color = item['color']
-        top_item.setBackground(0, QBrush(QtGui.QColor(color), Qt.SolidPattern))
-        self.ui.treeWidget.addTopLevelItem(top_item)
-        self.ui.treeWidget.setCurrentItem(top_item)
-        self.parent_textEdit.append(_("New code: ") + item['name'])
-
-    def add_category(self):
-        """ When button pressed, add a new category.
-        Note: the addItem dialog does the checking for duplicate category names
-        Add the new category as a top level item. """
-
-        ui = DialogAddItemName(self.categories, _("Category"))
-        ui.exec_()
-        newCatText = ui.get_new_name()
-        if newCatText is None:
-            return
-        item = {'name': newCatText, 'cid': None, 'memo': "",
-        'owner': self.settings['codername'],
-        'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-        cur = self.app.conn.cursor()
-        cur.execute("insert into code_cat (name, memo, owner, date, supercatid) values(?,?,?,?,?)"
-            , (item['name'], item['memo'], item['owner'], item['date'], None))
-        self.app.conn.commit()
-        cur.execute("select last_insert_rowid()")
-        catid = cur.fetchone()[0]
-        item['catid'] = catid
-        self.categories.append(item)
-        # update widget
-        top_item = QtWidgets.QTreeWidgetItem([item['name'], 'catid:' + str(item['catid']), ""])
-        top_item.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-        self.ui.treeWidget.addTopLevelItem(top_item)
-        self.parent_textEdit.append(_("New category: ") + item['name'])
-
-    def delete_category_or_code(self, selected):
-        """ Determine if selected item is a code or category before deletion. """
-
-        if selected.text(1)[0:3] == 'cat':
-            self.delete_category(selected)
-            return  # avoid error as selected is now None
-        if selected.text(1)[0:3] == 'cid':
-            self.delete_code(selected)
-
-    def delete_code(self, selected):
-        """ Find code, remove from database, refresh and code data and fill treeWidget.
-        """
-
-        # find the code in the list, check to delete
-        found = -1
-        for i in range(0, len(self.codes)):
-            if self.codes[i]['cid'] == int(selected.text(1)[4:]):
-                found = i
-        if found == -1:
-            return
-        code_ = self.codes[found]
-        ui = DialogConfirmDelete(_("Code: ") + selected.text(0))
-        ok = ui.exec_()
-        if not ok:
-            return
-        cur = self.app.conn.cursor()
-        cur.execute("delete from code_name where cid=?", [code_['cid'], ])
-        cur.execute("delete from code_text where cid=?", [code_['cid'], ])
-        self.app.conn.commit()
-        selected = None
-        self.get_codes_categories()
-        self.fill_tree()
-        self.parent_textEdit.append(_("Code deleted: ") + code_['name'] + "\n")
-        # update filter for tooltip
-        self.eventFilterTT.setCodes(self.code_text, self.codes)
-
-    def delete_category(self, selected):
-        """ Find category, remove from database, refresh categories and code data
-        and fill treeWidget. """
-
-        found = -1
-        for i in range(0, len(self.categories)):
-            if self.categories[i]['catid'] == int(selected.text(1)[6:]):
-                found = i
-        if found == -1:
-            return
-        category = self.categories[found]
-        ui = DialogConfirmDelete(_("Category: ") + selected.text(0))
-        ok = ui.exec_()
-        if not ok:
-            return
-        cur = self.app.conn.cursor()
-        cur.execute("update code_name set catid=null where catid=?", [category['catid'], ])
-        cur.execute("update code_cat set supercatid=null where catid = ?", [category['catid'], ])
-        cur.execute("delete from code_cat where catid = ?", [category['catid'], ])
-        self.app.conn.commit()
-        selected = None
-        self.get_codes_categories()
-        self.fill_tree()
-        self.parent_textEdit.append(_("Category deleted: ") + category['name'])
-
-    def add_edit_memo(self, selected):
-        """ View and edit a memo for a category or code. """
-
-        if selected.text(1)[0:3] == 'cid':
-            # find the code in the list
-            found = -1
-            for i in range(0, len(self.codes)):
-                if self.codes[i]['cid'] == int(selected.text(1)[4:]):
-                    found = i
-            if found == -1:
-                return
-            ui = DialogMemo(self.settings, _("Memo for Code: ") + self.codes[found]['name'], self.codes[found]['memo'])
-            ui.exec_()
-            memo = ui.memo
-            if memo != self.codes[found]['memo']:
-                self.codes[found]['memo'] = memo
-                cur = self.app.conn.cursor()
-                cur.execute("update code_name set memo=? where cid=?", (memo, self.codes[found]['cid']))
-                self.app.conn.commit()
-            if memo == "":
-                selected.setData(2, QtCore.Qt.DisplayRole, "")
-            else:
-                selected.setData(2, QtCore.Qt.DisplayRole, _("Memo"))
-                self.parent_textEdit.append(_("Memo for code: ") + self.codes[found]['name'])
-
-        if selected.text(1)[0:3] == 'cat':
-            # find the category in the list
-            found = -1
-            for i in range(0, len(self.categories)):
-                if self.categories[i]['catid'] == int(selected.text(1)[6:]):
-                    found = i
-            if found == -1:
-                return
-            ui = DialogMemo(self.settings, _("Memo for Category: ") + self.categories[found]['name'], self.categories[found]['memo'])
-            ui.exec_()
-            memo = ui.memo
-            if memo != self.categories[found]['memo']:
-                self.categories[found]['memo'] = memo
-                cur = self.app.conn.cursor()
-                cur.execute("update code_cat set memo=? where catid=?", (memo, self.categories[found]['catid']))
-                self.app.conn.commit()
-            if memo == "":
-                selected.setData(2, QtCore.Qt.DisplayRole, "")
-            else:
-                selected.setData(2, QtCore.Qt.DisplayRole, _("Memo"))
-                self.parent_textEdit.append(_("Memo for category: ") + self.categories[found]['name'])
-
-    def rename_category_or_code(self, selected):
-        """ Rename a code or category.
-        Check that the code or category name is not currently in use. """
-
-        if selected.text(1)[0:3] == 'cid':
-            new_name, ok = QtWidgets.QInputDialog.getText(self, _("Rename code"),
-                _("New code name:"), QtWidgets.QLineEdit.Normal, selected.text(0))
-            if not ok or new_name == '':
-                return
-            # check that no other code has this text
-            for c in self.codes:
-                if c['name'] == new_name:
-                    QtWidgets.QMessageBox.warning(None, _("Name in use"),
-                    new_name + _(" is already in use, choose another name."), QtWidgets.QMessageBox.Ok)
-                    return
-            # find the code in the list
-            found = -1
-            for i in range(0, len(self.codes)):
-                if self.codes[i]['cid'] == int(selected.text(1)[4:]):
-                    found = i
-            if found == -1:
-                return
-            # update codes list and database
-            cur = self.app.conn.cursor()
-            cur.execute("update code_name set name=? where cid=?", (new_name, self.codes[found]['cid']))
-            self.app.conn.commit()
-            old_name = self.codes[found]['name']
-            self.codes[found]['name'] = new_name
-            selected.setData(0, QtCore.Qt.DisplayRole, new_name)
-            self.parent_textEdit.append(_("Code renamed from: ") + old_name + _(" to: ") + new_name)
-            # update filter for tooltip
-            self.eventFilterTT.setCodes(self.code_text, self.codes)
-            return
-
-        if selected.text(1)[0:3] == 'cat':
-            new_name, ok = QtWidgets.QInputDialog.getText(self, _("Rename category"), _("New category name:"),
-            QtWidgets.QLineEdit.Normal, selected.text(0))
-            if not ok or new_name == '':
-                return
-            # check that no other category has this text
-            for c in self.categories:
-                if c['name'] == new_name:
-                    msg = _("This code name is already in use.")
-                    QtWidgets.QMessageBox.warning(None, _("Duplicate code name"), msg, QtWidgets.QMessageBox.Ok)
-                    return
-            # find the category in the list
-            found = -1
-            for i in range(0, len(self.categories)):
-                if self.categories[i]['catid'] == int(selected.text(1)[6:]):
-                    found = i
-            if found == -1:
-                return
-            # update category list and database
-            cur = self.app.conn.cursor()
-            cur.execute("update code_cat set name=? where catid=?",
-            (new_name, self.categories[found]['catid']))
-            self.app.conn.commit()
-            old_name = self.categories[found]['name']
-            self.categories[found]['name'] = new_name
-            selected.setData(0, QtCore.Qt.DisplayRole, new_name)
-            self.parent_textEdit.append(_("Category renamed from: ") + old_name + _(" to: ") + new_name)
-
-    def change_code_color(self, selected):
-        """ Change the colour of the currently selected code. """
-
-        cid = int(selected.text(1)[4:])
-        found = -1
-        for i in range(0, len(self.codes)):
-            if self.codes[i]['cid'] == cid:
-                found = i
-        if found == -1:
-            return
-        ui = DialogColorSelect(self.codes[found]['color'])
-        ok = ui.exec_()
-        if not ok:
-            return
-        new_color = ui.get_color()
-        if new_color is None:
-            return
-        selected.setBackground(0, QBrush(QtGui.QColor(new_color), Qt.SolidPattern))
-        #update codes list, database and color markings
-        self.codes[found]['color'] = new_color
-        cur = self.app.conn.cursor()
-        cur.execute("update code_name set color=? where cid=?",
-        (self.codes[found]['color'], self.codes[found]['cid']))
-        self.app.conn.commit()
-        self.highlight()
-
     def view_file(self):
         """ When view file button is pressed a dialog of filenames is presented to the user.
         The selected file is then displayed for coding. """
 
         ui = DialogSelectFile(self.filenames, "Select file to view", "single")
         ok = ui.exec_()
-        sql_values = []
         if ok:
             # filename is dictionary with id and name
             self.filename = ui.get_selected()
@@ -827,82 +391,107 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
             cur.execute("select name, id, fulltext, memo, owner, date from source where id=?",
                 [self.filename['id']])
             file_result = cur.fetchone()
-            sql_values.append(int(file_result[1]))
             self.sourceText = file_result[2]
             self.ui.label_file.setText("File " + str(file_result[1]) + " : " + file_result[0])
-
-            # get code text for this file and for this coder, or all coders
-            self.code_text = []
-            codingsql = "select cid, fid, seltext, pos0, pos1, owner, date, memo from code_text"
-            codingsql += " where fid=? "
-            if not self.ui.checkBox_show_coders.isChecked():
-                codingsql += " and owner=? "
-                sql_values.append(self.settings['codername'])
-            cur.execute(codingsql, sql_values)
-            code_results = cur.fetchall()
-            for row in code_results:
-                self.code_text.append({'cid': row[0], 'fid': row[1], 'seltext': row[2],
-                'pos0': row[3], 'pos1':row[4], 'owner': row[5], 'date': row[6], 'memo': row[7]})
+            self.get_coded_text()
+            self.highlighter.enable(len(self.sourceText) > self.large_text)
             self.ui.textEdit.setPlainText(self.sourceText)
-            # update filter for tooltip
-            self.eventFilterTT.setCodes(self.code_text, self.codes)
             # clear search indices and lineEdit
             self.ui.lineEdit_search.setText("")
             self.search_indices = []
             self.search_index = 0
             # redo formatting
-            self.unlight()
             self.highlight()
         else:
             self.ui.textEdit.clear()
 
-    def unlight(self):
-        """ Remove all text highlighting from current file. """
+    def get_coded_text(self):
+        """ Get code text for the current file and for this coder, or all coders. """
+
+        sql_values = [int(self.filename['id'])]
+        self.code_text = []
+        codingsql = "select cid, fid, seltext, pos0, pos1, owner, date, memo from code_text"
+        codingsql += " where fid=? "
+        if not self.ui.checkBox_show_coders.isChecked():
+            codingsql += " and owner=? "
+            sql_values.append(self.settings['codername'])
+        cur = self.app.conn.cursor()
+        cur.execute(codingsql, sql_values)
+        code_results = cur.fetchall()
+        for row in code_results:
+            self.code_text.append({'cid': row[0], 'fid': row[1], 'seltext': row[2],
+            'pos0': row[3], 'pos1':row[4], 'owner': row[5], 'date': row[6], 'memo': row[7]})
+        self.code_text_index.build(self.code_text)
+
+    def highlight(self, pos0=None, pos1=None):
+        """ Apply text highlighting to current file, or only from pos0 to pos1
+        after a mark, unmark or annotation.
+        Long files are coloured by the CodingHighlighter as their blocks become
+        visible, shorter files are formatted directly. """
 
         if self.sourceText is None:
             return
+        if self.highlighter.enabled:
+            self.highlighter.refresh(pos0, pos1)
+            return
+        end = self.ui.textEdit.document().characterCount() - 1
+        pos0 = 0 if pos0 is None else max(0, pos0)
+        pos1 = end if pos1 is None else min(end, pos1)
         cursor = self.ui.textEdit.textCursor()
-        cursor.setPosition(0, QtGui.QTextCursor.MoveAnchor)
-        cursor.setPosition(len(self.sourceText) - 1, QtGui.QTextCursor.KeepAnchor)
-        cursor.setCharFormat(QtGui.QTextCharFormat())
+        cursor.beginEditBlock()
+        for start, stop, fmt in self.formatted_runs(pos0, pos1):
+            cursor.setPosition(start, QtGui.QTextCursor.MoveAnchor)
+            cursor.setPosition(stop, QtGui.QTextCursor.KeepAnchor)
+            cursor.setCharFormat(fmt)
+        cursor.endEditBlock()
 
-    def highlight(self):
-        """ Apply text highlighting to current file.
+    def formatted_runs(self, pos0, pos1):
+        """ Runs of (start, end, QTextCharFormat) covering pos0 up to pos1.
         If no colour has been assigned to a code, those coded text fragments are coloured gray.
+        Overlapping codings are flattened into runs first, so each character is
+        formatted once. Uncoded runs have the plain format.
         Each code text item contains: fid, date, pos0, pos1, seltext, cid, status, memo,
         name, owner. """
 
-        if self.sourceText is None:
-            return
-        fmt = QtGui.QTextCharFormat()
-        cursor = self.ui.textEdit.textCursor()
-
-        # add coding highlights
-        for item in self.code_text:
-            cursor.setPosition(int(item['pos0']), QtGui.QTextCursor.MoveAnchor)
-            cursor.setPosition(int(item['pos1']), QtGui.QTextCursor.KeepAnchor)
-            color = "#F8E0E0"  # default light red
-            for fcode in self.codes:
-                if fcode['cid'] == item['cid']:
-                    color = fcode['color']
-            fmt.setBackground(QtGui.QBrush(QtGui.QColor(color)))
-            # highlight codes with memos - these are italicised
-            if item['memo'] is not None and item['memo'] != "":
-                fmt.setFontItalic(True)
-            else:
-                fmt.setFontItalic(False)
-                fmt.setFontWeight(QtGui.QFont.Normal)
-            cursor.setCharFormat(fmt)
-
-        # add annotation marks - these are in bold
-        for note in self.annotations:
-            if len(self.filename.keys()) > 0:  # will be zero if using autocode and no file is loaded
-                if note['fid'] == self.filename['id']:
-                    cursor.setPosition(int(note['pos0']), QtGui.QTextCursor.MoveAnchor)
-                    cursor.setPosition(int(note['pos1']), QtGui.QTextCursor.KeepAnchor)
-                    formatB = QtGui.QTextCharFormat()
-                    formatB.setFontWeight(QtGui.QFont.Bold)
-                    cursor.mergeCharFormat(formatB)
+        if pos0 >= pos1:
+            return []
+        # annotation marks - these are in bold
+        notes = []
+        if len(self.filename.keys()) > 0:  # will be zero if using autocode and no file is loaded
+            notes = [(int(n['pos0']), int(n['pos1'])) for n in self.annotations
+                if n['fid'] == self.filename['id'] and n['pos0'] < pos1 and n['pos1'] > pos0]
+        cuts = sorted(set(p for note in notes for p in note))
+        runs = []
+        codings = self.code_text_index.overlapping(pos0, pos1)
+        for start, stop, item in flatten_runs(codings, pos0, pos1):
+            color = None
+            italic = False
+            if item is not None:
+                color = "#F8E0E0"  # default light red
+                code = self.app.code_repository.code(item['cid'])
+                if code is not None:
+                    color = code['color']
+                # highlight codes with memos - these are italicised
+                italic = item['memo'] is not None and item['memo'] != ""
+            inner = cuts[bisect_right(cuts, start):bisect_left(cuts, stop)]
+            for a, b in zip([start] + inner, inner + [stop]):
+                bold = any(n0 <= a and n1 >= b for n0, n1 in notes)
+                runs.append((a, b, self.char_format(color, italic, bold)))
+        return runs
+
+    def char_format(self, color, italic, bold):
+        """ Shared QTextCharFormat for a coding colour, or None for uncoded text. """
+
+        key = (color, italic, bold)
+        if key not in self.formats:
+            fmt = QtGui.QTextCharFormat()
+            if color is not None:
+                fmt.setBackground(QtGui.QBrush(QtGui.QColor(color)))
+                fmt.setFontItalic(italic)
+            if bold:
+                fmt.setFontWeight(QtGui.QFont.Bold)
+            self.formats[key] = fmt
+        return self.formats[key]
 
     def mark(self):
         """ Mark selected text in file with currently selected code.
@@ -912,13 +501,11 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         if self.filename == {}:
             QtWidgets.QMessageBox.warning(None, _('Warning'), _("No file was selected"), QtWidgets.QMessageBox.Ok)
             return
-        item = self.ui.treeWidget.currentItem()
+        item = self.selected_code()
         if item is None:
             QtWidgets.QMessageBox.warning(None, _('Warning'), _("No code was selected"), QtWidgets.QMessageBox.Ok)
             return
-        if item.text(1).split(':')[0] == 'catid':  # must be a code
-            return
-        cid = int(item.text(1).split(':')[1])
+        cid = item['cid']
         selectedText = self.ui.textEdit.textCursor().selectedText()
         pos0 = self.ui.textEdit.textCursor().selectionStart()
         pos1 = self.ui.textEdit.textCursor().selectionEnd()
@@ -926,8 +513,6 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         coded = {'cid': cid, 'fid': int(self.filename['id']), 'seltext': selectedText,
         'pos0': pos0, 'pos1': pos1, 'owner': self.settings['codername'], 'memo': "",
         'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-        self.code_text.append(coded)
-        self.highlight()
         cur = self.app.conn.cursor()
 
         # check for an existing duplicated marking first
@@ -938,6 +523,9 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
             QtWidgets.QMessageBox.warning(None, _("Already Coded"),
             _("This segment has already been coded with this code by ") + coded['owner'], QtWidgets.QMessageBox.Ok)
             return
+        self.code_text.append(coded)
+        self.code_text_index.add(coded)
+        self.highlight(pos0, pos1)
 
         #TODO should not get sqlite3.IntegrityError:
         #TODO UNIQUE constraint failed: code_text.cid, code_text.fid, code_text.pos0, code_text.pos1
@@ -949,8 +537,7 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
             self.app.conn.commit()
         except Exception as e:
             logger.debug(str(e))
-        # update filter for tooltip
-        self.eventFilterTT.setCodes(self.code_text, self.codes)
+        self.coded_in_text()
 
     def coded_in_text(self):
         """ When coded text is clicked on, the code name is displayed in the label above
@@ -959,12 +546,10 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         labelText = _("Coded: ")
         self.ui.label_coded.setText(labelText)
         pos = self.ui.textEdit.textCursor().position()
-        for item in self.code_text:
-            if item['pos0'] <= pos and item['pos1'] >= pos:
-                # logger.debug("Code name for selected pos0:" + str(item['pos0'])+" pos1:"+str(item['pos1'])
-                for code in self.codes:
-                    if code['cid'] == item['cid']:
-                        labelText = _("Coded: ") + code['name']
+        for item in self.code_text_index.at(pos):
+            code = self.app.code_repository.code(item['cid'])
+            if code is not None:
+                labelText = _("Coded: ") + code['name']
         self.ui.label_coded.setText(labelText)
 
     def unmark(self, location):
@@ -973,8 +558,8 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         if self.filename == {}:
             return
         unmarked = None
-        for item in self.code_text:
-            if location >= item['pos0'] and location <= item['pos1'] and item['owner'] == self.settings['codername']:
+        for item in self.code_text_index.at(location):
+            if item['owner'] == self.settings['codername']:
                 unmarked = item
         if unmarked is None:
             return
@@ -986,11 +571,11 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         self.app.conn.commit()
         if unmarked in self.code_text:
             self.code_text.remove(unmarked)
+        self.code_text_index.remove(unmarked)
 
-        # update filter for tooltip and update code colours
-        self.eventFilterTT.setCodes(self.code_text, self.codes)
-        self.unlight()
-        self.highlight()
+        # update coded label and code colours
+        self.coded_in_text()
+        self.highlight(unmarked['pos0'], unmarked['pos1'])
 
     def annotate(self, location):
         """ Add view, or remove an annotation for selected text.
@@ -1034,7 +619,6 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
             anid = cur.fetchone()[0]
             item['anid'] = anid
             self.annotations.append(item)
-            self.highlight()
             self.parent_textEdit.append(_("Annotation added at position: ") \
                 + str(item['pos0']) + "-" + str(item['pos1']) + _(" for: ") + self.filename['name'])
         # if blank delete the annotation
@@ -1047,33 +631,24 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
                     self.annotations.remove(note)
             self.parent_textEdit.append(_("Annotation removed from position ") \
                 + str(item['pos0']) + _(" for: ") + self.filename['name'])
-        self.unlight()
-        self.highlight()
+        self.highlight(item['pos0'], item['pos1'])
 
     def auto_code(self):
         """ Autocode text in one file or all files with currently selected code.
         """
 
-        item = self.ui.treeWidget.currentItem()
+        item = self.selected_code()
         if item is None:
             QtWidgets.QMessageBox.warning(None, _('Warning'), _("No code was selected"),
                 QtWidgets.QMessageBox.Ok)
             return
-        if item.text(1)[0:3] == 'cat':
-            return
-        cid = int(item.text(1).split(':')[1])
-        # Input dialog too narrow, so code below
-        dialog = QtWidgets.QInputDialog(None)
-        dialog.setWindowTitle(_("Automatic coding"))
-        dialog.setInputMode(QtWidgets.QInputDialog.TextInput)
-        dialog.setLabelText(_("Autocode files with the current code for this text:") +"\n" + item.text(0))
-        dialog.resize(200, 20)
-        ok = dialog.exec_()
+        ui = DialogAutoCode(item['name'])
+        ok = ui.exec_()
         if not ok:
             return
-        findText = str(dialog.textValue())
-        if findText == "" or findText is None:
-            return
+        findText = ", ".join(ui.textEdit.toPlainText().strip().split("\n"))
+        pattern = ui.pattern
+        dry_run = ui.dry_run()
         ui = DialogSelectFile(self.filenames, _("Select file to view"), "many")
         ok = ui.exec_()
         if not ok:
@@ -1081,36 +656,159 @@ class DialogCodeText(CodedMediaMixin,QtWidgets.QWidget):
         files = ui.get_selected()
         if len(files) == 0:
             return
+        self.run_auto_code(item['cid'], pattern, files, findText, dry_run)
+
+    def run_auto_code(self, cid, pattern, files, findText, dry_run):
+        """ Search the files in an AutoCodeWorker, with a progress dialog to cancel it.
+        A dry run counts the matches in each file, to confirm before coding. """
+
+        progress = QtWidgets.QProgressDialog(_("Automatic coding"), _("Cancel"), 0, len(files), self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(500)
+        self.auto_code_worker = AutoCodeWorker(self.settings['path'] + "/data.qda", cid,
+            pattern, [int(f['id']) for f in files], self.settings['codername'], dry_run)
+        self.auto_code_worker.found.connect(self.insert_auto_coded)
+        self.auto_code_worker.counted.connect(self.count_auto_coded)
+        self.auto_code_worker.file_done.connect(progress.setValue)
+        progress.canceled.connect(self.auto_code_worker.requestInterruption)
+        self.auto_code_worker.finished.connect(lambda: self.auto_code_finished(progress,
+            cid, pattern, files, findText, dry_run))
+        self.auto_code_inserted = 0
+        self.auto_code_counts = {}
+        self.auto_code_worker.start()
+
+    def insert_auto_coded(self, rows):
+        """ Called from the autocode worker with a batch of matches. """
+
+        try:
+            self.auto_code_inserted += insert_coded_rows(self.app.conn, rows)
+        except sqlite3.Error as e:
+            logger.error("Autocode " + str(e))
+            self.auto_code_worker.requestInterruption()
+
+    def count_auto_coded(self, fid, count):
+        """ Called from the autocode worker in a dry run. """
+
+        self.auto_code_counts[fid] = count
+
+    def auto_code_finished(self, progress, cid, pattern, files, findText, dry_run):
+        """ After a dry run, show the matches in each file and ask to code them.
+        After coding refresh the open file once. """
+
+        progress.close()
+        cancelled = self.auto_code_worker.cancelled
+        self.auto_code_worker = None
+        if dry_run:
+            if cancelled:
+                return
+            total = sum(self.auto_code_counts.values())
+            details = ""
+            for f in files:
+                details += f['name'] + ": " + str(self.auto_code_counts.get(int(f['id']), 0)) + "\n"
+            msg = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Question, _("Automatic coding"),
+                str(total) + _(" matches in ") + str(len(files)) + _(" files. Code them?"),
+                QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No)
+            msg.setDetailedText(details)
+            if total > 0 and msg.exec_() == QtWidgets.QMessageBox.Yes:
+                self.run_auto_code(cid, pattern, files, findText, False)
+            return
         filenames = ""
         for f in files:
             filenames += f['name'] + " "
-            cur = self.app.conn.cursor()
-            cur.execute("select name, id, fulltext, memo, owner, date from source where id=? and mediapath is Null",
-                [f['id']])
-            currentfile = cur.fetchone()
-            text = currentfile[2]
-            textStarts = [match.start() for match in re.finditer(re.escape(findText), text)]
-            # add new items to database
-            for startPos in textStarts:
-                item = {'cid': cid, 'fid': int(f['id']), 'seltext': str(findText),
-                'pos0': startPos, 'pos1': startPos + len(findText),
-                'owner': self.settings['codername'], 'memo': "",
-                'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-                cur = self.app.conn.cursor()
-                cur.execute("insert into code_text (cid,fid,seltext,pos0,pos1,\
-                    owner,memo,date) values(?,?,?,?,?,?,?,?)"
-                    , (item['cid'], item['fid'], item['seltext'], item['pos0'],
-                    item['pos1'], item['owner'], item['memo'], item['date']))
-                self.app.conn.commit()
-
-                # if this is the currently open file update the code text list and GUI
-                if f['id'] == self.filename['id']:
-                    self.code_text.append(item)
+        msg = _("Automatic coding in files: ") + filenames + _(". with text: ") + findText
+        msg += ". " + str(self.auto_code_inserted) + _(" segments coded")
+        if cancelled:
+            msg += ". " + _("Cancelled")
+        self.parent_textEdit.append(msg)
+        if self.filename.get('id') in [f['id'] for f in files]:
+            self.get_coded_text()
             self.highlight()
-            self.parent_textEdit.append(_("Automatic coding in files: ") + filenames \
-                + _(". with text: ") + findText)
-        # update filter for tooltip
-        self.eventFilterTT.setCodes(self.code_text, self.codes)
+            self.coded_in_text()
+
+
+class CodingHighlighter(QtGui.QSyntaxHighlighter):
+    """ Colours codings in long files, one text block at a time, and only once a
+    block has been scrolled into view. Unlike formatting the document directly,
+    load time does not depend on the number of codings.
+    runs(pos0, pos1) returns (start, end, QTextCharFormat) runs for the range. """
+
+    enabled = False
+
+    def __init__(self, textEdit, runs):
+        super(CodingHighlighter, self).__init__(textEdit.document())
+        self.textEdit = textEdit
+        self.runs = runs
+        self.shown = set()  # block numbers coloured so far
+        # scrolling and relayouts are collected into one update
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.show_visible)
+        textEdit.verticalScrollBar().valueChanged.connect(self.schedule_show)
+        textEdit.verticalScrollBar().rangeChanged.connect(self.schedule_show)
+
+    def enable(self, enabled):
+        """ Called before a file is loaded. """
+
+        self.enabled = enabled
+        self.shown = set()
+
+    def highlightBlock(self, text):
+        if not self.enabled or self.currentBlock().blockNumber() not in self.shown:
+            return
+        start = self.currentBlock().position()
+        for pos0, pos1, fmt in self.runs(start, start + len(text)):
+            self.setFormat(pos0 - start, pos1 - pos0, fmt)
+
+    def schedule_show(self, *args):
+        if self.enabled:
+            self.timer.start(0)
+
+    def show_visible(self):
+        """ Colour the visible blocks that have not been coloured yet. """
+
+        if not self.enabled:
+            return
+        top = self.textEdit.verticalScrollBar().value()
+        block = self.document().findBlockByNumber(self.block_at(top))
+        last = self.block_at(top + self.textEdit.viewport().height())
+        while block.isValid() and block.blockNumber() <= last:
+            if block.blockNumber() not in self.shown:
+                self.shown.add(block.blockNumber())
+                self.rehighlightBlock(block)
+            block = block.next()
+
+    def block_at(self, y):
+        """ Number of the block at this height in the document, by bisecting the
+        block positions. Blocks not laid out yet have an empty rectangle and are
+        treated as lying below. """
+
+        document = self.document()
+        layout = document.documentLayout()
+        lo = 0
+        hi = document.blockCount() - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            rect = layout.blockBoundingRect(document.findBlockByNumber(mid))
+            if not rect.isEmpty() and rect.top() <= y:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def refresh(self, pos0=None, pos1=None):
+        """ Recolour the shown blocks from pos0 to pos1, or all shown blocks.
+        Blocks that are not shown have no formats to update. """
+
+        document = self.document()
+        first = 0
+        last = document.blockCount() - 1
+        if pos0 is not None and pos1 is not None:
+            first = document.findBlock(pos0).blockNumber()
+            last = document.findBlock(pos1).blockNumber()
+        for number in sorted(self.shown):
+            if first <= number <= last:
+                self.rehighlightBlock(document.findBlockByNumber(number))
+        self.schedule_show()
 
 
 class ToolTip_EventFilter(QtCore.QObject):
@@ -1119,16 +817,15 @@ class ToolTip_EventFilter(QtCore.QObject):
     If over a coded section the codename is displayed in the tooltip.
     """
 
-    codes = None
-    code_text = None
+    code_text_index = None
+    code_repository = None
+
+    def set_index(self, code_text_index, code_repository):
+        """ Coded segments are looked up in the IntervalIndex, code names in the
+        code repository, so neither needs refreshing when a code is renamed. """
 
-    def setCodes(self, code_text, codes):
-        self.code_text = code_text
-        self.codes = codes
-        for item in self.code_text:
-            for c in self.codes:
-                if item['cid'] == c['cid']:
-                    item['name'] = c['name']
+        self.code_text_index = code_text_index
+        self.code_repository = code_repository
 
     def eventFilter(self, receiver, event):
         #QtGui.QToolTip.showText(QtGui.QCursor.pos(), tip)
@@ -1138,24 +835,18 @@ class ToolTip_EventFilter(QtCore.QObject):
             cursor = receiver.cursorForPosition(helpEvent.pos())
             pos = cursor.position()
             receiver.setToolTip("")
-            displayText = ""
             # occasional None type error
-            if self.code_text is None:
+            if self.code_text_index is None:
                 #Call Base Class Method to Continue Normal Event Processing
                 return super(ToolTip_EventFilter, self).eventFilter(receiver, event)
-            for item in self.code_text:
-                if item['pos0'] <= pos and item['pos1'] >= pos:
-                    if displayText == "":
-                        displayText = item['name']
-                    else:  # can have multiple codes on same selected area
-                        try:
-                            displayText += "\n" + item['name']
-                        except Exception as e:
-                            msg = "Codes ToolTipEventFilter " + str(e) + ". Possible key error: "
-                            msg += str(item) + "\n" + self.code_text
-                            logger.error(msg)
-            if displayText != "":
-                receiver.setToolTip(displayText)
+            # can have multiple codes on same selected area
+            names = []
+            for item in self.code_text_index.at(pos):
+                code = self.code_repository.code(item['cid'])
+                if code is not None:
+                    names.append(code['name'])
+            if names != []:
+                receiver.setToolTip("\n".join(names))
 
         #Call Base Class Method to Continue Normal Event Processing
         return super(ToolTip_EventFilter, self).eventFilter(receiver, event)
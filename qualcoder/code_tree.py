@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (c) 2019 Colin Curtain
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Author: Colin Curtain (ccbogel)
+https://github.com/ccbogel/QualCoder
+'''
+
+import logging
+from random import randint
+import sqlite3
+
+from PyQt5 import QtGui, QtWidgets
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QBrush
+
+from .add_item_name import DialogAddItemName
+from .color_selector import DialogColorSelect
+from .color_selector import colors
+from .confirm_delete import DialogConfirmDelete
+from .memo import DialogMemo
+
+logger = logging.getLogger(__name__)
+
+CODE_FLAGS = Qt.ItemIsSelectable | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled
+CODE_DRAG_FLAGS = CODE_FLAGS | Qt.ItemIsDragEnabled
+
+
+def memo_columns(item, id_prefix):
+    """ Default tree columns: name, id and a Memo marker if the item has a memo. """
+
+    memo = ""
+    if item['memo'] is not None and item['memo'] != "":
+        memo = _("Memo")
+    id_key = 'catid' if id_prefix == 'catid' else 'cid'
+    return [item['name'], id_prefix + ':' + str(item[id_key]), memo]
+
+
+def category_children(categories, codes):
+    """ Map each category id to its sub-categories and codes, in one pass over each list.
+    Top level categories and unlinked codes are under the None key. Categories or codes
+    pointing to a category that does not exist are treated as top level.
+    returns: sub_categories dictionary, category_codes dictionary """
+
+    catids = set(c['catid'] for c in categories)
+    sub_categories = {None: []}
+    category_codes = {None: []}
+    for cat in categories:
+        supercatid = cat['supercatid'] if cat['supercatid'] in catids else None
+        sub_categories.setdefault(supercatid, []).append(cat)
+    for code in codes:
+        catid = code['catid'] if code['catid'] in catids else None
+        category_codes.setdefault(catid, []).append(code)
+    return sub_categories, category_codes
+
+
+def fill_code_tree(tree, categories, codes, category_columns=None, code_columns=None,
+        code_flags=CODE_FLAGS, tooltips=False):
+    """ Add categories and codes to a tree widget, top level items are main categories
+    and unlinked codes. Sub-categories are placed before codes under each category.
+    The parent to children maps are built once and items are created in a single
+    depth-first pass, so the cost is linear in the number of categories and codes.
+    The caller clears the tree and sets the header labels.
+
+    param: tree : QTreeWidget
+    param: categories : list of category dictionaries
+    param: codes : list of code dictionaries
+    param: category_columns : function(category) returning the column texts
+    param: code_columns : function(code) returning the column texts
+    param: code_flags : item flags for code items
+    param: tooltips : Boolean, show owner and date as the name tooltip
+    returns: dictionary of 'catid:n' and 'cid:n' to QTreeWidgetItem
+    """
+
+    if category_columns is None:
+        category_columns = lambda cat: memo_columns(cat, 'catid')
+    if code_columns is None:
+        code_columns = lambda code: memo_columns(code, 'cid')
+    cat_icon = QtGui.QIcon("GUI/icon_cat.png")
+    code_icon = QtGui.QIcon("GUI/icon_code.png")
+    sub_categories, category_codes = category_children(categories, codes)
+    items = {}
+    # stack of (parent item, catid) still to be filled, catid None is the top level
+    stack = [(tree.invisibleRootItem(), None)]
+    while stack:
+        parent, catid = stack.pop()
+        new_categories = []
+        for cat in sub_categories.get(catid, []):
+            key = 'catid:' + str(cat['catid'])
+            if key in items:
+                logger.warning("Category loop at " + key)
+                continue
+            child = QtWidgets.QTreeWidgetItem([str(c) for c in category_columns(cat)])
+            child.setIcon(0, cat_icon)
+            if tooltips:
+                child.setToolTip(0, str(cat['owner']) + "\n" + str(cat['date']))
+            parent.addChild(child)
+            items[key] = child
+            new_categories.append((child, cat['catid']))
+        for code in category_codes.get(catid, []):
+            child = QtWidgets.QTreeWidgetItem([str(c) for c in code_columns(code)])
+            child.setIcon(0, code_icon)
+            if tooltips:
+                child.setToolTip(0, str(code['owner']) + "\n" + str(code['date']))
+            child.setBackground(0, QBrush(QtGui.QColor(code['color']), Qt.SolidPattern))
+            child.setFlags(code_flags)
+            parent.addChild(child)
+            items['cid:' + str(code['cid'])] = child
+        # reversed so that sub-categories are filled in their listed order
+        stack.extend(reversed(new_categories))
+    return items
+
+
+class CodeTreeMixin:
+    """ Code and category tree for the text, image and A/V coding dialogs.
+    The dialog provides self.app, self.settings, self.parent_textEdit and a QTreeView
+    as self.ui.treeView. Edits are made through the App code repository, which
+    updates the shared tree model, and calls codes_changed in every open dialog. """
+
+    code_model = None
+    code_repository = None
+
+    def get_codes_categories(self):
+        """ Called from init. Codes and categories are the lists of the code repository. """
+
+        self.code_repository = self.app.code_repository
+        self.code_model = self.app.get_code_tree_model()
+        self.codes = self.code_repository.codes
+        self.categories = self.code_repository.categories
+        self.code_repository.item_changed.connect(self.code_item_changed)
+        self.code_repository.item_removed.connect(self.code_item_changed)
+        self.code_repository.data_reset.connect(self.codes_changed)
+
+    def setup_code_tree(self):
+        """ Show the shared code tree model in the tree view. Called from init. """
+
+        if self.code_model is None:
+            self.get_codes_categories()
+        view = self.ui.treeView
+        view.setModel(self.code_model)
+        treefont = QtGui.QFont(self.settings['font'], self.settings['treefontsize'], QtGui.QFont.Normal)
+        view.setFont(treefont)
+        view.setColumnHidden(1, True)
+        view.header().setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
+        view.header().setStretchLastSection(False)
+        view.setDragEnabled(True)
+        view.setAcceptDrops(True)
+        view.setDragDropMode(QtWidgets.QAbstractItemView.InternalMove)
+        view.viewport().installEventFilter(self)
+        view.setContextMenuPolicy(Qt.CustomContextMenu)
+        view.customContextMenuRequested.connect(self.tree_menu)
+        # deeper categories are fetched when expanded
+        view.expandToDepth(0)
+
+    def code_item_changed(self, key):
+        """ Repository signal, a category or code was changed or removed, possibly
+        in another dialog. """
+
+        if key[0:3] == 'cid':
+            self.codes_changed()
+
+    def codes_changed(self):
+        """ Called after a code is renamed, recoloured, merged or deleted.
+        Dialogs override this to redraw their codings. """
+
+        pass
+
+    def selected_key(self):
+        """ The 'catid:n' or 'cid:n' key of the current tree item, or None. """
+
+        index = self.ui.treeView.currentIndex()
+        if not index.isValid():
+            return None
+        return self.code_model.key(index)
+
+    def selected_code(self):
+        """ The currently selected code dictionary, None if no code is selected. """
+
+        key = self.selected_key()
+        if key is None or key[0:3] != 'cid':
+            return None
+        return self.code_repository.item(key)
+
+    def code_tree_drop(self, event):
+        """ Called from the dialog eventFilter for a drop event on the tree view port.
+        The model moves the row, so the drop is not passed on to the view.
+        returns: True """
+
+        key = self.selected_key()
+        index = self.ui.treeView.indexAt(event.pos())
+        parent_key = self.code_model.key(index) if index.isValid() else None
+        if key is not None and key != parent_key:
+            self.item_moved_update_data(key, parent_key)
+        return True
+
+    def item_moved_update_data(self, key, parent_key):
+        """ Called from drop event in tree view port.
+        Move a code or category into a category or to the top level.
+        Merge codes if one code is dropped on another code. """
+
+        if parent_key is not None and parent_key[0:3] == 'cid':
+            # parent is code (leaf) cannot add child, but can merge
+            if key[0:3] == 'cid':
+                self.merge_codes(key, parent_key)
+            return
+        if not self.code_repository.move(key, parent_key):
+            logger.debug("Cannot move " + key + " into " + str(parent_key))
+
+    def merge_codes(self, key, parent_key):
+        """ Merge code into another code, for text, image and A/V codings.
+        Called by item_moved_update_data when a code is moved onto another code. """
+
+        msg = _("Merge code: ") + self.code_repository.item(key)['name'] + _(" into code: ") + \
+            self.code_repository.item(parent_key)['name']
+        reply = QtWidgets.QMessageBox.question(None, _('Merge codes'),
+        msg, QtWidgets.QMessageBox.Yes, QtWidgets.QMessageBox.No)
+        if reply == QtWidgets.QMessageBox.No:
+            return
+        try:
+            self.code_repository.merge_codes(key, parent_key)
+        except sqlite3.Error as e:
+            msg = _("Cannot merge codes, unmark overlapping text first. ") + str(e)
+            QtWidgets.QMessageBox.warning(None, _("Cannot merge"), msg)
+            return
+        self.parent_textEdit.append(msg)
+
+    def add_code(self):
+        """ Use add_item dialog to get new code text. Add_code_name dialog checks for
+        duplicate code name. A random color is selected for the code.
+        New code is added to data and database. """
+
+        ui = DialogAddItemName(self.codes, _("Add new code"))
+        ui.exec_()
+        newCodeText = ui.get_new_name()
+        if newCodeText is None:
+            return
+        code_color = colors[randint(0, len(colors) - 1)]
+        item = self.code_repository.add_code(newCodeText, self.settings['codername'], code_color)
+        self.ui.treeView.setCurrentIndex(self.code_model.index_from_key('cid:' + str(item['cid'])))
+        self.parent_textEdit.append(_("New code: ") + item['name'])
+
+    def add_category(self):
+        """ Add a new category.
+        Note: the addItem dialog does the checking for duplicate category names
+        Add the new category as a top level item. """
+
+        ui = DialogAddItemName(self.categories, _("Category"))
+        ui.exec_()
+        newCatText = ui.get_new_name()
+        if newCatText is None:
+            return
+        item = self.code_repository.add_category(newCatText, self.settings['codername'])
+        self.parent_textEdit.append(_("New category: ") + item['name'])
+
+    def delete_category_or_code(self, key):
+        """ Delete code with its text, image and A/V codings, or delete category.
+        Codes and sub-categories of a deleted category are moved to the top level. """
+
+        item = self.code_repository.item(key)
+        if key[0:3] == 'cid':
+            title = _("Code: ")
+        else:
+            title = _("Category: ")
+        ui = DialogConfirmDelete(title + item['name'])
+        ok = ui.exec_()
+        if not ok:
+            return
+        self.code_repository.delete(key)
+        if key[0:3] == 'cid':
+            self.parent_textEdit.append(_("Code deleted: ") + item['name'])
+        else:
+            self.parent_textEdit.append(_("Category deleted: ") + item['name'])
+
+    def add_edit_memo(self, key):
+        """ View and edit a memo for a category or code. """
+
+        item = self.code_repository.item(key)
+        if key[0:3] == 'cid':
+            title = _("Memo for Code: ") + item['name']
+        else:
+            title = _("Memo for Category: ") + item['name']
+        ui = DialogMemo(self.settings, title, item['memo'])
+        ui.exec_()
+        if ui.memo == item['memo']:
+            return
+        self.code_repository.set_memo(key, ui.memo)
+        self.parent_textEdit.append(title)
+
+    def rename_category_or_code(self, key):
+        """ Rename a code or category.
+        Check that the code or category name is not currently in use. """
+
+        item = self.code_repository.item(key)
+        if key[0:3] == 'cid':
+            new_name, ok = QtWidgets.QInputDialog.getText(self, _("Rename code"),
+                _("New code name:"), QtWidgets.QLineEdit.Normal, item['name'])
+            in_use = self.codes
+        else:
+            new_name, ok = QtWidgets.QInputDialog.getText(self, _("Rename category"),
+                _("New category name:"), QtWidgets.QLineEdit.Normal, item['name'])
+            in_use = self.categories
+        if not ok or new_name == '':
+            return
+        for c in in_use:
+            if c['name'] == new_name:
+                QtWidgets.QMessageBox.warning(None, _("Name in use"),
+                new_name + _(" is already in use, choose another name."), QtWidgets.QMessageBox.Ok)
+                return
+        old_name = item['name']
+        self.code_repository.rename(key, new_name)
+        self.parent_textEdit.append(_("Renamed from: ") + old_name + _(" to: ") + new_name)
+
+    def change_code_color(self, key):
+        """ Change the colour of the currently selected code. """
+
+        ui = DialogColorSelect(self.code_repository.item(key)['color'])
+        ok = ui.exec_()
+        if not ok:
+            return
+        new_color = ui.get_color()
+        if new_color is None:
+            return
+        self.code_repository.set_color(key, new_color)
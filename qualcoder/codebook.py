@@ -25,13 +25,14 @@ Author: Colin Curtain (ccbogel)
 https://github.com/ccbogel/QualCoder
 '''
 
-from copy import copy
 import logging
 import os
 import sys
 import traceback
 
-from PyQt5 import QtGui, QtWidgets
+from PyQt5 import QtWidgets
+
+from .code_tree import fill_code_tree, memo_columns
 
 path = os.path.abspath(os.path.dirname(__file__))
 logger = logging.getLogger(__name__)
@@ -56,10 +57,11 @@ class Codebook():
     categories = []
     tree = None
 
-    def __init__(self, settings, parent_textEdit):
+    def __init__(self, app, parent_textEdit):
 
         sys.excepthook = exception_handler
-        self.settings = settings
+        self.app = app
+        self.settings = app.settings
         self.parent_textEdit = parent_textEdit
         self.get_code_names_and_frequencies()
         self.get_categories()
@@ -71,83 +73,10 @@ class Codebook():
         """ Fill tree widget, top level items are main categories and unlinked codes
         """
 
-        cats = copy(self.categories)
-        codes = copy(self.code_names)
         self.tree.clear()
         self.tree.setColumnCount(4)
-        # add top level categories
-        remove_list = []
-        for c in cats:
-            if c['supercatid'] is None:
-                memo = ""
-                if c['memo'] != "":
-                    memo = "Memo"
-                top_item = QtWidgets.QTreeWidgetItem([c['name'], 'catid:' + str(c['catid']), memo])
-                self.tree.addTopLevelItem(top_item)
-                remove_list.append(c)
-        for item in remove_list:
-            #try:
-            cats.remove(item)
-            #except Exception as e:
-            #    logger.debug(e, item)
-
-        ''' add child categories. look at each unmatched category, iterate through tree
-         to add as child then remove matched categories from the list. '''
-
-        count = 0
-        while len(cats) > 0 or count < 10000:
-            remove_list = []
-            #logger.debug(cats)
-            for c in cats:
-                it = QtWidgets.QTreeWidgetItemIterator(self.tree)
-                item = it.value()
-                while item:  # while there is an item in the list
-                    #logger.debug("While: ", item.text(0), item.text(1), c['catid'], c['supercatid'])
-                    if item.text(1) == 'catid:' + str(c['supercatid']):
-                        memo = ""
-                        if c['memo'] != "":
-                            memo = "Memo"
-                        child = QtWidgets.QTreeWidgetItem([c['name'], 'catid:' + str(c['catid']), memo])
-                        child.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-                        item.addChild(child)
-                        #logger.debug("Adding child: " + c['name'])
-                        remove_list.append(c)
-                    it += 1
-                    item = it.value()
-            for item in remove_list:
-                cats.remove(item)
-            count += 1
-
-        # add unlinked codes as top level items
-        remove_items = []
-        for c in codes:
-            if c['catid'] is None:
-                #logger.debug("Unlinked code as top level item:" + c['name'])
-                memo = ""
-                if c['memo'] != "":
-                    memo = "Memo"
-                top_item = QtWidgets.QTreeWidgetItem([c['name'], 'cid:' + str(c['cid']), memo, str(c['freq'])])
-                self.tree.addTopLevelItem(top_item)
-                remove_items.append(c)
-        for item in remove_items:
-            codes.remove(item)
-
-        # add codes as children
-        for c in codes:
-            it = QtWidgets.QTreeWidgetItemIterator(self.tree)
-            item = it.value()
-            while item:
-                #logger.debug("add codes as children:" + item.text(0), item.text(1), c['cid'], c['catid'])
-                if item.text(1) == 'catid:' + str(c['catid']):
-                    memo = ""
-                    if c['memo'] != "":
-                        memo = "Memo"
-                    child = QtWidgets.QTreeWidgetItem([c['name'], 'cid:' + str(c['cid']), memo, str(c['freq'])])
-                    item.addChild(child)
-                    c['catid'] = -1  # make unmatchable
-                it += 1
-                item = it.value()
-        #self.ui.treeWidget.expandAll()
+        fill_code_tree(self.tree, self.categories, self.code_names,
+            code_columns=lambda c: memo_columns(c, 'cid') + [str(c['freq'])])
 
     def export(self):
         """ Export codes to a plain text file, filename will have .txt ending. """
@@ -208,39 +137,19 @@ class Codebook():
         return depth
 
     def get_categories(self):
-        """ Called from init, delete category. """
+        """ Called from init. Categories from the App code repository. """
 
-        self.categories = []
-        cur = self.settings['conn'].cursor()
-        cur.execute("select name, catid, owner, date, memo, supercatid from code_cat")
-        result = cur.fetchall()
-        for row in result:
-            self.categories.append({'name': row[0], 'catid': row[1], 'owner': row[2],
-            'date': row[3], 'memo': row[4], 'supercatid': row[5]})
+        self.categories = self.app.code_repository.categories
 
     def get_code_names_and_frequencies(self):
-        """ Called from init. First get all the codes, then for each code, get the
-        frequency from coded text, images and audio/video. """
+        """ Called from init. Copies of the repository codes, with the
+        frequency of each code from coded text, images and audio/video. """
 
-        self.code_names = []
+        self.code_names = [dict(c, freq=0) for c in self.app.code_repository.codes]
         cur = self.settings['conn'].cursor()
-        cur.execute("select name, memo, owner, date, cid, catid, color from code_name")
-        result = cur.fetchall()
-        for row in result:
-            self.code_names.append({'name': row[0], 'memo': row[1], 'owner': row[2], 'date': row[3],
-            'cid': row[4], 'catid': row[5], 'color': row[6], 'freq': 0})
-
+        sql = "select cid, count(*) from (select cid from code_text union all "
+        sql += "select cid from code_image union all select cid from code_av) group by cid"
+        cur.execute(sql)
+        freq = dict(cur.fetchall())
         for c in self.code_names:
-            c['freq'] = 0
-            cur.execute("select count(cid) from code_text where cid=?", [c['cid'], ])
-            result = cur.fetchone()
-            if result is not None:
-                c['freq'] += result[0]
-            cur.execute("select count(imid) from code_image where cid=?", [c['cid'], ])
-            result = cur.fetchone()
-            if result is not None:
-                c['freq'] += result[0]
-            cur.execute("select count(avid) from code_av where cid=?", [c['cid'], ])
-            result = cur.fetchone()
-            if result is not None:
-                c['freq'] += result[0]
+            c['freq'] = freq.get(c['cid'], 0)
@@ -843,6 +843,71 @@ def getdocumenttext(document):
     return paratextlist
 
 
+def iterparagraphs(file):
+    '''Yield the raw text of each paragraph of a docx file, followed by the footnotes
+    and endnotes. The xml is parsed as a stream and elements are cleared once read,
+    so long documents are read in linear time and little memory.
+    Paragraphs of table cells are yielded in document order. A paragraph inside
+    another, e.g. in a text box, is yielded before the rest of the outer paragraph.
+    Note references are shown as [id] in the text and before the note.'''
+
+    mydoc = zipfile.ZipFile(file)
+    try:
+        names = mydoc.namelist()
+        for part in ('word/document.xml', 'word/footnotes.xml', 'word/endnotes.xml'):
+            if part in names:
+                with mydoc.open(part) as xmlcontent:
+                    for paratext in iterparttext(xmlcontent):
+                        yield paratext
+    finally:
+        mydoc.close()
+
+
+def iterparttext(xmlcontent):
+    '''Yield the raw text of each paragraph of a document, footnotes or endnotes
+    xml stream. Paragraphs are read when they end and then cleared, so the text of
+    a nested paragraph is not read again with the outer paragraph. Tables, rows,
+    cells and notes are cleared when they end, as their paragraphs have been read.'''
+
+    w = '{' + nsprefixes['w'] + '}'
+    notes = (w + 'footnote', w + 'endnote')
+    containers = (w + 'tbl', w + 'tr', w + 'tc') + notes
+    note = None  # id of the last note with text
+    for event, element in etree.iterparse(xmlcontent, events=('end',), tag=(w + 'p',) + containers):
+        parent = element.getparent()
+        if element.tag == w + 'p':
+            paratext = paragraphtext(element, w)
+            # the first paragraph of a note, separator notes have no text
+            if len(paratext) > 0 and parent.tag in notes and parent.get(w + 'id') != note:
+                note = parent.get(w + 'id')
+                paratext = '[' + note + ']' + paratext
+            if len(paratext) > 0:
+                yield paratext
+        # text of this element and the elements before it has been read
+        element.clear()
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def paragraphtext(paragraph, w):
+    '''Raw text of a paragraph element, with tabs, line breaks and note references.
+    w is the expanded namespace prefix of the w tags.'''
+
+    paratext = []
+    for element in paragraph.iter(w + 't', w + 'tab', w + 'br', w + 'cr',
+            w + 'footnoteReference', w + 'endnoteReference'):
+        if element.tag == w + 't':
+            if element.text:
+                paratext.append(element.text)
+        elif element.tag == w + 'tab':
+            paratext.append('\t')
+        elif element.tag in (w + 'br', w + 'cr'):
+            paratext.append('\n')
+        else:
+            paratext.append('[' + element.get(w + 'id', '') + ']')
+    return ''.join(paratext)
+
+
 def get_document_text(document):
     '''Return the raw text of a document '''
 
@@ -0,0 +1,612 @@
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (c) 2019 Colin Curtain
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Author: Colin Curtain (ccbogel)
+https://github.com/ccbogel/QualCoder
+'''
+
+
+import codecs
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import datetime
+import hashlib
+from itertools import islice
+import logging
+import multiprocessing
+import os
+import platform
+import sqlite3
+import subprocess
+import zipfile
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import pyqtSignal
+
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTTextBox, LTTextLine
+
+import chardet
+import ebooklib
+from ebooklib import epub
+from lxml import etree
+
+from .docx import iterparagraphs
+from .html_parser import html_chunks_to_text, html_to_text
+
+logger = logging.getLogger(__name__)
+
+# file suffix: project folder
+FOLDERS = {
+    'docx': 'documents', 'odt': 'documents', 'txt': 'documents', 'htm': 'documents',
+    'html': 'documents', 'epub': 'documents', 'pdf': 'documents',
+    'jpg': 'images', 'jpeg': 'images', 'png': 'images', 'gif': 'images',
+    'wav': 'audio', 'mp3': 'audio',
+    'mkv': 'video', 'mov': 'video', 'mp4': 'video', 'ogg': 'video', 'wmv': 'video'
+}
+
+# pdfs with more pages are split into jobs of this many pages
+PDF_PAGES_PER_JOB = 20
+# bytes of files read at a time, and of text files used to detect the encoding
+READ_SIZE = 1024 * 1024
+ENCODING_SAMPLE_SIZE = 64 * 1024
+# Linux ioctl to clone a file, sharing its data blocks, on btrfs and xfs
+FICLONE = 0x40049409
+
+ODT_NAMESPACES = {
+    'office': "urn:oasis:names:tc:opendocument:xmlns:office:1.0",
+    'text': "urn:oasis:names:tc:opendocument:xmlns:text:1.0",
+    'table': "urn:oasis:names:tc:opendocument:xmlns:table:1.0",
+    'draw': "urn:oasis:names:tc:opendocument:xmlns:drawing:1.0",
+}
+
+
+def odt_tag(tag):
+    """ Expanded lxml tag name for a prefixed odt tag name, e.g. 'text:p'. """
+
+    prefix, name = tag.split(":")
+    return "{" + ODT_NAMESPACES[prefix] + "}" + name
+
+
+# text added at the start and the end of odt elements
+ODT_START = {odt_tag('text:h'): "\n", odt_tag('table:table'): "\n=== TABLE ===\n",
+    odt_tag('draw:image'): "\n=== IMG ===", odt_tag('text:tab'): "\t", odt_tag('text:line-break'): "\n"}
+ODT_END = {odt_tag('text:h'): "\n\n", odt_tag('text:p'): "\n", odt_tag('text:list-item'): "\n",
+    odt_tag('text:a'): " ", odt_tag('table:table-cell'): "\n", odt_tag('table:table'): "=== END TABLE ===\n",
+    odt_tag('draw:frame'): "\n"}
+# elements of the document body that do not contain document text
+ODT_SKIP = (odt_tag('text:sequence-decls'), odt_tag('office:annotation'))
+
+
+def project_folder(import_file):
+    """ The project folder for the file type, e.g. 'images', or None for
+    an unknown file type. """
+
+    return FOLDERS.get(import_file.split('.')[-1].lower())
+
+
+def remove_copy(project_path, result):
+    """ Remove the project copy of a file that was not imported, so that no orphan
+    is left in the project folder. """
+
+    path = project_path + "/" + project_folder(result['name']) + "/" + result['name']
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("Import " + str(e))
+
+
+def import_file(import_file, project_path, fast_pdf=False):
+    """ Copy a file into its project folder and extract the text of documents.
+    Runs in a worker process of the import pipeline in DialogManageFiles, so the
+    arguments and the result must be picklable and no Qt objects are used.
+    Returns a dictionary of name, mediapath, fulltext, pages, hash and error. Documents
+    have a mediapath of None, images, audio and video have a fulltext of None.
+    hash is the sha256 hex digest of the content of the import file.
+    pages is the list of (page, pos0, pos1) character offsets of each page of a pdf.
+    A pdf with more than PDF_PAGES_PER_JOB pages is only copied and counted, its
+    result has pdf_pages set for the ImportWorker to extract the pages in parallel.
+    error is None or the reason the file was not imported. """
+
+    filename = import_file.split("/")[-1]
+    folder = project_folder(import_file)
+    result = {'name': filename, 'mediapath': None, 'fulltext': None, 'pages': None, 'hash': None,
+        'error': None}
+    destination = project_path + "/" + folder + "/" + filename
+    try:
+        if folder != "documents":
+            result['hash'] = copy_hashed(import_file, destination)
+            result['mediapath'] = "/" + folder + "/" + filename
+            return result
+        if import_file[-4:].lower() == ".pdf":
+            result['hash'] = copy_pdf(import_file, destination)
+            page_count = pdf_page_count(destination)
+            if page_count > PDF_PAGES_PER_JOB:
+                result['pdf_pages'] = page_count
+                return result
+            result['fulltext'], result['pages'] = join_pages(pdf_pages_text(destination, fast=fast_pdf))
+        else:
+            result['hash'] = copy_hashed(import_file, destination)
+            result['fulltext'] = extract_text(import_file)
+    except Exception as e:
+        logger.warning("Cannot import " + import_file + " " + str(e))
+        result['error'] = str(e)
+        remove_copy(project_path, result)
+        return result
+    if result['fulltext'] == "":
+        result['error'] = "No text"
+        remove_copy(project_path, result)
+    return result
+
+
+class ImportWorker(QtCore.QThread):
+    """ Imports files in a pool of worker processes, so that copying and text
+    extraction of many large documents uses all processors and does not block the GUI.
+    The pages of long pdfs are extracted in jobs of PDF_PAGES_PER_JOB pages, so a
+    single long pdf also uses all processors.
+    Results are sent to the GUI thread as each file is done, in order of completion.
+    The GUI thread is the single writer to the project database, see insert_sources.
+    Imported files with the same content as a project file, or as another imported
+    file, are removed from the project folder and sent with an error, as are files
+    that fail after they are copied.
+    Worker processes are spawned rather than forked from the GUI process.
+    Call requestInterruption to cancel, files not yet started are not imported and files
+    already being imported are finished. """
+
+    # import file path and result of import_file
+    imported = pyqtSignal(str, object)
+
+    cancelled = False
+
+    def __init__(self, imports, project_path, fast_pdf=False, parent=None):
+        super(ImportWorker, self).__init__(parent)
+        self.imports = imports
+        self.project_path = project_path
+        self.fast_pdf = fast_pdf
+
+    def run(self):
+        self.load_hashes()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(mp_context=context) as executor:
+            # future: import file and first page of a pdf job, or None for import_file
+            self.futures = {}
+            # import file: result and {first page: list of page texts} of a split pdf
+            self.pdfs = {}
+            for f in self.imports:
+                self.futures[executor.submit(import_file, f, self.project_path, self.fast_pdf)] = (f, None)
+            pending = set(self.futures)
+            while pending:
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                if self.isInterruptionRequested() and not self.cancelled:
+                    self.cancelled = True
+                    for future in pending:
+                        future.cancel()
+                for future in done:
+                    pending.update(self.collect(executor, future))
+        # pdfs with cancelled page jobs
+        for f in self.pdfs:
+            result = self.pdfs[f][0]
+            remove_copy(self.project_path, result)
+            result['error'] = "Import cancelled"
+            self.imported.emit(f, result)
+
+    def load_hashes(self):
+        """ Content hashes of the project files, read through a separate connection
+        to the project database. Files imported before hashes were kept are listed by
+        size, to be hashed only when a file of the same size is imported. """
+
+        # hash: file name
+        self.hashes = {}
+        # size: list of file id, name, mediapath
+        self.unhashed = {}
+        conn = sqlite3.connect(self.project_path + "/data.qda")
+        try:
+            cur = conn.cursor()
+            cur.execute("select hash, source.name from source_hash join source on source.id = source_hash.id")
+            self.hashes = dict(cur.fetchall())
+            cur.execute(("select id, name, mediapath from source where mediapath is not null "
+                "and id not in (select id from source_hash)"))
+            result = cur.fetchall()
+        except sqlite3.Error as e:
+            logger.error("Import " + str(e))
+            result = []
+        finally:
+            conn.close()
+        for id_, name, mediapath in result:
+            try:
+                size = os.path.getsize(self.project_path + mediapath)
+            except OSError:
+                continue
+            self.unhashed.setdefault(size, []).append((id_, name, mediapath))
+
+    def duplicate(self, import_file, result):
+        """ Name of a project or imported file with the same content as the import
+        file, or None. Hashes of older project files of the same size are found here,
+        and sent with the result to be stored. """
+
+        result['source_hashes'] = []
+        for id_, name, mediapath in self.unhashed.pop(os.path.getsize(import_file), []):
+            try:
+                hash_ = file_hash(self.project_path + mediapath)
+            except OSError as e:
+                logger.warning("Import " + str(e))
+                continue
+            self.hashes.setdefault(hash_, name)
+            result['source_hashes'].append((id_, hash_))
+        name = self.hashes.get(result['hash'])
+        if name is None:
+            self.hashes[result['hash']] = result['name']
+        return name
+
+    def collect(self, executor, future):
+        """ Send the result of a finished import_file or pdf page job.
+        Returns the page jobs submitted for a long pdf. """
+
+        f, first = self.futures.pop(future)
+        if future.cancelled():
+            return []
+        try:
+            result = future.result()
+        except Exception as e:  # a worker process ended abruptly, or a pdf page error
+            logger.error("Import " + f + " " + str(e))
+            if first is None:
+                result = {'name': f.split("/")[-1], 'mediapath': None, 'fulltext': None,
+                    'pages': None, 'error': str(e)}
+            elif f in self.pdfs:
+                result = self.pdfs.pop(f)[0]
+                result['error'] = str(e)
+            else:  # an earlier page job of this pdf failed
+                return []
+            remove_copy(self.project_path, result)
+            self.imported.emit(f, result)
+            return []
+        if first is None and result['error'] is None:
+            name = self.duplicate(f, result)
+            if name is not None:
+                remove_copy(self.project_path, result)
+                result['error'] = "Same content as " + name
+                self.imported.emit(f, result)
+                return []
+        if first is None and result.get('pdf_pages') is not None:
+            self.pdfs[f] = (result, {})
+            if self.cancelled:
+                return []
+            path = self.project_path + "/documents/" + result['name']
+            jobs = []
+            for first in range(0, result['pdf_pages'], PDF_PAGES_PER_JOB):
+                job = executor.submit(pdf_pages_text, path, first, first + PDF_PAGES_PER_JOB, self.fast_pdf)
+                self.futures[job] = (f, first)
+                jobs.append(job)
+            return jobs
+        if first is not None:
+            if f not in self.pdfs:
+                return []
+            parts = self.pdfs[f][1]
+            parts[first] = result
+            result = self.pdfs[f][0]
+            if len(parts) * PDF_PAGES_PER_JOB < result['pdf_pages']:
+                return []
+            del self.pdfs[f]
+            pages = []
+            for first in sorted(parts):
+                pages += parts[first]
+            result['fulltext'], result['pages'] = join_pages(pages)
+            if result['fulltext'] == "":
+                result['error'] = "No text"
+                remove_copy(self.project_path, result)
+        self.imported.emit(f, result)
+        return []
+
+
+def insert_sources(conn, results, owner):
+    """ Insert source rows for imported files in one transaction.
+    Audio and video files also get an empty transcription file, named with
+    the '.transcribed' suffix.
+    The page offsets of pdfs are stored in source_page, and the content hashes
+    of the files in source_hash.
+    Returns the list of new source dictionaries, with their ids. """
+
+    date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    sql = "insert into source(name,fulltext,mediapath,memo,owner,date) values(?,?,?,?,?,?)"
+    entries = []
+    cur = conn.cursor()
+    try:
+        for result in results:
+            entry = {'name': result['name'], 'id': -1, 'fulltext': result['fulltext'],
+                'mediapath': result['mediapath'], 'memo': "", 'owner': owner, 'date': date}
+            cur.execute(sql, (entry['name'], entry['fulltext'], entry['mediapath'], entry['memo'],
+                entry['owner'], entry['date']))
+            entry['id'] = cur.lastrowid
+            entries.append(entry)
+            cur.execute("insert or replace into source_hash (id,hash) values(?,?)", (entry['id'], result['hash']))
+            cur.executemany("insert or replace into source_hash (id,hash) values(?,?)", result.get('source_hashes', []))
+            if result.get('pages') is not None:
+                cur.executemany("insert into source_page (fid,page,pos0,pos1) values(?,?,?,?)",
+                    [(entry['id'], page, pos0, pos1) for page, pos0, pos1 in result['pages']])
+            if result['mediapath'] is not None and result['mediapath'][:6] in ("/audio", "/video"):
+                entry = {'name': result['name'] + ".transcribed", 'id': -1, 'fulltext': "",
+                    'mediapath': None, 'memo': "", 'owner': owner, 'date': date}
+                cur.execute(sql, (entry['name'], entry['fulltext'], entry['mediapath'], entry['memo'],
+                    entry['owner'], entry['date']))
+                entry['id'] = cur.lastrowid
+                entries.append(entry)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return entries
+
+
+def file_hash(path):
+    """ sha256 hex digest of the content of a file. """
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(READ_SIZE)
+            if not data:
+                break
+            sha.update(data)
+    return sha.hexdigest()
+
+
+def copy_hashed(source, destination):
+    """ Copy a file and return the sha256 hex digest of its content, computed from
+    the blocks as they are copied. Where the file system supports it the copy is a
+    reflink, which shares the data blocks until one of the files is changed, and the
+    file is only read for the hash. """
+
+    if reflink(source, destination):
+        return file_hash(source)
+    sha = hashlib.sha256()
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        while True:
+            data = src.read(READ_SIZE)
+            if not data:
+                break
+            sha.update(data)
+            dst.write(data)
+    return sha.hexdigest()
+
+
+def reflink(source, destination):
+    """ Clone a file with the Linux FICLONE ioctl. Returns False if the platform or
+    file system does not support it. """
+
+    if fcntl is None or platform.system() != "Linux":
+        return False
+    try:
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        return False
+
+
+def copy_pdf(import_file, destination):
+    """ Copy a pdf into the project, removing encryption with qpdf where possible, for Linux.
+    qpdf decrypt is not implemented for Windows and OSX.
+    Returns the sha256 hex digest of the import file. """
+
+    if platform.system() == "Linux":
+        try:
+            subprocess.run(["qpdf", "--decrypt", import_file, destination], stdout=subprocess.PIPE)
+            if os.path.isfile(destination):
+                return file_hash(import_file)
+        except OSError as e:
+            logger.debug("qpdf: " + str(e))
+    return copy_hashed(import_file, destination)
+
+
+def extract_text(import_file):
+    """ Plain text from file types of odt, docx pdf, epub, txt, html, htm.
+    Other file types are read as plain text. """
+
+    suffix = import_file.split('.')[-1].lower()
+    if suffix == "odt":
+        return odt_to_text(import_file)
+    if suffix == "docx":
+        return "\n".join(iterparagraphs(import_file))
+    if suffix == "epub":
+        return epub_to_text(import_file)
+    if suffix == "pdf":
+        return "".join(pdf_pages_text(import_file))
+    if suffix in ("html", "htm"):
+        return html_chunks_to_text(read_text(import_file))
+    return plain_text(import_file)
+
+
+def epub_to_text(import_file):
+    """ Text of each epub document, in book order. """
+
+    text = ""
+    book = epub.read_epub(import_file)
+    for d in book.get_items_of_type(ebooklib.ITEM_DOCUMENT):
+        bytes_ = d.get_body_content()
+        string = bytes_.decode('utf-8')
+        text += html_to_text(string) + "\n"
+    return text
+
+
+def pdf_page_count(import_file):
+    """ Number of pages of a pdf. Pages are found without interpreting their content. """
+
+    with open(import_file, 'rb') as fp:
+        parser = PDFParser(fp)
+        doc = PDFDocument(parser=parser)
+        parser.set_document(doc)
+        return sum(1 for page in PDFPage.create_pages(doc))
+
+
+def pdf_pages_text(import_file, first=0, last=None, fast=False):
+    """ Text boxes and text lines of pdf pages first to last - 1, counted from 0, using
+    pdfminer layout analysis. Returns a list with the text of each page.
+    The fast mode only groups characters into lines and text boxes, text boxes are
+    ordered by position instead of the slower hierarchical layout analysis, so the text
+    of multi column pages may be out of order. """
+
+    pages = []
+    with open(import_file, 'rb') as fp:  # read binary mode
+        parser = PDFParser(fp)
+        doc = PDFDocument(parser=parser)
+        parser.set_document(doc)
+        # potential error with encrypted PDF
+        rsrcmgr = PDFResourceManager()
+        laparams = LAParams()
+        laparams.char_margin = 1.0
+        laparams.word_margin = 1.0
+        if fast:
+            laparams.boxes_flow = None
+        device = PDFPageAggregator(rsrcmgr, laparams=laparams)
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        for page in islice(PDFPage.create_pages(doc), first, last):
+            interpreter.process_page(page)
+            layout = device.get_result()
+            text = []
+            for lt_obj in layout:
+                if isinstance(lt_obj, LTTextBox) or isinstance(lt_obj, LTTextLine):
+                    text.append(lt_obj.get_text())
+            pages.append("".join(text))
+    return pages
+
+
+def join_pages(pages):
+    """ The text of all pages, and the list of (page, pos0, pos1) character offsets
+    of each page in the text, with pages counted from 1. """
+
+    offsets = []
+    pos = 0
+    for page, text in enumerate(pages, 1):
+        offsets.append((page, pos, pos + len(text)))
+        pos += len(text)
+    return "".join(pages), offsets
+
+
+def plain_text(import_file):
+    """ Text of a plain text file, without the byte order mark of notepad files. """
+
+    text = "".join(read_text(import_file))
+    if text[0:1] == "\ufeff":  # associated with notepad files
+        text = text[1:]
+    return text
+
+
+def file_encoding(import_file):
+    """ Encoding of a text file, from its byte order mark, or utf-8 if a sample from
+    the start of the file is valid utf-8, otherwise detected by chardet on the sample.
+    Defaults to utf-8. """
+
+    with open(import_file, 'rb') as f:
+        sample = f.read(ENCODING_SAMPLE_SIZE)
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith(codecs.BOM_UTF16_LE) or sample.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16'
+    try:
+        # not final, as the sample may end within a character
+        codecs.getincrementaldecoder('utf-8')().decode(sample)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    encoding = chardet.detect(sample)['encoding']
+    # an ascii sample does not mean the rest of the file is ascii
+    if encoding is None or encoding.lower() == 'ascii':
+        return 'utf-8'
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        logger.warning("Unknown encoding " + encoding + " for " + import_file)
+        return 'utf-8'
+    return encoding
+
+
+def read_text(import_file):
+    """ Yield the text of a file in chunks, decoded incrementally from READ_SIZE blocks
+    of bytes. Bytes that cannot be decoded are replaced by the unicode replacement
+    character, rather than failing the import of the whole file. """
+
+    encoding = file_encoding(import_file)
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    with open(import_file, 'rb') as f:
+        while True:
+            data = f.read(READ_SIZE)
+            if not data:
+                break
+            yield decoder.decode(data)
+    yield decoder.decode(b"", final=True)
+
+
+def odt_to_text(import_file):
+    """ Convert odt to very rough equivalent with headings, list items and tables.
+    content.xml is parsed as a stream from the zip file, and the elements of the
+    document body are removed once their text is added, so large documents use
+    little memory.
+    lxml parses the text between two tags by the time the second tag is reported,
+    so the text, or the tail, of the element of the previous event is added at
+    each event. """
+
+    text = []
+    body = False
+    skipped = None  # element whose content is not document text
+    previous = None  # event and element, followed by its text or tail
+    office_text = odt_tag('office:text')
+    with zipfile.ZipFile(import_file) as odt_file, odt_file.open('content.xml') as content:
+        for event, element in etree.iterparse(content, events=("start", "end")):
+            if body and skipped is None and previous is not None:
+                if previous[0] == "start":
+                    text.append(previous[1].text or "")
+                else:
+                    text.append(previous[1].tail or "")
+            previous = (event, element)
+            if event == "start":
+                if element.tag == office_text:
+                    body = True
+                elif body and skipped is None and element.tag in ODT_SKIP:
+                    skipped = element
+                elif body and skipped is None and element.tag == odt_tag('text:s'):
+                    text.append(" " * int(element.get(odt_tag('text:c'), 1)))
+                elif body and skipped is None:
+                    text.append(ODT_START.get(element.tag, ""))
+                continue
+            if element.tag == office_text:
+                break
+            if skipped is element:
+                skipped = None
+            elif body and skipped is None:
+                text.append(ODT_END.get(element.tag, ""))
+            # the text of this element and of earlier elements has been added
+            del element[:]
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+    if not body:
+        logger.warning("ODT IMPORT ERROR")
+    return "".join(text)
@@ -3,6 +3,28 @@ from PyQt5.QtCore import Qt
 
 from .information import DialogInformation
 
+
+def case_text_join_sql(rtree, coded_table="code_text"):
+    """ Sql joins of case_text and cases for the coded text rows lying within a
+    case_text segment.
+    rtree is True when the project database has the case_text_rtree interval index
+    (database version 3), see App.case_text_rtree. The R*Tree is then joined first, so
+    each coding looks up its containing segments in the index and case_text rows are
+    found by id. Otherwise case_text is joined with a plain comparison.
+    The exact comparison is always kept as the R*Tree stores 32 bit floats. """
+
+    exact = coded_table + ".fid = case_text.fid "
+    exact += "and " + coded_table + ".pos0 >= case_text.pos0 and " + coded_table + ".pos1 <= case_text.pos1 "
+    cases = "join cases on cases.caseid = case_text.caseid "
+    if not rtree:
+        return "join case_text on " + exact + cases
+    sql = "cross join case_text_rtree on case_text_rtree.fid0 <= " + coded_table + ".fid "
+    sql += "and case_text_rtree.fid1 >= " + coded_table + ".fid "
+    sql += "and case_text_rtree.pos0 <= " + coded_table + ".pos0 and case_text_rtree.pos1 >= " + coded_table + ".pos1 "
+    sql += "cross join case_text on case_text.id = case_text_rtree.id and " + exact
+    return sql + cases
+
+
 class CodedMediaMixin:
     def coded_media(self, data):
         """ Display all coded media for this code.
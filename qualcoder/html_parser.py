@@ -75,9 +75,18 @@ def html_to_text(html):
     Given a piece of HTML, return the plain text it contains.
     This handles entities and char refs, but not javascript and stylesheets.
     """
+    return html_chunks_to_text([html])
+
+
+def html_chunks_to_text(chunks):
+    """
+    Return the plain text of HTML given as an iterable of strings, e.g. a file
+    read in blocks. Each string is fed to the parser as it is read.
+    """
     parser = _HTMLToText()
     try:
-        parser.feed(html)
+        for html in chunks:
+            parser.feed(html)
         parser.close()
     except Exception as e:  # HTMLParseError:
         logger.debug(str(e))
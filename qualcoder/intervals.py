@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (c) 2019 Colin Curtain
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Author: Colin Curtain (ccbogel)
+https://github.com/ccbogel/QualCoder
+'''
+
+
+from bisect import bisect_left, bisect_right, insort
+import heapq
+
+
+class _Node():
+    """ Centred interval tree node. Holds the intervals containing the centre,
+    sorted by start ascending and by end descending. """
+
+    def __init__(self, center):
+        self.center = center
+        self.by_start = []  # (pos0, id, item)
+        self.by_end = []  # (-pos1, id, item)
+        self.left = None
+        self.right = None
+
+
+class IntervalIndex():
+    """ Index of coded segments, dictionaries with 'pos0' and 'pos1' keys, for
+    finding the segments that contain a position. Segments are closed intervals,
+    pos0 <= pos <= pos1, as used by the coding dialogs.
+    Building is O(n log n), a lookup is O(log n + k) for k matches.
+    add and remove update the tree in place, so marking and unmarking a segment
+    does not rebuild the index. """
+
+    def __init__(self, items=None):
+        self.root = None
+        self.count = 0
+        self.build(items or [])
+
+    def build(self, items):
+        """ Replace the index contents with these items. """
+
+        self.count = len(items)
+        self.root = self._build([(int(i['pos0']), int(i['pos1']), i) for i in items])
+
+    def _build(self, intervals):
+        if not intervals:
+            return None
+        ends = sorted(p for interval in intervals for p in interval[0:2])
+        node = _Node(ends[len(ends) // 2])
+        left = []
+        right = []
+        for pos0, pos1, item in intervals:
+            if pos1 < node.center:
+                left.append((pos0, pos1, item))
+            elif pos0 > node.center:
+                right.append((pos0, pos1, item))
+            else:
+                node.by_start.append((pos0, id(item), item))
+                node.by_end.append((-pos1, id(item), item))
+        node.by_start.sort(key=lambda x: x[0:2])
+        node.by_end.sort(key=lambda x: x[0:2])
+        node.left = self._build(left)
+        node.right = self._build(right)
+        return node
+
+    def add(self, item):
+        pos0 = int(item['pos0'])
+        pos1 = int(item['pos1'])
+        self.count += 1
+        if self.root is None:
+            self.root = _Node((pos0 + pos1) // 2)
+        node = self.root
+        while True:
+            if pos1 < node.center:
+                if node.left is None:
+                    node.left = _Node((pos0 + pos1) // 2)
+                node = node.left
+            elif pos0 > node.center:
+                if node.right is None:
+                    node.right = _Node((pos0 + pos1) // 2)
+                node = node.right
+            else:
+                insort(node.by_start, (pos0, id(item), item))
+                insort(node.by_end, (-pos1, id(item), item))
+                return
+
+    def remove(self, item):
+        """ Remove this item, compared by identity. Returns False if it is not indexed. """
+
+        pos0 = int(item['pos0'])
+        pos1 = int(item['pos1'])
+        node = self.root
+        while node is not None:
+            if pos1 < node.center:
+                node = node.left
+            elif pos0 > node.center:
+                node = node.right
+            else:
+                i = bisect_left(node.by_start, (pos0, id(item)))
+                j = bisect_left(node.by_end, (-pos1, id(item)))
+                if i == len(node.by_start) or node.by_start[i][2] is not item:
+                    return False
+                del node.by_start[i]
+                del node.by_end[j]
+                self.count -= 1
+                return True
+        return False
+
+    def at(self, pos):
+        """ Items containing this position, in no particular order. """
+
+        found = []
+        node = self.root
+        while node is not None:
+            if pos < node.center:
+                # all intervals here end at or after the centre
+                for i in range(bisect_right(node.by_start, (pos, float('inf')))):
+                    found.append(node.by_start[i][2])
+                node = node.left
+            elif pos > node.center:
+                # all intervals here start at or before the centre
+                for i in range(bisect_right(node.by_end, (-pos, float('inf')))):
+                    found.append(node.by_end[i][2])
+                node = node.right
+            else:
+                found.extend(x[2] for x in node.by_start)
+                return found
+        return found
+
+    def overlapping(self, pos0, pos1):
+        """ Items sharing at least one position with the closed range pos0 to pos1. """
+
+        found = []
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            if node is None:
+                continue
+            if pos1 < node.center:
+                for i in range(bisect_right(node.by_start, (pos1, float('inf')))):
+                    found.append(node.by_start[i][2])
+                nodes.append(node.left)
+            elif pos0 > node.center:
+                for i in range(bisect_right(node.by_end, (-pos0, float('inf')))):
+                    found.append(node.by_end[i][2])
+                nodes.append(node.right)
+            else:
+                found.extend(x[2] for x in node.by_start)
+                nodes.append(node.left)
+                nodes.append(node.right)
+        return found
+
+    def __len__(self):
+        return self.count
+
+
+def flatten_runs(items, pos0, pos1):
+    """ Split the characters from pos0 up to pos1 into runs of
+    (start, end, item), where item is the segment drawn on top, or None for
+    uncoded text. Segments cover the characters pos0 up to pos1, as a text
+    selection does. Where segments overlap the one starting last is on top,
+    then the shortest, so nested codings stay visible.
+    Adjacent runs with the same item are merged. """
+
+    starts = sorted((max(int(i['pos0']), pos0), n) for n, i in enumerate(items)
+        if int(i['pos1']) > pos0 and int(i['pos0']) < pos1 and int(i['pos1']) > int(i['pos0']))
+    active = []  # heap of (-pos0, pos1, n)
+    runs = []
+    pos = pos0
+    k = 0
+    while pos < pos1:
+        while k < len(starts) and starts[k][0] <= pos:
+            item = items[starts[k][1]]
+            heapq.heappush(active, (-int(item['pos0']), int(item['pos1']), starts[k][1]))
+            k += 1
+        while active and active[0][1] <= pos:
+            heapq.heappop(active)
+        # the top segment only changes when a segment starts or the top one ends
+        end = pos1
+        if k < len(starts):
+            end = min(end, starts[k][0])
+        top = None
+        if active:
+            top = items[active[0][2]]
+            end = min(end, active[0][1])
+        if runs and runs[-1][2] is top and runs[-1][1] == pos:
+            runs[-1] = (runs[-1][0], end, top)
+        else:
+            runs.append((pos, end, top))
+        pos = end
+    return runs
@@ -30,30 +30,18 @@ import logging
 import datetime
 import os
 import platform
+import sqlite3
 import sys
-from shutil import copyfile
-import subprocess
 import traceback
-import zipfile
 
 from PyQt5 import QtCore, QtGui, QtWidgets
-from pdfminer.pdfpage import PDFPage
-from pdfminer.pdfparser import PDFParser
-from pdfminer.pdfdocument import PDFDocument
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from pdfminer.converter import PDFPageAggregator
-from pdfminer.layout import LAParams, LTTextBox, LTTextLine
-
-import ebooklib
-from ebooklib import epub
 
 from .add_item_name import DialogAddItemName
 from .confirm_delete import DialogConfirmDelete
-from .docx import opendocx, getdocumenttext
+from .file_import import ImportWorker, insert_sources, project_folder, remove_copy
 from .GUI.ui_dialog_attribute_type import Ui_Dialog_attribute_type
 from .GUI.ui_dialog_manage_files import Ui_Dialog_manage_files
 from .GUI.ui_dialog_memo import Ui_Dialog_memo  # for manually creating a new file
-from .html_parser import *
 from .memo import DialogMemo
 from .view_image import DialogViewImage
 from .view_av import DialogViewAV
@@ -87,6 +75,8 @@ class DialogManageFiles(QtWidgets.QDialog):
     attribute_names = []  # list of dictionary name:value for additem dialog
     parent_textEdit = None
     dialogList = []
+    import_worker = None
+    import_batch_size = 50
 
     def __init__(self, settings, parent_textEdit):
 
@@ -119,6 +109,7 @@ class DialogManageFiles(QtWidgets.QDialog):
         """
 
         self.source = []
+        self.source_ids = {}
         cur = self.settings['conn'].cursor()
         # very occassionally code_text.seltext can be empty, when codes are unmarked from text
         # so remove these rows
@@ -130,6 +121,7 @@ class DialogManageFiles(QtWidgets.QDialog):
         for row in result:
             self.source.append({'name': row[0], 'id': row[1], 'fulltext': row[2],
             'mediapath': row[3], 'memo': row[4], 'owner': row[5], 'date': row[6]})
+            self.source_ids[row[0]] = row[1]
         # attributes
         self.headerLabels = [_("Name"), _("Memo"), _("Date"), _("Id")]
         sql = "select name from attribute_type where caseOrFile='file'"
@@ -227,11 +219,8 @@ class DialogManageFiles(QtWidgets.QDialog):
 
             # check that no other source file has this text and this is is not empty
             update = True
-            if new_text == "":
+            if new_text == "" or new_text in self.source_ids:
                 update = False
-            for c in self.source:
-                if c['name'] == new_text:
-                    update = False
             # .transcribed suffix is not to be used on a media file
             if new_text[-12:] == ".transcribed" and self.source[x]['mediapath'] is not None:
                 update = False
@@ -247,6 +236,8 @@ class DialogManageFiles(QtWidgets.QDialog):
                     msg += _("it to match the media file before the '.transcribed' suffix")
                     QtWidgets.QMessageBox.warning(None, _("Media name"), msg)
                 # update source list and database
+                del self.source_ids[self.source[x]['name']]
+                self.source_ids[new_text] = self.source[x]['id']
                 self.source[x]['name'] = new_text
                 cur = self.settings['conn'].cursor()
                 cur.execute("update source set name=? where id=?", (new_text, self.source[x]['id']))
@@ -366,7 +357,7 @@ class DialogManageFiles(QtWidgets.QDialog):
                 _("No filename was selected"), QtWidgets.QMessageBox.Ok)
             return
         # check for non-unique filename
-        if any(d['name'] == name for d in self.source):
+        if name in self.source_ids:
             QtWidgets.QMessageBox.warning(None, _('Warning'),
                 _("Filename in use"), QtWidgets.QMessageBox.Ok)
             return
@@ -382,6 +373,8 @@ class DialogManageFiles(QtWidgets.QDialog):
         cur.execute("insert into source(name,fulltext,mediapath,memo,owner,date) values(?,?,?,?,?,?)",
             (entry['name'], entry['fulltext'], entry['mediapath'], entry['memo'], entry['owner'], entry['date']))
         self.settings['conn'].commit()
+        entry['id'] = cur.lastrowid
+        self.source_ids[name] = entry['id']
         self.parent_textEdit.append(_("File created: ") + entry['name'])
         self.source.append(entry)
         self.fill_table()
@@ -394,244 +387,110 @@ class DialogManageFiles(QtWidgets.QDialog):
         Imports images as jpg, jpeg, png, gif which are stored in an images directory.
         Imports audio as mp3, wav which are stored in an audio directory
         Imports video as mp4, mov, ogg, wmv which are stored in a video directory
+        Files are copied and converted in an ImportWorker, with a progress dialog to cancel it.
         """
 
         imports, ok = QtWidgets.QFileDialog.getOpenFileNames(None, _('Open file'),
             self.default_import_directory)
         if not ok or imports == []:
             return
-        known_file_type = False
         nameSplit = imports[0].split("/")
         temp_filename = nameSplit[-1]
         self.default_import_directory = imports[0][0:-len(temp_filename)]
+        names = set()
+        files = []
         for f in imports:
-            # Added process events, in case many large files are imported, which leaves the FileDialog open and covering the screen.
-            QtWidgets.QApplication.processEvents()
             filename = f.split("/")[-1]
-            destination = self.settings['path']
-            if f.split('.')[-1].lower() in ('docx', 'odt', 'txt', 'htm', 'html', 'epub'):
-                destination += "/documents/" + filename
-                copyfile(f, destination)
-                self.load_file_text(f)
-                known_file_type = True
-            if f.split('.')[-1].lower() in ('pdf'):
-                destination += "/documents/" + filename
-                # remove encryption from pdf if possible, for Linux
-                if platform.system() == "Linux":
-                    process = subprocess.Popen(["qpdf", "--decrypt", f, destination],
-                        stdout=subprocess.PIPE)
-                    process.wait()
-                    self.load_file_text(destination)
-                else:
-                    #TODO qpdf decrypt not implemented for windows, OSX
-                    QtWidgets.QMessageBox.warning(None, _('If import error occurs'),
-                    _("Sometimes pdfs are encrypted, download and decrypt using qpdf before trying to load the pdf") + ":\n" + f)
-                    copyfile(f, destination)
-                    self.load_file_text(destination)
-                known_file_type = True
-            if f.split('.')[-1].lower() in ('jpg', 'jpeg', 'png', 'gif'):
-                destination += "/images/" + filename
-                copyfile(f, destination)
-                self.load_media_reference("/images/" + filename)
-                known_file_type = True
-            if f.split('.')[-1].lower() in ('wav', 'mp3'):
-                destination += "/audio/" + filename
-                copyfile(f, destination)
-                self.load_media_reference("/audio/" + filename)
-                known_file_type = True
-            if f.split('.')[-1].lower() in ('mkv', 'mov', 'mp4', 'ogg', 'wmv'):
-                destination += "/video/" + filename
-                copyfile(f, destination)
-                self.load_media_reference("/video/" + filename)
-                known_file_type = True
-            if not known_file_type:
+            if project_folder(f) is None:
                 QtWidgets.QMessageBox.warning(None, _('Unknown file type'),
                     _("Unknown file type for import") + ":\n" + f)
-        self.fill_table()
+                continue
+            # checked before copying, so that the project file is not replaced
+            if filename in self.source_ids or filename in names:
+                QtWidgets.QMessageBox.warning(None, _('Duplicate file'),
+                    _("Duplicate filename.\nFile not imported") + ":\n" + filename)
+                continue
+            names.add(filename)
+            files.append(f)
+        if files == []:
+            return
+        pdfs = [f for f in files if f[-4:].lower() == ".pdf"]
+        if pdfs != [] and platform.system() != "Linux":
+            #TODO qpdf decrypt not implemented for windows, OSX
+            QtWidgets.QMessageBox.warning(None, _('If import error occurs'),
+            _("Sometimes pdfs are encrypted, download and decrypt using qpdf before trying to load the pdf") + ":\n" + "\n".join(pdfs))
+        progress = QtWidgets.QProgressDialog(_("Importing files"), _("Cancel"), 0, len(files), self)
+        progress.setWindowModality(QtCore.Qt.WindowModal)
+        progress.setMinimumDuration(500)
+        self.import_worker = ImportWorker(files, self.settings['path'],
+            self.settings['fast_pdf_import'], self)
+        self.import_worker.imported.connect(lambda f, result: self.file_imported(progress, f, result))
+        progress.canceled.connect(self.import_worker.requestInterruption)
+        self.import_worker.finished.connect(lambda: self.import_finished(progress))
+        self.import_results = []
+        self.import_errors = []
+        self.import_count = 0
+        self.ui.pushButton_import.setEnabled(False)
+        self.import_worker.start()
+
+    def file_imported(self, progress, import_file, result):
+        """ Called from the import worker as each file is copied and converted.
+        Files are written to the database in batches.
+        The progress is updated last, as a modal progress dialog processes events. """
+
+        if result['error'] is not None:
+            self.import_errors.append(import_file + "\n" + result['error'])
+        else:
+            self.import_results.append(result)
+            if len(self.import_results) >= self.import_batch_size:
+                self.write_imported()
+        self.import_count += 1
+        progress.setLabelText(_("Imported: ") + result['name'])
+        progress.setValue(self.import_count)
 
-    def load_media_reference(self, mediapath):
-        """ Load media reference information for audio video images. """
+    def write_imported(self):
+        """ Insert the imported files waiting to be written, in one transaction. """
 
-        # check for duplicated filename and update model, widget and database
-        name_split = mediapath.split("/")
-        filename = name_split[-1]
-        if any(d['name'] == filename for d in self.source):
-            QtWidgets.QMessageBox.warning(None, _('Duplicate file'), _("Duplicate filename.\nFile not imported"))
+        if self.import_results == []:
             return
-        entry = {'name': filename, 'id': -1, 'fulltext': None, 'memo': "", 'mediapath': mediapath,
-        'owner': self.settings['codername'], 'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-        cur = self.settings['conn'].cursor()
-        cur.execute("insert into source(name,memo,owner,date, mediapath, fulltext) values(?,?,?,?,?,?)",
-            (entry['name'], entry['memo'], entry['owner'], entry['date'], entry['mediapath'], entry['fulltext']))
-        self.settings['conn'].commit()
-        cur.execute("select last_insert_rowid()")
-        id_ = cur.fetchone()[0]
-        entry['id'] = id_
-        self.parent_textEdit.append(entry['name'] + _(" imported."))
-        self.source.append(entry)
-
-        # Create an empty transcription file for audio and video
-        if mediapath[:6] in("/audio", "/video"):
-            entry = {'name': filename + ".transcribed", 'id': -1, 'fulltext': "", 'mediapath': None, 'memo': "",
-            'owner': self.settings['codername'], 'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-            cur = self.settings['conn'].cursor()
-            cur.execute("insert into source(name,fulltext,mediapath,memo,owner,date) values(?,?,?,?,?,?)",
-                (entry['name'],  entry['fulltext'], entry['mediapath'], entry['memo'], entry['owner'], entry['date']))
-            self.settings['conn'].commit()
-            cur.execute("select last_insert_rowid()")
-            id_ = cur.fetchone()[0]
-            entry['id'] = id_
+        try:
+            entries = insert_sources(self.settings['conn'], self.import_results, self.settings['codername'])
+        except sqlite3.Error as e:
+            logger.error("Import " + str(e))
+            self.import_errors.append(str(e))
+            self.import_worker.requestInterruption()
+            for result in self.import_results:
+                remove_copy(self.settings['path'], result)
+            entries = []
+        self.import_results = []
+        for entry in entries:
             self.parent_textEdit.append(entry['name'] + _(" imported."))
             self.source.append(entry)
+            self.source_ids[entry['name']] = entry['id']
 
-        # clear and refill table widget
-        for r in self.source:
-            self.ui.tableWidget.removeRow(0)
-        self.fill_table()
-
-    def load_file_text(self, import_file):
-        """ Import from file types of odt, docx pdf, epub, txt, html, htm.
-        """
+    def import_finished(self, progress):
+        """ Write the last imported files and refresh the table once. """
 
-        text = ""
-
-        # Import from odt
-        if import_file[-4:].lower() == ".odt":
-            text = self.convert_odt_to_text(import_file)
-        # Import from docx
-        if import_file[-5:].lower() == ".docx":
-            #text = convert(importFile)  # uses docx_to_html
-            document = opendocx(import_file)
-            list_ = getdocumenttext(document)
-            text = "\n".join(list_)
-        # Import from epub
-        if import_file[-5:].lower() == ".epub":
-            book = epub.read_epub(import_file)
-            for d in book.get_items_of_type(ebooklib.ITEM_DOCUMENT):
-                #print(d.get_content())
-                bytes_ = d.get_body_content()
-                string = bytes_.decode('utf-8')
-                text += html_to_text(string) + "\n"
-        # import PDF
-        if import_file[-4:].lower() == '.pdf':
-            fp = open(import_file, 'rb')  # read binary mode
-            parser = PDFParser(fp)
-            doc = PDFDocument(parser=parser)
-            parser.set_document(doc)
-            # potential error with encrypted PDF
-            rsrcmgr = PDFResourceManager()
-            laparams = LAParams()
-            laparams.char_margin = 1.0
-            laparams.word_margin = 1.0
-            device = PDFPageAggregator(rsrcmgr, laparams=laparams)
-            interpreter = PDFPageInterpreter(rsrcmgr, device)
-            for page in PDFPage.create_pages(doc):
-                interpreter.process_page(page)
-                layout = device.get_result()
-                for lt_obj in layout:
-                    if isinstance(lt_obj, LTTextBox) or isinstance(lt_obj, LTTextLine):
-                        text += lt_obj.get_text()
-        # import from html
-        if import_file[-5:].lower() == ".html" or import_file[-4:].lower() == ".htm":
-            importErrors = 0
-            with open(import_file, "r") as sourcefile:
-                fileText = ""
-                while 1:
-                    line = sourcefile.readline()
-                    if not line:
-                        break
-                    fileText += line
-                text = html_to_text(fileText)
-                QtWidgets.QMessageBox.warning(None, _('Warning'), str(importErrors) + _(" lines not imported"))
-        # Try importing as a plain text file.
-        if text == "":
-            import_errors = 0
-            try:
-                with open(import_file, "r") as sourcefile:
-                    while 1:
-                        line = sourcefile.readline()
-                        if not line:
-                            break
-                        try:
-                            text += line
-                        except Exception as e:
-                            #logger.debug("Importing plain text file, line ignored: " + str(e))
-                            import_errors += 1
-                    if text[0:6] == "\ufeff":  # associated with notepad files
-                        text = text[6:]
-            except Exception as e:
-                QtWidgets.QMessageBox.warning(None, _('Warning'),
-                    _("Cannot import ") + str(import_file) + "\n" + str(e))
-                return
-            if import_errors > 0:
-                QtWidgets.QMessageBox.warning(None, _('Warning'),
-                    str(import_errors) + _(" lines not imported"))
-                logger.warning(import_file + ": " + str(import_errors) + _(" lines not imported"))
-        # import of text file did not work
-        if text == "":
+        self.write_imported()
+        progress.close()
+        if self.import_worker.cancelled:
+            self.parent_textEdit.append(_("Import cancelled"))
+        self.import_worker = None
+        self.ui.pushButton_import.setEnabled(True)
+        self.fill_table()
+        if self.import_errors != []:
             QtWidgets.QMessageBox.warning(None, _('Warning'),
-                _("Cannot import ") + str(import_file) + "\n" + str(e))
-            return
-        # Final checks: check for duplicated filename and update model, widget and database
-        nameSplit = import_file.split("/")
-        filename = nameSplit[-1]
-        if any(d['name'] == filename for d in self.source):
-            QtWidgets.QMessageBox.warning(None, _('Duplicate file'),
-                _("Duplicate filename.\nFile not imported"))
-            return
-        entry = {'name': filename, 'id': -1, 'fulltext': text, 'mediapath': None, 'memo': "",
-        'owner': self.settings['codername'], 'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-        cur = self.settings['conn'].cursor()
-        #logger.debug("type fulltext: " + str(type(entry['fulltext'])))
-        cur.execute("insert into source(name,fulltext,mediapath,memo,owner,date) values(?,?,?,?,?,?)",
-            (entry['name'],  entry['fulltext'], entry['mediapath'], entry['memo'], entry['owner'], entry['date']))
-        self.settings['conn'].commit()
-        cur.execute("select last_insert_rowid()")
-        id_ = cur.fetchone()[0]
-        entry['id'] = id_
-        self.parent_textEdit.append(entry['name'] + _(" imported."))
-        self.source.append(entry)
+                _("Cannot import ") + "\n" + "\n".join(self.import_errors))
+            logger.warning("Import errors: " + " ".join(self.import_errors))
 
-    def convert_odt_to_text(self, import_file):
-        """ Convert odt to very rough equivalent with headings, list items and tables for
-        html display in qTextEdits. """
+    def closeEvent(self, event):
+        """ Finish writing files already being imported before closing. """
 
-        odt_file = zipfile.ZipFile(import_file)
-        data = str(odt_file.read('content.xml'))  # bytes class to string
-        #https://stackoverflow.com/questions/18488734/python3-unescaping-non-ascii-characters
-        data = str(bytes([ord(char) for char in data.encode("utf_8").decode("unicode_escape")]), "utf_8")
-        data_start = data.find("</text:sequence-decls>")
-        data_end = data.find("</office:text>")
-        if data_start == -1 or data_end == -1:
-            logger.warning("ODT IMPORT ERROR")
-            return ""
-        data = data[data_start + 22: data_end]
-        #print(data)
-        data = data.replace('<text:h', '\n<text:h')
-        data = data.replace('</text:h>', '\n\n')
-        data = data.replace('</text:list-item>', '\n')
-        data = data.replace('</text:span>', '')
-        data = data.replace('</text:p>', '\n')
-        data = data.replace('</text:a>', ' ')
-        data = data.replace('</text:list>', '')
-        data = data.replace('<text:list-item>', '')
-        data = data.replace('<table:table table:name=', '\n=== TABLE ===\n<table:table table:name=')
-        data = data.replace('</table:table>', '=== END TABLE ===\n')
-        data = data.replace('</table:table-cell>', '\n')
-        data = data.replace('</table:table-row>', '')
-        data = data.replace('<draw:image', '\n=== IMG ===<draw:image')
-        data = data.replace('</draw:frame>', '\n')
-
-        text = ""
-        tagged = False
-        for i in range(0, len(data)):
-            if data[i: i + 6] == "<text:" or data[i: i + 7] == "<table:" or data[i: i + 6] == "<draw:":
-                tagged = True
-            if not tagged:
-                text += data[i]
-            if data[i] == ">":
-                tagged = False
-        return text
+        if self.import_worker is not None:
+            self.import_worker.requestInterruption()
+            self.import_worker.wait()
+            QtWidgets.QApplication.processEvents()
+        super(DialogManageFiles, self).closeEvent(event)
 
     '''def convert_odt_to_html(self, import_file):
         """ Convert odt to very rough equivalent with headings, list items and tables for
@@ -714,6 +573,8 @@ class DialogManageFiles(QtWidgets.QDialog):
         # delete text source
         if self.source[x]['mediapath'] is None:
             cur.execute("delete from source where id = ?", [fileId])
+            cur.execute("delete from source_page where fid = ?", [fileId])
+            cur.execute("delete from source_hash where id = ?", [fileId])
             cur.execute("delete from code_text where fid = ?", [fileId])
             cur.execute("delete from annotation where fid = ?", [fileId])
             cur.execute("delete from case_text where fid = ?", [fileId])
@@ -729,12 +590,14 @@ class DialogManageFiles(QtWidgets.QDialog):
             except Exception as e:
                 logger.warning(_("Deleting image error: ") + str(e))
             cur.execute("delete from source where id = ?", [fileId])
+            cur.execute("delete from source_hash where id = ?", [fileId])
             cur.execute("delete from code_image where id = ?", [fileId])
             sql = "delete from attribute where attr_type in (select attribute_type.name from "
             sql += "attribute_type where id=? and attribute_type.caseOrFile='file')"
             cur.execute(sql, [fileId])
 
         self.parent_textEdit.append(_("Deleted: ") + self.source[x]['name'])
+        del self.source_ids[self.source[x]['name']]
         for item in self.source:
             if item['id'] == fileId:
                 self.source.remove(item)
@@ -1,7 +1,14 @@
 
+from itertools import islice
+import logging
+
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtCore import Qt, pyqtSignal
 
+from .code_repository import item_key
+
+logger = logging.getLogger(__name__)
+
 class ListObjectModel(QtCore.QAbstractListModel):
     checkstate_changed = pyqtSignal(str,bool)
     def __init__(self,data,key,checkable=False,*args,**kwargs):
@@ -100,3 +107,391 @@ class DictListModel(QtCore.QAbstractListModel):
             self._checkstate[key] = value
             self.checkstate_changed.emit(key,bool(value))
         return True
+
+
+class CodeTreeNode(object):
+    """ One category or code in a CodeTreeModel. Children are only created when the
+    category is first expanded, until then fetched is False. """
+
+    def __init__(self, key, item, parent):
+        self.key = key
+        self.item = item
+        self.parent = parent
+        self.children = []
+        self.fetched = key is None or key.startswith('cid')
+
+    def row(self):
+        return self.parent.children.index(self)
+
+    def category_rows(self):
+        """ Sub-categories are placed before codes. """
+        return sum(1 for child in self.children if child.key.startswith('catid'))
+
+
+class CodeTreeModel(QtCore.QAbstractItemModel):
+    """ Tree of categories and codes, top level items are main categories and unlinked codes.
+    Columns are name, 'catid:n' or 'cid:n' and memo, the same as the tree widgets used to show.
+    The categories and codes come from a CodeRepository. Category children are created on
+    demand through canFetchMore / fetchMore. The repository signals are connected to
+    add_item, item_changed, move_item and remove_item, which emit row insert, move, remove
+    and dataChanged signals, so views sharing the model keep their expanded and selected
+    state. """
+
+    def __init__(self, repository, *args, **kwargs):
+        super(CodeTreeModel, self).__init__(*args, **kwargs)
+        self._icons = {}
+        self.repository = repository
+        self.set_data()
+        repository.item_added.connect(self.add_item)
+        repository.item_changed.connect(self.item_changed)
+        repository.item_moved.connect(self.move_item)
+        repository.item_removed.connect(self.remove_item)
+        repository.data_reset.connect(self.reset_data)
+
+    def set_data(self):
+        # parent keys and not yet fetched children are kept by the model, as the
+        # repository dictionaries are already changed when a signal arrives
+        self._parents = {}
+        self._pending = {None: []}
+        for item in self.repository.categories + self.repository.codes:
+            key = item_key(item)
+            self._parents[key] = self.repository.parent_key(key)
+            self._pending.setdefault(self._parents[key], []).append(key)
+        self._root = CodeTreeNode(None, None, None)
+        self._nodes = {None: self._root}
+        self._create_children(self._root)
+
+    def reset_data(self):
+        """ completly reset data """
+        self.beginResetModel()
+        self.set_data()
+        self.endResetModel()
+
+    def _pending_children(self, key):
+        """ Sub-categories then codes, in list order. """
+        children = self._pending.get(key, [])
+        return [k for k in children if k.startswith('catid')] + [k for k in children if k.startswith('cid')]
+
+    def _create_children(self, node):
+        for child_key in self._pending_children(node.key):
+            if child_key in self._nodes:
+                logger.warning("Category loop at " + child_key)
+                continue
+            self._nodes[child_key] = CodeTreeNode(child_key, self.repository.item(child_key), node)
+            node.children.append(self._nodes[child_key])
+        node.fetched = True
+
+    def _node(self, index):
+        if index.isValid():
+            return index.internalPointer()
+        return self._root
+
+    def _index_for_node(self, node, column=0):
+        if node is self._root:
+            return QtCore.QModelIndex()
+        return self.createIndex(node.row(), column, node)
+
+    def key(self, index):
+        """ The 'catid:n' or 'cid:n' key of an index, None for the root. """
+        return self._node(index).key
+
+    def index_from_key(self, key, column=0):
+        """ Index for a key, fetching the parent categories if needed. """
+
+        if key not in self._parents:
+            return QtCore.QModelIndex()
+        parents = []
+        parent = self._parents[key]
+        while parent is not None and parent not in parents:
+            parents.append(parent)
+            parent = self._parents[parent]
+        for parent in reversed(parents):
+            node = self._nodes.get(parent)
+            if node is not None and not node.fetched:
+                self.fetchMore(self._index_for_node(node))
+        if key not in self._nodes:
+            return QtCore.QModelIndex()
+        return self._index_for_node(self._nodes[key], column)
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, self._node(parent).children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        return self._index_for_node(index.internalPointer().parent)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self._node(parent).children)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 3
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        node = self._node(parent)
+        if node.fetched:
+            return len(node.children) > 0
+        return len(self._pending.get(node.key, [])) > 0
+
+    def canFetchMore(self, parent):
+        node = self._node(parent)
+        return not node.fetched and len(self._pending.get(node.key, [])) > 0
+
+    def fetchMore(self, parent):
+        node = self._node(parent)
+        if node.fetched:
+            return
+        children = self._pending_children(node.key)
+        if len(children) == 0:
+            node.fetched = True
+            return
+        self.beginInsertRows(parent, 0, len(children) - 1)
+        self._create_children(node)
+        self.endInsertRows()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return [_("Name"), _("Id"), _("Memo")][section]
+        return None
+
+    def _icon(self, name):
+        if name not in self._icons:
+            self._icons[name] = QtGui.QIcon("GUI/icon_" + name + ".png")
+        return self._icons[name]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        item = node.item
+        is_code = node.key.startswith('cid')
+        if role == Qt.DisplayRole:
+            if index.column() == 0:
+                return item['name']
+            if index.column() == 1:
+                return node.key
+            if item['memo'] is not None and item['memo'] != "":
+                return _("Memo")
+            return ""
+        if index.column() != 0:
+            return None
+        if role == Qt.DecorationRole:
+            return self._icon("code" if is_code else "cat")
+        elif role == Qt.BackgroundRole and is_code:
+            return QtGui.QBrush(QtGui.QColor(item['color']), Qt.SolidPattern)
+        elif role == Qt.ToolTipRole:
+            return str(item['owner']) + "\n" + str(item['date'])
+        elif role == Qt.UserRole:
+            return node.key
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemIsDropEnabled
+        return Qt.ItemIsSelectable | Qt.ItemIsEnabled | Qt.ItemIsDragEnabled | Qt.ItemIsDropEnabled
+
+    def supportedDropActions(self):
+        return Qt.MoveAction
+
+    def _insert_node(self, key):
+        """ Add a node for key at the end of the categories or codes of its parent,
+        if the parent has been fetched. """
+
+        parent = self._nodes.get(self._parents[key])
+        if parent is None or not parent.fetched:
+            return
+        row = parent.category_rows() if key.startswith('catid') else len(parent.children)
+        self.beginInsertRows(self._index_for_node(parent), row, row)
+        node = CodeTreeNode(key, self.repository.item(key), parent)
+        parent.children.insert(row, node)
+        self._nodes[key] = node
+        self.endInsertRows()
+
+    def _forget_nodes(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            self._nodes.pop(node.key, None)
+            stack.extend(node.children)
+
+    def _remove_node(self, key):
+        node = self._nodes.get(key)
+        if node is None:
+            return
+        row = node.row()
+        self.beginRemoveRows(self._index_for_node(node.parent), row, row)
+        del node.parent.children[row]
+        self._forget_nodes(node)
+        self.endRemoveRows()
+
+    def add_item(self, key):
+        """ A category or code was added to the repository. """
+
+        self._parents[key] = self.repository.parent_key(key)
+        self._pending.setdefault(self._parents[key], []).append(key)
+        self._insert_node(key)
+
+    def item_changed(self, key):
+        """ Name, memo or colour of the item have changed. """
+
+        node = self._nodes.get(key)
+        if node is None:
+            return
+        self.dataChanged.emit(self._index_for_node(node, 0), self._index_for_node(node, 2))
+
+    def move_item(self, key, parent_key):
+        """ A category or code was moved into the category parent_key, None for top level. """
+
+        node = self._nodes.get(key)
+        new_parent = self._nodes.get(parent_key)
+        if new_parent is None or not new_parent.fetched:
+            # not shown in its new place until the category is fetched
+            self._remove_node(key)
+            node = None
+        self._pending[self._parents[key]].remove(key)
+        self._parents[key] = parent_key
+        self._pending.setdefault(parent_key, []).append(key)
+        if new_parent is None or not new_parent.fetched:
+            return
+        if node is None:
+            self._insert_node(key)
+            return
+        row = node.row()
+        new_row = new_parent.category_rows() if key.startswith('catid') else len(new_parent.children)
+        if node.parent is new_parent and new_row == row + 1:
+            # already in place at the end of its group
+            return
+        self.beginMoveRows(self._index_for_node(node.parent), row, row,
+            self._index_for_node(new_parent), new_row)
+        del node.parent.children[row]
+        if node.parent is new_parent and new_row > row:
+            new_row -= 1
+        new_parent.children.insert(new_row, node)
+        node.parent = new_parent
+        self.endMoveRows()
+
+    def remove_item(self, key):
+        """ A category or code was removed from the repository. Any children still
+        under a removed category are moved to the top level. """
+
+        if key not in self._parents:
+            return
+        for child_key in list(self._pending.get(key, [])):
+            self.move_item(child_key, None)
+        self._remove_node(key)
+        self._pending.pop(key, None)
+        self._pending[self._parents[key]].remove(key)
+        del self._parents[key]
+
+
+class ResultListModel(QtCore.QAbstractListModel):
+    """ Coded segments from a report search. Rows are pulled from an iterator of result
+    dictionaries, batch_size at a time, through canFetchMore / fetchMore as the view is
+    scrolled, so the first rows show immediately and only the fetched rows are held.
+    The result dictionary of a row is returned for Qt.UserRole. """
+
+    batch_size = 200
+
+    def __init__(self, results=(), *args, **kwargs):
+        super(ResultListModel, self).__init__(*args, **kwargs)
+        self.rows = []
+        self._results = iter(results)
+        self._exhausted = False
+
+    def reset_data(self, results):
+        """ Replace all rows with a new iterator of results. """
+
+        self.beginResetModel()
+        if hasattr(self._results, 'close'):
+            self._results.close()
+        self.rows = []
+        self._results = iter(results)
+        self._exhausted = False
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return
+        batch = list(islice(self._results, self.batch_size))
+        if len(batch) < self.batch_size:
+            self._exhausted = True
+        if batch == []:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), len(self.rows), len(self.rows) + len(batch) - 1)
+        self.rows.extend(batch)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            text = row['text'] if row['result_type'] != 'image' else row['memo']
+            text = " ".join(text[:200].split())
+            return row['codename'] + " | " + row['file_or_casename'] + " | " + row['coder'] + " | " + text
+        elif role == Qt.ToolTipRole:
+            return row['text'][:1000] if row['result_type'] != 'image' else row['memo']
+        elif role == Qt.DecorationRole:
+            return QtGui.QColor(row['color'])
+        elif role == Qt.UserRole:
+            return row
+        return None
+
+
+class MatrixModel(QtCore.QAbstractTableModel):
+    """ Case by category matrix of report results. Cells show the number of results,
+    the list of result dictionaries of a cell is returned for Qt.UserRole.
+    cells is a dictionary of (row, column) to a list of results, empty cells are left out. """
+
+    def __init__(self, row_labels=(), column_labels=(), cells=None, *args, **kwargs):
+        super(MatrixModel, self).__init__(*args, **kwargs)
+        self.row_labels = list(row_labels)
+        self.column_labels = list(column_labels)
+        self.cells = cells or {}
+
+    def reset_data(self, row_labels, column_labels, cells):
+        self.beginResetModel()
+        self.row_labels = list(row_labels)
+        self.column_labels = list(column_labels)
+        self.cells = cells
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.row_labels)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.column_labels)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        results = self.cells.get((index.row(), index.column()), [])
+        if role == Qt.DisplayRole:
+            return str(len(results)) if results else ""
+        elif role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        elif role == Qt.UserRole:
+            return results
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.column_labels[section]
+        return self.row_labels[section]
@@ -31,7 +31,6 @@ import datetime
 import gettext
 import logging
 import os
-import shutil
 import sys
 import sqlite3
 import traceback
@@ -41,8 +40,10 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 
 from .settings import DialogSettings
 from .attributes import DialogManageAttributes
+from .backup import BackupWorker
 from .cases import DialogCases
 from .codebook import Codebook
+from .code_repository import CodeRepository
 from .code_text import DialogCodeText
 from .dialog_sql import DialogSQL
 from .GUI.ui_main import Ui_MainWindow
@@ -51,8 +52,10 @@ from .information import DialogInformation
 from .journals import DialogJournals
 from .manage_files import DialogManageFiles
 from .memo import DialogMemo
+from .qtmodels import CodeTreeModel
 from .refi import Refi_export, Refi_import
 from .reports import DialogReportCodes, DialogReportCoderComparisons, DialogReportCodeFrequencies
+from .thumbnails import ThumbnailCache
 #from text_mining import DialogTextMining
 from .view_av import DialogCodeAV
 from .view_graph import ViewGraph
@@ -104,11 +107,36 @@ def split_value(intext):
 
 
 class App(object):
-    def __init__(self,conn):
+    def __init__(self,conn,settings=None):
         self.conn = conn
+        self.code_repository = CodeRepository(conn)
         self.codes, self.categories = self.get_data()
         self.model = self.calc_model(self.categories,self.codes)
-        self.settings = self.load_settings()
+        if settings is None:
+            settings = self.load_settings()
+        self.settings = settings
+        self.code_tree_model = None
+        self.thumbnails = None
+        # checked once, as most case queries join through the index when it exists
+        cur = conn.cursor()
+        cur.execute("select count(*) from sqlite_master where name='case_text_rtree'")
+        self.case_text_rtree = cur.fetchone()[0] > 0
+
+    def get_code_tree_model(self):
+        """ Categories and codes tree model shared by the coding dialogs.
+        The model follows the changes made through the code repository. """
+
+        if self.code_tree_model is None:
+            self.code_tree_model = CodeTreeModel(self.code_repository)
+        return self.code_tree_model
+
+    def get_thumbnails(self):
+        """ Cache of cropped and scaled project images shared by the reports, graph and
+        case views. """
+
+        if self.thumbnails is None:
+            self.thumbnails = ThumbnailCache(self.settings['path'])
+        return self.thumbnails
 
     def get_linktypes(self):
         cur = self.conn.cursor()
@@ -120,14 +148,7 @@ class App(object):
         return res
 
     def get_code_names(self):
-        cur = self.conn.cursor()
-        cur.execute("select name, memo, owner, date, cid, catid, color from code_name")
-        result = cur.fetchall()
-        res = []
-        for row in result:
-            res.append({'name': row[0], 'memo': row[1], 'owner': row[2], 'date': row[3],
-            'cid': row[4], 'catid': row[5], 'color': row[6]})
-        return res
+        return self.code_repository.codes
 
     def get_code_name_links(self):
         cur = self.conn.cursor()
@@ -155,22 +176,11 @@ class App(object):
         return self.model[node.name]
 
     def get_data(self):
-        """ Called from init and gets all the codes and categories. """
-        categories = []
-        cur = self.conn.cursor()
-        cur.execute("select name, catid, owner, date, memo, supercatid from code_cat order by name")
-        result = cur.fetchall()
-        for row in result:
-            categories.append({'name': row[0], 'catid': row[1], 'owner': row[2],
-            'date': row[3], 'memo': row[4], 'supercatid': row[5]})
-        code_names = []
-        cur = self.conn.cursor()
-        cur.execute("select name, memo, owner, date, cid, catid, color from code_name")
-        result = cur.fetchall()
-        for row in result:
-            code_names.append({'name': row[0], 'memo': row[1], 'owner': row[2], 'date': row[3],
-            'cid': row[4], 'catid': row[5], 'color': row[6]})
-        return code_names,categories
+        """ Called from init and gets all the codes and categories.
+        These are the cached lists of the code repository, changes to codes and
+        categories are made through the repository. """
+
+        return self.code_repository.codes, self.code_repository.categories
 
     @classmethod
     def load_settings(cls):
@@ -195,11 +205,19 @@ class App(object):
                 settings['backup_av_files'] = True
                 if split_value(txt[8]) == "False":
                     settings['backup_av_files'] = False
+                # added later, so may be missing from the settings file
+                settings['fast_pdf_import'] = False
+                if len(txt) > 9 and split_value(txt[9]) == "True":
+                    settings['fast_pdf_import'] = True
+                settings['backups_kept'] = 5
+                if len(txt) > 10 and split_value(txt[10]).isdigit():
+                    settings['backups_kept'] = int(split_value(txt[10]))
         except:
             f = open(home + '/.qualcoder/QualCoder_settings.txt', 'w')
             text = "codername:default\nfont:Noto Sans\nfontsize:10\ntreefontsize:10\n"
             text += 'directory:' + home
             text += "\nshowIDs:False\nlanguage:en\nbackup_on_open:True\nbackup_av_files:True"
+            text += "\nfast_pdf_import:False\nbackups_kept:5"
             f.write(text)
             f.close()
         return settings
@@ -240,6 +258,61 @@ class App(object):
 
         self.conn.commit()
 
+    def add_indexes(self):
+        """ Database version 3. Add indexes for the coding joins used by the reports
+        and an R*Tree of case text segments, so that finding the case segments
+        containing a coding is an index lookup rather than a scan of case_text.
+        The R*Tree is kept in step with case_text by triggers. Some SQLite builds do
+        not include the rtree module, then only the plain indexes are added. """
+
+        cur = self.conn.cursor()
+        cur.execute("CREATE INDEX IF NOT EXISTS code_text_fid_pos ON code_text(fid, pos0, pos1);")
+        cur.execute("CREATE INDEX IF NOT EXISTS code_text_cid_owner ON code_text(cid, owner);")
+        cur.execute("CREATE INDEX IF NOT EXISTS case_text_fid_pos ON case_text(fid, pos0, pos1);")
+        cur.execute("CREATE INDEX IF NOT EXISTS code_image_id_cid ON code_image(id, cid);")
+        cur.execute("CREATE INDEX IF NOT EXISTS code_av_id_cid ON code_av(id, cid);")
+        cur.execute("CREATE INDEX IF NOT EXISTS attribute_type_name_id ON attribute(attr_type, name, id);")
+        try:
+            # fid is stored as a zero width dimension, so one lookup matches file and positions
+            cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS case_text_rtree USING rtree(id, fid0, fid1, pos0, pos1);")
+        except sqlite3.OperationalError as e:
+            logger.warning("R*Tree not available, case text interval index not created: " + str(e))
+        else:
+            values = "new.id, new.fid, new.fid, min(ifnull(new.pos0, 0), ifnull(new.pos1, 0)), "
+            values += "max(ifnull(new.pos0, 0), ifnull(new.pos1, 0))"
+            cur.execute(("CREATE TRIGGER IF NOT EXISTS case_text_rtree_insert AFTER INSERT ON case_text "
+                "BEGIN INSERT INTO case_text_rtree VALUES(" + values + "); END;"))
+            cur.execute(("CREATE TRIGGER IF NOT EXISTS case_text_rtree_update AFTER UPDATE OF fid, pos0, pos1 ON case_text "
+                "BEGIN INSERT OR REPLACE INTO case_text_rtree VALUES(" + values + "); END;"))
+            cur.execute(("CREATE TRIGGER IF NOT EXISTS case_text_rtree_delete AFTER DELETE ON case_text "
+                "BEGIN DELETE FROM case_text_rtree WHERE id = old.id; END;"))
+            cur.execute("DELETE FROM case_text_rtree")
+            cur.execute(("INSERT INTO case_text_rtree SELECT id, fid, fid, "
+                "min(ifnull(pos0, 0), ifnull(pos1, 0)), max(ifnull(pos0, 0), ifnull(pos1, 0)) from case_text"))
+            self.case_text_rtree = True
+        cur.execute("INSERT INTO project VALUES(?,?,?,?)", ('v3',datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),'','QualCoder'))
+        self.conn.commit()
+
+    def add_source_pages(self):
+        """ Database version 4. Add the source_page table of the character offsets of
+        each page of imported pdfs, so codings can be mapped back to pages. """
+
+        cur = self.conn.cursor()
+        cur.execute(("CREATE TABLE IF NOT EXISTS source_page (fid integer, page integer,"
+            " pos0 integer, pos1 integer, primary key(fid, page));"))
+        cur.execute("INSERT INTO project VALUES(?,?,?,?)", ('v4',datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),'','QualCoder'))
+        self.conn.commit()
+
+    def add_source_hashes(self):
+        """ Database version 5. Add the source_hash table of the sha256 content hash
+        of imported files, to find files with the same content when importing. """
+
+        cur = self.conn.cursor()
+        cur.execute("CREATE TABLE IF NOT EXISTS source_hash (id integer primary key, hash text);")
+        cur.execute("CREATE INDEX IF NOT EXISTS source_hash_hash ON source_hash(hash);")
+        cur.execute("INSERT INTO project VALUES(?,?,?,?)", ('v5',datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),'','QualCoder'))
+        self.conn.commit()
+
     def add_code_name_link(self,linkid,from_cid,to_cid,memo=''):
         item = {
             'linkid': linkid,
@@ -271,9 +344,11 @@ class MainWindow(QtWidgets.QMainWindow):
 
     settings = {"conn": None, "directory": home, "projectName": "", "showIDs": False,
     'path': home, "codername": "default", "font": "Noto Sans", "fontsize": 10,
-    'treefontsize': 10, "language": "en", "backup_on_open": True, "backup_av_files": True}
+    'treefontsize': 10, "language": "en", "backup_on_open": True, "backup_av_files": True,
+    "fast_pdf_import": False, "backups_kept": 5}
     project = {"databaseversion": "", "date": "", "memo": "", "about": ""}
     dialogList = []  # keeps active and track of non-modal windows
+    backup_worker = None
 
     def __init__(self,force_quit=False):
         """ Set up user interface from ui_main.py file. """
@@ -404,7 +479,9 @@ class MainWindow(QtWidgets.QMainWindow):
         msg += _("Show IDs") + ": " + str(self.settings['showIDs']) + "\n"
         msg += _("Language") + ": " + self.settings['language'] + "\n"
         msg += _("Backup on open") + ": " + str(self.settings['backup_on_open']) + "\n"
-        msg += _("Backup AV files") + ": " + str(self.settings['backup_av_files'])
+        msg += _("Backup AV files") + ": " + str(self.settings['backup_av_files']) + "\n"
+        msg += _("Backups kept") + ": " + str(self.settings['backups_kept']) + "\n"
+        msg += _("Fast pdf import") + ": " + str(self.settings['fast_pdf_import'])
         msg += "\n========"
         self.ui.textEdit.append(msg)
 
@@ -421,7 +498,7 @@ class MainWindow(QtWidgets.QMainWindow):
         NOT CURRENTLY IMPLEMENTED, FOR FUTURE EXPANSION.
         '''
 
-        ui = DialogTextMining(self.settings, self.ui.textEdit)
+        ui = DialogTextMining(self.app, self.ui.textEdit)
         ui.show()"""
 
     def report_coding_comparison(self):
@@ -449,7 +526,7 @@ class MainWindow(QtWidgets.QMainWindow):
     def report_coding(self):
         """ Report on coding and categories. """
 
-        ui = DialogReportCodes(self.settings, self.ui.textEdit)
+        ui = DialogReportCodes(self.app, self.ui.textEdit)
         self.dialogList.append(ui)
         ui.show()
         self.clean_dialog_refs()
@@ -505,7 +582,7 @@ class MainWindow(QtWidgets.QMainWindow):
         for d in self.dialogList:
             if type(d).__name__ == "DialogCases":
                 return
-        ui = DialogCases(self.settings, self.ui.textEdit)
+        ui = DialogCases(self.app, self.ui.textEdit)
         self.dialogList.append(ui)
         ui.show()
         self.clean_dialog_refs()
@@ -549,7 +626,7 @@ class MainWindow(QtWidgets.QMainWindow):
         """ Create edit and delete codes. Apply and remove codes to the image (or regions)
         """
 
-        ui = DialogCodeImage(self.settings, self.ui.textEdit)
+        ui = DialogCodeImage(self.app, self.ui.textEdit)
         ui.setAttribute(QtCore.Qt.WA_DeleteOnClose)
         self.dialogList.append(ui)
         ui.show()
@@ -560,7 +637,7 @@ class MainWindow(QtWidgets.QMainWindow):
         audio or video file. Added try block in case VLC bindings do not work. """
 
         try:
-            ui = DialogCodeAV(self.settings, self.ui.textEdit)
+            ui = DialogCodeAV(self.app, self.ui.textEdit)
             ui.setAttribute(QtCore.Qt.WA_DeleteOnClose)
             self.dialogList.append(ui)
             ui.show()
@@ -574,7 +651,7 @@ class MainWindow(QtWidgets.QMainWindow):
         """ Export a text file code book of categories and codes.
         """
 
-        Codebook(self.settings, self.ui.textEdit)
+        Codebook(self.app, self.ui.textEdit)
 
     def REFI_project_export(self):
         """ Export the project as a qpdx zipped folder.
@@ -600,6 +677,7 @@ class MainWindow(QtWidgets.QMainWindow):
          """
 
         Refi_import(self.settings, self.ui.textEdit, "qdc")
+        self.app.code_repository.load()
 
     def REFI_project_import(self):
         """ Import a qpdx QDA project into a new project space.
@@ -613,6 +691,7 @@ class MainWindow(QtWidgets.QMainWindow):
             QtWidgets.QMessageBox.warning(None, "Project creation", "Project not successfully created")
             return
         Refi_import(self.settings, self.ui.textEdit, "qdpx")
+        self.app.code_repository.load()
         msg = "NOT FULLY TESTED - EXPERIMENTAL\n"
         msg += "Text code positions do not line up with some imports.\n"
         msg += "Images, audio, video, transcripts not tested.\n"
@@ -631,6 +710,7 @@ class MainWindow(QtWidgets.QMainWindow):
             reply = QtWidgets.QMessageBox.question(self, 'Message', quit_msg,
             QtWidgets.QMessageBox.Yes, QtWidgets.QMessageBox.No)
             if reply == QtWidgets.QMessageBox.Yes:
+                self.stop_backup()
                 self.dialogList = None
                 if self.settings['conn'] is not None:
                     try:
@@ -644,6 +724,8 @@ class MainWindow(QtWidgets.QMainWindow):
                 return
             else:
                 event.ignore()
+        else:
+            self.stop_backup()
 
  
 
@@ -678,7 +760,6 @@ class MainWindow(QtWidgets.QMainWindow):
         self.settings['directory'] = self.settings['path'].rpartition('/')[0]
         #try:
         self.settings['conn'] = sqlite3.connect(self.settings['path'] + "/data.qda")
-        self.app = App(self.settings['conn'])
         cur = self.settings['conn'].cursor()
         cur.execute("CREATE TABLE project (databaseversion text, date text, memo text,about text);")
         cur.execute("CREATE TABLE source (id integer primary key, name text, fulltext text, mediapath text, memo text, owner text, date text, unique(name));")
@@ -695,7 +776,11 @@ class MainWindow(QtWidgets.QMainWindow):
         cur.execute("CREATE TABLE journal (jid integer primary key, name text, jentry text, date text, owner text);")
         cur.execute("INSERT INTO project VALUES(?,?,?,?)", ('v1',datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),'','QualCoder'))
         self.settings['conn'].commit()
+        self.app = App(self.settings['conn'], self.settings)
         self.app.add_relations_table()
+        self.app.add_indexes()
+        self.app.add_source_pages()
+        self.app.add_source_hashes()
         try:
             # get and display some project details
             self.ui.textEdit.append("\n" + _("New project: ") + self.settings['path'] + _(" created."))
@@ -770,7 +855,7 @@ class MainWindow(QtWidgets.QMainWindow):
             msg = ""
             try:
                 self.settings['conn'] = sqlite3.connect(self.settings['path'] + "/data.qda")
-                self.app = App(self.settings['conn'])
+                self.app = App(self.settings['conn'], self.settings)
             except Exception as e:
                 self.settings['conn'] = None
                 msg += str(e)
@@ -793,19 +878,18 @@ class MainWindow(QtWidgets.QMainWindow):
         self.project['memo'] = result[2]
         self.project['about'] = result[3]
 
-        if int(self.project['databaseversion'][1:]) < 2:
+        version = int(self.project['databaseversion'][1:])
+        if version < 2:
             self.app.add_relations_table()
-
-        # Save a datetime stamped backup
-        if self.settings['backup_on_open'] is True:
-            nowdate = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            backup = self.settings['path'][0:-4] + "_BACKUP_" + nowdate + ".qda"
-            if self.settings['backup_av_files'] is True:
-                shutil.copytree(self.settings['path'], backup)
-            else:
-                shutil.copytree(self.settings['path'], backup, ignore=shutil.ignore_patterns('*.mp3','*.wav','*.mp4', '*.mov','*.ogg','*.wmv','*.MP3','*.WAV','*.MP4', '*.MOV','*.OGG','*.WMV'))
-                self.ui.textEdit.append(_("WARNING: audio and video files NOT backed up. See settings."))
-            self.ui.textEdit.append(_("Project backup created: ") + backup)
+        if version < 3:
+            self.app.add_indexes()
+            self.project['databaseversion'] = "v3"
+        if version < 4:
+            self.app.add_source_pages()
+            self.project['databaseversion'] = "v4"
+        if version < 5:
+            self.app.add_source_hashes()
+            self.project['databaseversion'] = "v5"
 
         self.ui.textEdit.append(_("Project Opened: ") + self.settings['projectName']
             + "\n========\n"
@@ -822,9 +906,38 @@ class MainWindow(QtWidgets.QMainWindow):
         cur.execute('delete from code_text where length(seltext)=0')
         self.settings['conn'].commit()
 
+        # Save a datetime stamped backup in the background, the project can be used meanwhile
+        if self.settings['backup_on_open'] is True:
+            if self.settings['backup_av_files'] is not True:
+                self.ui.textEdit.append(_("WARNING: audio and video files NOT backed up. See settings."))
+            self.backup_worker = BackupWorker(self.settings['path'], self.settings['backup_av_files'],
+                self.settings['backups_kept'], self)
+            self.backup_worker.saved.connect(self.backup_saved)
+            self.backup_worker.start()
+
+    def backup_saved(self, backup, error):
+        """ Report the end of the project backup started on opening the project. """
+
+        if error != "":
+            self.ui.textEdit.append(_("Project backup error: ") + error)
+        elif backup == "":
+            self.ui.textEdit.append(_("Project backup cancelled"))
+        else:
+            self.ui.textEdit.append(_("Project backup created: ") + backup)
+
+    def stop_backup(self):
+        """ Cancel the project backup if it is still running, and wait for it to stop.
+        The partial backup is removed. """
+
+        if self.backup_worker is not None:
+            self.backup_worker.requestInterruption()
+            self.backup_worker.wait()
+            self.backup_worker = None
+
     def close_project(self):
         """ Close an open project. """
 
+        self.stop_backup()
         self.ui.textEdit.append("Closing project: " + self.settings['projectName'] + "\n========\n")
         try:
             self.settings['conn'].commit()
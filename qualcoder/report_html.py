@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (c) 2019 Colin Curtain
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Author: Colin Curtain (ccbogel)
+https://github.com/ccbogel/QualCoder
+'''
+
+
+import base64
+import hashlib
+import html
+import logging
+import os
+import shutil
+from string import Template
+from urllib.parse import quote
+
+from PyQt5 import QtCore
+
+logger = logging.getLogger(__name__)
+
+PAGE_START = Template('''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+<style>
+.heading {font-style: italic; margin-bottom: 0;}
+.text {white-space: pre-wrap; margin-top: 0.2em;}
+</style>
+</head>
+<body>
+<h1>$title</h1>
+<p class="text">$header</p>
+''')
+HEADING = Template('<p class="heading"><span style="background-color:$color">$codename</span>, '
+    '$file_or_case: $file_or_casename, $coder</p>\n')
+TEXT = Template('<p class="text">$text</p>\n')
+IMAGE = Template('<p><img src="$src" width="$width" height="$height" alt="$codename"></p>\n')
+AV = Template('<p class="text">$avtext</p>\n<$mediatype controls>'
+    '<source src="$src#t=$av0,$av1" type="$mediatype/$extension"></$mediatype>\n')
+MEMO = Template('<p class="text">Memo: $memo</p>\n')
+PAGE_END = '</body>\n</html>\n'
+
+
+def link_or_copy(source, destination):
+    """ Hard link the file, so large media is not copied. Copies when the files are on
+    different file systems, or hard links are not supported. """
+
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class HtmlReport():
+    """ Writes report results as a html file, from the result dictionaries of
+    DialogReportCodes, one result at a time.
+    Image areas are written once for each distinct image content, named by their hash,
+    into a folder named after the html file, or inlined as base64 data. Audio and video
+    files are hard linked into the folder when possible, otherwise copied. """
+
+    def __init__(self, filename, project_path, thumbnails, inline_images=False):
+        self.filename = filename
+        self.project_path = project_path
+        self.thumbnails = thumbnails
+        self.inline_images = inline_images
+        self.folder = os.path.splitext(filename)[0]
+        self.folder_name = os.path.basename(self.folder)
+        self.links = {}  # image hash or mediapath: link
+
+    def write(self, title, header, results):
+        """ Write the html file. Returns the number of results written. """
+
+        count = 0
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            f.write(PAGE_START.substitute(title=html.escape(title), header=html.escape(header)))
+            for result in results:
+                f.write(self.result_html(result))
+                count += 1
+            f.write(PAGE_END)
+        return count
+
+    def result_html(self, result):
+        """ Html for the heading and coded text, image area or a/v segment of a result. """
+
+        text = HEADING.substitute(color=html.escape(result['color'] or ""),
+            codename=html.escape(result['codename']), file_or_case=html.escape(result['file_or_case']),
+            file_or_casename=html.escape(result['file_or_casename']), coder=html.escape(result['coder']))
+        if result['result_type'] == 'text':
+            return text + TEXT.substitute(text=html.escape(result['text']))
+        if result['result_type'] == 'image':
+            # the full resolution area is exported, shown at most 300 wide or high
+            image = self.thumbnails.crop(result['mediapath'],
+                (result['x1'], result['y1'], result['width'], result['height']))
+            size = self.thumbnails.fit(image, 300)
+            text += IMAGE.substitute(src=self.image_link(image), width=size.width(),
+                height=size.height(), codename=html.escape(result['codename']))
+        else:
+            mediapath = result['mediapath'] or ""
+            text += AV.substitute(avtext=html.escape(result['avtext']), mediatype=mediapath[1:6],
+                src=self.media_link(mediapath), av0=result['av0'], av1=result['av1'],
+                extension=html.escape(mediapath[mediapath.rfind('.') + 1:]))
+        if result['memo'] != "":
+            text += MEMO.substitute(memo=html.escape(result['memo']))
+        return text
+
+    def image_link(self, image):
+        """ Link to the png of the image, written the first time its content is seen,
+        or the png as base64 data. """
+
+        data = QtCore.QByteArray()
+        buffer = QtCore.QBuffer(data)
+        buffer.open(QtCore.QIODevice.WriteOnly)
+        image.save(buffer, "PNG")
+        data = bytes(data)
+        if self.inline_images:
+            return "data:image/png;base64," + base64.b64encode(data).decode('ascii')
+        digest = hashlib.sha1(data).hexdigest()
+        link = self.links.get(digest)
+        if link is None:
+            name = digest[:16] + ".png"
+            os.makedirs(os.path.join(self.folder, "images"), exist_ok=True)
+            with open(os.path.join(self.folder, "images", name), 'wb') as f:
+                f.write(data)
+            link = quote(self.folder_name + "/images/" + name)
+            self.links[digest] = link
+        return link
+
+    def media_link(self, mediapath):
+        """ Link to the audio or video file in the report folder, which is linked or
+        copied there the first time it is used. """
+
+        link = self.links.get(mediapath)
+        if link is None:
+            destination = self.folder + mediapath
+            if not os.path.isfile(destination):
+                try:
+                    os.makedirs(os.path.dirname(destination), exist_ok=True)
+                    link_or_copy(self.project_path + mediapath, destination)
+                except OSError as e:
+                    logger.warning("Media file not added to html report: " + str(e))
+            link = quote(self.folder_name + mediapath)
+            self.links[mediapath] = link
+        return link
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (c) 2019 Colin Curtain
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Author: Colin Curtain (ccbogel)
+https://github.com/ccbogel/QualCoder
+'''
+
+
+import itertools
+import logging
+
+from .helpers import case_text_join_sql
+
+logger = logging.getLogger(__name__)
+
+OPERATORS = ('<', '>', '<=', '>=', '==', '!=', 'in', 'not in', 'between', 'like')
+
+# columns of the saved results of a query, see CodingQuery.sql
+RESULT_COLUMNS = ('result_type', 'codename', 'color', 'name', 'fid', 'owner', 'pos0', 'pos1',
+    'x1', 'y1', 'width', 'height', 'text', 'mediapath')
+
+# coded table: (result type, file id column, position columns, image area columns, text column)
+CODED_TABLES = {
+    'code_text': ('text', 'fid', ('pos0', 'pos1'), None, 'seltext'),
+    'code_image': ('image', 'id', None, ('x1', 'y1', 'width', 'height'), 'memo'),
+    'code_av': ('av', 'id', ('pos0', 'pos1'), None, 'memo'),
+}
+
+
+def attribute_sql(attribute):
+    """ Sql and parameters to select the ids of the files or cases matching one
+    attribute parameter from DialogSelectAttributeParameters:
+    [name, 'file' or 'case', value type, operator, list of values].
+    Numeric attribute values are compared as real numbers. """
+
+    name, file_or_case, value_type, operator, values = attribute
+    if operator not in OPERATORS:
+        raise ValueError("Unknown attribute operator: " + operator)
+    value = "attribute.value"
+    if value_type == 'numeric':
+        value = "cast(attribute.value as real)"
+        values = [float(v) for v in values]
+    sql = "select id from attribute where attribute.name=? and attribute.attr_type=? "
+    sql += "and " + value + " " + operator
+    if operator in ('in', 'not in'):
+        sql += " (" + ",".join("?" * len(values)) + ")"
+    elif operator == 'between':
+        sql += " ? and ?"
+        values = values[:2]
+    else:
+        sql += " ?"
+        values = values[:1]
+    return sql, [name, file_or_case] + list(values)
+
+
+class CodingQuery():
+    """ Composes one parameterised UNION ALL query over coded text, images and
+    audio/video for a report search.
+    The selected code, file and case ids are put into temporary tables, so the sql text
+    is the same however many ids are selected. SQLite can then reuse the statement and
+    large selections do not run into sql length limits.
+    Each CodingQuery has its own numbered temporary tables, as several report dialogs
+    can share the connection. save_results copies the results into another of them,
+    so the results of a search do not change while they are read or exported.
+    Call drop to remove them when the query is not needed. """
+
+    numbers = itertools.count(1)
+
+    def __init__(self, app, cids, coder="", search_text=""):
+        self.conn = app.conn
+        self.rtree = app.case_text_rtree
+        self.coder = coder
+        self.search_text = search_text
+        self.by_file = False
+        self.by_case = False
+        self.prefix = "report_" + str(next(CodingQuery.numbers)) + "_"
+        self.tables = set()
+        self.fill_ids('cid', cids)
+
+    def table(self, name):
+        """ Name of one of the temporary tables of this query: cid, fid, caseid or results. """
+
+        return "temp." + self.prefix + name
+
+    def create_table(self, name):
+        """ Create or empty one of the temporary id tables. """
+
+        cur = self.conn.cursor()
+        cur.execute("create temp table if not exists " + self.prefix + name + " (id integer primary key)")
+        cur.execute("delete from " + self.table(name))
+        self.tables.add(name)
+
+    def fill_ids(self, name, ids):
+        """ Replace the ids in a temporary table. """
+
+        self.create_table(name)
+        cur = self.conn.cursor()
+        cur.executemany("insert or ignore into " + self.table(name) + " values(?)", [(i,) for i in ids])
+        self.conn.commit()
+
+    def fill_ids_from_attributes(self, name, attributes):
+        """ Replace the ids in a temporary table with the files or cases matching
+        all of the attribute parameters. """
+
+        selects = [attribute_sql(a) for a in attributes]
+        sql = " intersect ".join(s[0] for s in selects)
+        parameters = [p for s in selects for p in s[1]]
+        self.create_table(name)
+        cur = self.conn.cursor()
+        cur.execute("insert or ignore into " + self.table(name) + " " + sql, parameters)
+        self.conn.commit()
+
+    def save_results(self):
+        """ Run the query into the results table. The id tables are then dropped. """
+
+        cur = self.conn.cursor()
+        cur.execute("create temp table " + self.prefix + "results (" + ", ".join(RESULT_COLUMNS) + ")")
+        sql, parameters = self.sql()
+        cur.execute("insert into " + self.table('results') + " " + sql, parameters)
+        self.conn.commit()
+        self.drop()
+        self.tables.add('results')
+
+    def results(self, batch_size=1000):
+        """ Yield the saved result rows in order. Rows are read batch_size at a time,
+        after the last row read, so no statement stays open between batches. """
+
+        cur = self.conn.cursor()
+        last = 0
+        while True:
+            cur.execute("select rowid, * from " + self.table('results') + " where rowid > ? order by rowid limit ?",
+                (last, batch_size))
+            rows = cur.fetchall()
+            if rows == []:
+                return
+            last = rows[-1][0]
+            for row in rows:
+                yield row[1:]
+
+    def drop(self):
+        """ Drop the temporary tables of this query. """
+
+        cur = self.conn.cursor()
+        for name in self.tables:
+            cur.execute("drop table if exists " + self.table(name))
+        self.conn.commit()
+        self.tables = set()
+
+    def select_files(self, fids):
+        """ Limit results to codings in these files. """
+
+        self.fill_ids('fid', fids)
+        self.by_file = True
+
+    def select_cases(self, caseids):
+        """ Limit results to codings in these cases. Results are named by case. """
+
+        self.fill_ids('caseid', caseids)
+        self.by_case = True
+
+    def select_attributes(self, attributes):
+        """ Limit results to codings in files and cases matching all of the attribute
+        parameters. When there are case attributes, results are named by case. """
+
+        file_attributes = [a for a in attributes if a[1] == 'file']
+        case_attributes = [a for a in attributes if a[1] != 'file']
+        if file_attributes != []:
+            self.fill_ids_from_attributes('fid', file_attributes)
+            self.by_file = True
+        if case_attributes != []:
+            self.fill_ids_from_attributes('caseid', case_attributes)
+            self.by_case = True
+
+    def table_sql(self, table):
+        """ Select statement and parameters for one of the coded tables. """
+
+        result_type, fid, positions, area, text = CODED_TABLES[table]
+        fid = table + "." + fid
+        sql = "select '" + result_type + "', code_name.name, code_name.color, "
+        if self.by_case:
+            sql += "cases.name, "
+        else:
+            sql += "source.name, "
+        sql += fid + ", " + table + ".owner, "
+        if positions is None:
+            sql += "null, null, "
+        else:
+            sql += table + "." + positions[0] + ", " + table + "." + positions[1] + ", "
+        if area is None:
+            sql += "null, null, null, null, "
+        else:
+            sql += ", ".join(table + "." + column for column in area) + ", "
+        sql += table + "." + text + ", source.mediapath from " + table + " "
+        sql += "join code_name on code_name.cid = " + table + ".cid "
+        if self.by_case:
+            if table == 'code_text':
+                sql += case_text_join_sql(self.rtree)
+            else:
+                sql += "join (case_text join cases on cases.caseid = case_text.caseid) on "
+                sql += fid + " = case_text.fid "
+        sql += "join source on source.id = " + fid + " "
+        sql += "where " + table + ".cid in (select id from " + self.table('cid') + ") "
+        if self.by_file:
+            sql += "and " + fid + " in (select id from " + self.table('fid') + ") "
+        if self.by_case:
+            sql += "and case_text.caseid in (select id from " + self.table('caseid') + ") "
+        parameters = []
+        if self.coder != "":
+            sql += "and " + table + ".owner=? "
+            parameters.append(self.coder)
+        if self.search_text != "":
+            sql += "and " + table + "." + text + " like ? "
+            parameters.append("%" + self.search_text + "%")
+        return sql, parameters
+
+    def sql(self):
+        """ The query for coded text, then images, then audio/video, and its parameters.
+        Columns are: result type ('text', 'image' or 'av'), code name, color,
+        file or case name, file id, coder, pos0, pos1, x1, y1, width, height,
+        coded text or memo, mediapath. """
+
+        selects = [self.table_sql(table) for table in ('code_text', 'code_image', 'code_av')]
+        sql = "union all ".join(s[0] for s in selects)
+        parameters = [p for s in selects for p in s[1]]
+        logger.debug(sql)
+        return sql, parameters
@@ -26,22 +26,26 @@ https://github.com/ccbogel/QualCoder
 https://qualcoder.wordpress.com/
 '''
 
-from copy import copy
 import csv
+from itertools import zip_longest
 import logging
 import os
-from shutil import copyfile
+import sqlite3
 import sys
 import traceback
 
 from PyQt5 import QtGui, QtWidgets, QtCore
-from PyQt5.QtCore import Qt,QTextCodec
-from PyQt5.QtGui import QBrush
+from PyQt5.QtCore import Qt
 
 from .GUI.ui_dialog_report_codings import Ui_Dialog_reportCodings
 from .GUI.ui_dialog_report_comparisons import Ui_Dialog_reportComparisons
 from .GUI.ui_dialog_report_code_frequencies import Ui_Dialog_reportCodeFrequencies
+from .agreement import coder_agreement
+from .code_tree import fill_code_tree, CODE_DRAG_FLAGS
+from .qtmodels import MatrixModel, ResultListModel
 from .report_attributes import DialogSelectAttributeParameters
+from .report_html import HtmlReport
+from .report_query import CodingQuery
 from .select_file import DialogSelectFile
 
 path = os.path.abspath(os.path.dirname(__file__))
@@ -60,14 +64,14 @@ def exception_handler(exception_type, value, tb_obj):
 
 class DialogReportCodeFrequencies(QtWidgets.QDialog):
     """ Show code and category frequencies, overall and for each coder.
-    This is for text coding and image coding. """
+    This is for text coding, image coding and audio/video coding. """
 
     settings = None
     parent_textEdit = None
     coders = []
     categories = []
     codes = []
-    coded_images_and_text = []
+    coded_frequencies = {}
 
     def __init__(self, settings, parent_textEdit):
 
@@ -89,16 +93,16 @@ class DialogReportCodeFrequencies(QtWidgets.QDialog):
 
     def get_data(self):
         """ Called from init. gets coders, code_names and categories.
-        Calls calculate_code_frequency - for each code.
         Adds a list item that is ready to be used by the treeWidget to display multiple
         columns with the coder frequencies.
+        The codings are counted in the database, grouped by code and coder, across
+        text, image and audio/video codings.
         """
 
         cur = self.settings['conn'].cursor()
         self.coders = []
-        cur.execute("select distinct owner from code_text union select distinct owner from code_image")
+        cur.execute("select owner from code_text union select owner from code_image union select owner from code_av")
         result = cur.fetchall()
-        self.coders = []
         for row in result:
             self.coders.append(row[0])
         self.categories = []
@@ -115,67 +119,62 @@ class DialogReportCodeFrequencies(QtWidgets.QDialog):
             self.codes.append({'name': row[0], 'memo': row[1], 'owner': row[2], 'date': row[3],
             'cid': row[4], 'catid': row[5], 'color': row[6],
             'display_list': [row[0], 'cid:' + str(row[4])]})
-        self.coded_images_and_text = []
-        cur.execute("select cid, owner from code_text")
-        result = cur.fetchall()
-        for row in result:
-            self.coded_images_and_text.append(row)
-        cur.execute("select cid, owner from code_image")
-        result = cur.fetchall()
-        for row in result:
-            self.coded_images_and_text.append(row)
+        self.coded_frequencies = {}
+        sql = "select cid, owner, count(*) from (select cid, owner from code_text "
+        sql += "union all select cid, owner from code_image "
+        sql += "union all select cid, owner from code_av) group by cid, owner"
+        cur.execute(sql)
+        for row in cur.fetchall():
+            self.coded_frequencies[(row[0], row[1])] = row[2]
 
     def calculate_code_frequencies(self):
         """ Calculate the frequency of each code for all coders and the total.
         Add a list item to each code that can be used to display in treeWidget.
-        For codings in code_image, code_text.
+        For codings in code_image, code_text and code_av.
+        Category counts are the sum of the codes directly under the category plus the
+        sums of its sub-categories, filled in by one post-order pass over the category tree.
         """
 
+        ncols = len(self.coders) + 1
+        for c in self.codes:
+            counts = [self.coded_frequencies.get((c['cid'], coder), 0) for coder in self.coders]
+            counts.append(sum(counts))
+            c['display_list'].extend(counts)
+
+        cat_counts = {}
+        for cat in self.categories:
+            cat_counts[cat['catid']] = [0] * ncols
         for c in self.codes:
-            total = 0
-            for cn in self.coders:
-                count = 0
-                for cit in self.coded_images_and_text:
-                    if cit[1] == cn and cit[0] == c['cid']:
-                        count += 1
-                        total += 1
-                c['display_list'].append(count)
-            c['display_list'].append(total)
-
-        # add the number of codes directly under each category to the category
+            if c['catid'] in cat_counts:
+                totals = cat_counts[c['catid']]
+                for i in range(ncols):
+                    totals[i] += c['display_list'][2 + i]
+
+        sub_categories = {}
         for cat in self.categories:
-            # magic 3 = cat name, cat id and total columns
-            cat_list = [0] * (len(self.coders) + 3)
-            for c in self.codes:
-                if c['catid'] == cat['catid']:
-                    for i in range(2, len(c['display_list'])):
-                        cat_list[i] += c['display_list'][i]
-            cat_list = cat_list[2:]
-            for count in cat_list:
-                cat['display_list'].append(count)
-
-        # find leaf categories, add to above categories, and gradually remove leaves
-        # until only top categories are left
-        sub_cats = copy(self.categories)
-        counter = 0
-        while len(sub_cats) > 0 or counter < 10000:
-            leaf_list = []
-            branch_list = []
-            for c in sub_cats:
-                for c2 in sub_cats:
-                    if c['catid'] == c2['supercatid']:
-                        branch_list.append(c)
-            for cat in sub_cats:
-                if cat not in branch_list:
-                    leaf_list.append(cat)
-            # add totals for each coder and overall total to higher category
-            for leaf_cat in leaf_list:
-                for cat in self.categories:
-                    if cat['catid'] == leaf_cat['supercatid']:
-                        for i in range(2, len(cat['display_list'])):
-                            cat['display_list'][i] += leaf_cat['display_list'][i]
-                sub_cats.remove(leaf_cat)
-            counter += 1
+            sub_categories.setdefault(cat['supercatid'], []).append(cat['catid'])
+        # iterative post-order: a category is totalled after all its sub-categories
+        visited = set()
+        for top in sub_categories.get(None, []) + list(cat_counts):
+            if top in visited:
+                continue
+            stack = [(top, False)]
+            while stack:
+                catid, children_done = stack.pop()
+                if children_done:
+                    for sub_catid in sub_categories.get(catid, []):
+                        for i in range(ncols):
+                            cat_counts[catid][i] += cat_counts[sub_catid][i]
+                    continue
+                if catid in visited:
+                    continue
+                visited.add(catid)
+                stack.append((catid, True))
+                for sub_catid in sub_categories.get(catid, []):
+                    if sub_catid not in visited:
+                        stack.append((sub_catid, False))
+        for cat in self.categories:
+            cat['display_list'].extend(cat_counts[cat['catid']])
 
     def depthgauge(self, item):
         """ Get depth for treewidget item. """
@@ -227,8 +226,6 @@ class DialogReportCodeFrequencies(QtWidgets.QDialog):
     def fill_tree(self):
         """ Fill tree widget, top level items are main categories and unlinked codes. """
 
-        cats = copy(self.categories)
-        codes = copy(self.codes)
         self.ui.treeWidget.clear()
         header = [_("Code Tree"), "Id"]
         for coder in self.coders:
@@ -238,89 +235,15 @@ class DialogReportCodeFrequencies(QtWidgets.QDialog):
         self.ui.treeWidget.setHeaderLabels(header)
         self.ui.treeWidget.header().setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
         self.ui.treeWidget.header().setStretchLastSection(False)
-        # add top level categories
-        remove_list = []
-        for c in cats:
-            if c['supercatid'] is None:
-                display_list = []
-                for i in c['display_list']:
-                    display_list.append(str(i))
-                top_item = QtWidgets.QTreeWidgetItem(display_list)
-                top_item.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-                self.ui.treeWidget.addTopLevelItem(top_item)
-                remove_list.append(c)
-        for item in remove_list:
-            #try:
-            cats.remove(item)
-            #except Exception as e:
-            #    logger.debug(str(e) + " item:" + str(item))
-
-        ''' Add child categories. Look at each unmatched category, iterate through tree to
-        add as child then remove matched categories from the list. '''
-        count = 0
-        while len(cats) > 0 or count < 10000:
-            remove_list = []
-            #logger.debug("cats:" + str(cats))
-            for c in cats:
-                it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
-                item = it.value()
-                while item:  # while there is an item in the list
-                    #logger.debug("While: ", item.text(0), item.text(1), c['catid'], c['supercatid'])
-                    if item.text(1) == 'catid:' + str(c['supercatid']):
-                        display_list = []
-                        for i in c['display_list']:
-                            display_list.append(str(i))
-                        child = QtWidgets.QTreeWidgetItem(display_list)
-                        child.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-                        item.addChild(child)
-                        #logger.debug("Adding: " + c['name'])
-                        remove_list.append(c)
-                    it += 1
-                    item = it.value()
-            for item in remove_list:
-                cats.remove(item)
-            count += 1
-
-        # add unlinked codes as top level items
-        remove_items = []
-        for c in codes:
-            if c['catid'] is None:
-                #logger.debug("c[catid] is None: new top item c[name]:" + c['name'])
-                display_list = []
-                for i in c['display_list']:
-                    display_list.append(str(i))
-                top_item = QtWidgets.QTreeWidgetItem(display_list)
-                top_item.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-                top_item.setBackground(0, QBrush(QtGui.QColor(c['color']), Qt.SolidPattern))
-                top_item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-                self.ui.treeWidget.addTopLevelItem(top_item)
-                remove_items.append(c)
-        for item in remove_items:
-            codes.remove(item)
-
-        # add codes as children
-        for c in codes:
-            it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
-            item = it.value()
-            while item:
-                #logger.debug("for c in codes, item:" + item.text(0) +"|" + item.text(1) + ", c[cid]:" + str(c['cid']) +", c[catid]:" + str(c['catid']))
-                if item.text(1) == 'catid:' + str(c['catid']):
-                    display_list = []
-                    for i in c['display_list']:
-                        display_list.append(str(i))
-                    child = QtWidgets.QTreeWidgetItem(display_list)
-                    child.setBackground(0, QBrush(QtGui.QColor(c['color']), Qt.SolidPattern))
-                    child.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-                    child.setFlags(Qt.ItemIsSelectable | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-                    item.addChild(child)
-                    c['catid'] = -1  # make unmatchable
-                it += 1
-                item = it.value()
+        display_list = lambda c: c['display_list']
+        fill_code_tree(self.ui.treeWidget, self.categories, self.codes,
+            category_columns=display_list, code_columns=display_list)
         self.ui.treeWidget.expandAll()
 
 
 class DialogReportCoderComparisons(QtWidgets.QDialog):
-    """ Compare coded text sequences between coders using Cohen's Kappa. """
+    """ Compare coded text sequences between two or more coders, using pairwise
+    Cohen's Kappa, Fleiss' Kappa and Krippendorff's Alpha. """
 
     settings = None
     parent_textEdit = None
@@ -330,6 +253,7 @@ class DialogReportCoderComparisons(QtWidgets.QDialog):
     code_names = []
     file_summaries = []
     comparisons = ""
+    agreements = {}
 
     def __init__(self, settings, parent_textEdit):
 
@@ -345,6 +269,7 @@ class DialogReportCoderComparisons(QtWidgets.QDialog):
         self.ui.pushButton_run.pressed.connect(self.calculate_statistics)
         self.ui.pushButton_clear.pressed.connect(self.clear_selection)
         self.ui.pushButton_exporttext.pressed.connect(self.export_text_file)
+        self.ui.pushButton_exportcsv.pressed.connect(self.export_csv_file)
         newfont = QtGui.QFont(settings['font'], settings['fontsize'], QtGui.QFont.Normal)
         self.setFont(newfont)
         treefont = QtGui.QFont(settings['font'], settings['treefontsize'], QtGui.QFont.Normal)
@@ -352,6 +277,7 @@ class DialogReportCoderComparisons(QtWidgets.QDialog):
         self.ui.treeWidget.setSelectionMode(QtWidgets.QTreeWidget.ExtendedSelection)
         self.ui.comboBox_coders.insertItems(0, self.coders)
         self.ui.comboBox_coders.currentTextChanged.connect(self.coder_selected)
+        self.ui.treeWidget.itemSelectionChanged.connect(self.fill_kappa_table)
         self.fill_tree()
 
     def get_data(self):
@@ -371,9 +297,7 @@ class DialogReportCoderComparisons(QtWidgets.QDialog):
         result = cur.fetchall()
         for row in result:
             self.code_names.append({'name': row[0], 'memo': row[1], 'owner': row[2], 'date': row[3],
-            'cid': row[4], 'catid': row[5], 'color': row[6],
-            'Agree%':'','A and B':'','Not A Not B':'','Disagree%':'','A not B':'','B not A':'','K':''
-            })
+            'cid': row[4], 'catid': row[5], 'color': row[6]})
         self.coders = []
         sql = "select owner from  code_image union select owner from code_text union select owner from code_av"
         cur.execute(sql)
@@ -382,39 +306,36 @@ class DialogReportCoderComparisons(QtWidgets.QDialog):
         for row in result:
             self.coders.append(row[0])
 
-        cur.execute("select id, length(fulltext) from source where mediapath is Null")
+        cur.execute("select id, length(fulltext), name from source where mediapath is Null")
         self.file_summaries = cur.fetchall()
 
     def coder_selected(self):
-        """ Select coders for comparison - only two coders can be selected. """
+        """ Select coders for comparison - two or more coders can be selected. """
 
         coder = self.ui.comboBox_coders.currentText()
         if coder == "":
             return
-        if len(self.selected_coders) == 0:
-            self.selected_coders.append(coder)
-        if len(self.selected_coders) == 1 and self.selected_coders[0] != coder:
+        if coder not in self.selected_coders:
             self.selected_coders.append(coder)
 
         self.ui.label_selections.setText("Coders: " + str(self.selected_coders))
-        if len(self.selected_coders) == 2:
+        if len(self.selected_coders) >= 2:
             self.ui.pushButton_run.setEnabled(True)
 
     def clear_selection(self):
         """ Clear the coder selection and tree widget statistics. """
 
         self.selected_coders = []
+        self.agreements = {}
         self.ui.pushButton_run.setEnabled(False)
         self.ui.label_selections.setText(_("Coders: None selected"))
+        self.fill_kappa_table()
         it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
         item = it.value()
         while item:  # while there is an item in the list
             if item.text(1)[0:4] == 'cid:':
-                item.setText(2, "")
-                item.setText(3, "")
-                item.setText(4, "")
-                item.setText(5, "")
-                item.setText(6, "")
+                for column in range(2, 9):
+                    item.setText(column, "")
             it += 1
             item = it.value()
 
@@ -434,201 +355,125 @@ class DialogReportCoderComparisons(QtWidgets.QDialog):
         QtWidgets.QMessageBox.information(None, _("Text file Export"), filename)
         self.parent_textEdit.append(_("Coder comparison text file exported to: ") + filename)
 
+    def export_csv_file(self):
+        """ Export coding comparison statistics to csv file, one row for each code,
+        with a column for the Cohen's Kappa of each pair of coders. """
+
+        if self.agreements == {}:
+            return
+        filename = QtWidgets.QFileDialog.getSaveFileName(None, _("Save CSV file"),
+            os.path.expanduser('~'))
+        if filename[0] == "":
+            return
+        filename = filename[0] + ".csv"
+        pairs = list(next(iter(self.agreements.values()))['cohen'].keys())
+        header = ["Code", "Id", "Agree %", "All coded %", "None coded %", "Disagree %",
+            "Kappa", "Fleiss' Kappa", "Alpha"]
+        header += ["Kappa " + a + " / " + b for a, b in pairs]
+        with open(filename, 'w', newline='') as csvfile:
+            filewriter = csv.writer(csvfile, delimiter=',',
+                quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            filewriter.writerow(header)
+            for c in self.code_names:
+                agreement = self.agreements[c['cid']]
+                row = [c['name'], c['cid']] + self.statistics_columns(agreement)
+                row += [self.statistic_text(agreement['cohen'][pair]) for pair in pairs]
+                filewriter.writerow(row)
+        logger.info(_("Coder comparisons report exported to ") + filename)
+        QtWidgets.QMessageBox.information(None, _("Csv file Export"), filename)
+        self.parent_textEdit.append(_("Coder comparison csv file exported to: ") + filename)
+
+    def statistic_text(self, value):
+        """ Undefined statistics, e.g. Kappa when both coders coded everything,
+        are shown as an empty string. """
+
+        if value is None:
+            return ""
+        return str(value)
+
+    def statistics_columns(self, agreement):
+        """ Texts for tree widget columns 2 to 8. Kappa is the mean pairwise Cohen's Kappa. """
+
+        return [str(agreement['agreement']) + "%", str(agreement['all_coded']) + "%",
+            str(agreement['none_coded']) + "%", str(round(100 - agreement['agreement'], 2)) + "%",
+            self.statistic_text(agreement['mean_cohen']), self.statistic_text(agreement['fleiss']),
+            self.statistic_text(agreement['alpha'])]
+
     def calculate_statistics(self):
-        """ Iterate through tree widget, for all cids
-        For each code_name calculate the two-coder comparison statistics. """
+        """ Fetch the text codings of the selected coders in one query and calculate
+        the comparison statistics for all codes together.
+        Then fill the statistics into the tree widget for each cid. """
 
         self.comparisons = "====" + _("CODER COMPARISON") + "====\n" + _("Selected coders: ")
-        self.comparisons += self.selected_coders[0] + ", " + self.selected_coders[1] + "\n"
+        self.comparisons += ", ".join(self.selected_coders) + "\n"
+        cur = self.settings['conn'].cursor()
+        sql = "select cid, fid, owner, pos0, pos1 from code_text where owner in ("
+        sql += ",".join("?" * len(self.selected_coders)) + ")"
+        cur.execute(sql, self.selected_coders)
+        file_lengths = dict((f[0], f[1] or 0) for f in self.file_summaries)
+        self.agreements = coder_agreement(cur.fetchall(), file_lengths, self.selected_coders,
+            [c['cid'] for c in self.code_names])
 
         it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
         item = it.value()
         while item:  # while there is an item in the list
-            #logger.debug("While: ", item.text(0), item.text(1), c['catid'], c['supercatid'])
             if item.text(1)[0:4] == 'cid:':
-                #logger.debug(item.text(0), item.text(1))
-                agreement = self.calculate_agreement_for_code_name(int(item.text(1)[4:]))
-                item.setText(2, str(agreement['agreement']) + "%")
-                item.setText(3, str(agreement['dual_percent']) + "%")
-                item.setText(4, str(agreement['uncoded_percent']) + "%")
-                item.setText(5, str(agreement['disagreement']) + "%")
-                item.setText(6, str(agreement['kappa']))
+                agreement = self.agreements[int(item.text(1)[4:])]
+                for column, text in enumerate(self.statistics_columns(agreement)):
+                    item.setText(column + 2, text)
                 self.comparisons += "\n" + item.text(0) + " (" + item.text(1) + ")\n"
-                self.comparisons += _("agreement: ") + str(agreement['agreement']) + "%"
-                self.comparisons += _(", dual coded: ") + str(agreement['dual_percent']) + "%"
-                self.comparisons += _(", uncoded: ") + str(agreement['uncoded_percent']) + "%"
-                self.comparisons += _(", disagreement: ") + str(agreement['disagreement']) + "%"
-                self.comparisons += ", Kappa: " + str(agreement['kappa'])
+                self.comparisons += _("agreement: ") + item.text(2)
+                self.comparisons += _(", all coded: ") + item.text(3)
+                self.comparisons += _(", none coded: ") + item.text(4)
+                self.comparisons += _(", disagreement: ") + item.text(5)
+                self.comparisons += ", Kappa: " + item.text(6)
+                self.comparisons += ", Fleiss' Kappa: " + item.text(7)
+                self.comparisons += ", Alpha: " + item.text(8)
+                for (a, b), kappa in agreement['cohen'].items():
+                    self.comparisons += "\n    Kappa " + a + " / " + b + ": " + self.statistic_text(kappa)
+                for f in self.file_summaries:
+                    file_agreement = agreement['files'].get(f[0])
+                    if file_agreement is not None:
+                        self.comparisons += "\n    " + f[2] + ": " + _("agreement: ") + str(file_agreement['agreement']) + "%"
+                        self.comparisons += ", Fleiss' Kappa: " + self.statistic_text(file_agreement['fleiss'])
             it += 1
             item = it.value()
+        self.fill_kappa_table()
 
-    def calculate_agreement_for_code_name(self, cid):
-        """ Calculate the two-coder statistics for this cid
-        Percentage agreement.
-        Get the start and end positions in all files (source table) for this cid
-        Look at each file separately to ge the commonly coded text.
-        Each character that is coded by coder 1 or coder 2 is incremented, resulting in a list of 0, 1, 2
-        where 0 is no codings at all, 1 is coded by only one coder and 2 is coded by both coders.
-        'Disagree%':'','A not B':'','B not A':'','K':''
-        """
+    def fill_kappa_table(self):
+        """ Show the matrix of pairwise Cohen's Kappa for the selected code. """
 
-        #logger.debug("Code id: " + str(cid))
-        # coded0 and coded1 are the total characters coded by coder 0 and coder 1
-        total = {'dual_coded': 0, 'single_coded': 0, 'uncoded': 0, 'characters': 0, 'coded0': 0, 'coded1': 0}
-        # loop through each source file
-        cur = self.settings['conn'].cursor()
-        sql = "select pos0,pos1,fid from code_text where fid=? and cid=? and owner=?"
-        for f in self.file_summaries:
-            #logger.debug("file summary ", f)
-            cur.execute(sql, [f[0], cid, self.selected_coders[0]])
-            result0 = cur.fetchall()
-            cur.execute(sql, [f[0], cid, self.selected_coders[1]])
-            result1 = cur.fetchall()
-            #logger.debug("result0: " + str(result0))
-            #logger.debug("result1: " + str(result1))
-            # determine the same characters coded by both coders, by adding 1 to each coded character
-            char_list = [0] * f[1]
-            for coded in result0:
-                print(coded[0], coded[1])  # tmp
-                for char in range(coded[0], coded[1]):
-                    char_list[char] += 1
-                    total['coded0'] += 1
-            for coded in result1:
-                for char in range(coded[0], coded[1]):
-                    char_list[char] += 1
-                    total['coded1'] += 1
-            uncoded = 0
-            single_coded = 0
-            dual_coded = 0
-            for char in char_list:
-                if char == 0:
-                    uncoded += 1
-                if char == 1:
-                    single_coded += 1
-                if char == 2:
-                    dual_coded += 1
-            #logger.debug("file:" + f[0] + " dual:" + str(dual_coded) + " single:" + str(single_coded) + " uncoded:" + str(uncoded))
-            total['dual_coded'] += dual_coded
-            total['single_coded'] += single_coded
-            total['uncoded'] += uncoded
-            total['characters'] += f[1]
-        total['agreement'] = round(100 * (total['dual_coded'] + total['uncoded']) / total['characters'], 2)
-        total['dual_percent'] = round(100 * total['dual_coded'] / total['characters'], 2)
-        total['uncoded_percent'] = round(100 * total['uncoded'] / total['characters'], 2)
-        total['disagreement'] = round(100 - total['agreement'], 2)
-        # Cohen's Kappa
-        '''
-        https://en.wikipedia.org/wiki/Cohen%27s_kappa
-
-        k = Po - Pe     Po is proportionate agreement (both coders coded this text / all coded text))
-            -------     Pe is probability of random agreement
-            1  - Pe
-
-            Pe = Pyes + Pno
-            Pyes = proportion Yes by A multiplied by proportion Yes by B
-                 = total['coded0']/total_coded * total['coded1]/total_coded
-
-            Pno = proportion No by A multiplied by proportion No by B
-                = (total_coded - total['coded0']) / total_coded * (total_coded - total['coded1]) / total_coded
-
-        IMMEDIATE BELOW IS INCORRECT - RESULTS IN THE TOTAL AGREEMENT SCORE
-        Po = total['agreement'] / 100
-        Pyes = total['coded0'] / total['characters'] * total['coded1'] / total['characters']
-        Pno = (total['characters'] - total['coded0']) / total['characters'] * (total['characters'] - total['coded1']) / total['characters']
-
-        BELOW IS BETTER - ONLY LOOKS AT PROPORTIONS OF CODED CHARACTERS
-        NEED TO CONFIRM THIS IS THE CORRECT APPROACH
-        '''
-        total['kappa'] = "zerodiv"
-        try:
-            unique_codings = total['coded0'] + total['coded1'] - total['dual_coded']
-            Po = total['dual_coded'] / unique_codings
-            Pyes = total['coded0'] / unique_codings * total['coded1'] / unique_codings
-            Pno = (unique_codings - total['coded0']) / unique_codings * (unique_codings - total['coded1']) / unique_codings
-            Pe = Pyes * Pno
-            kappa = round((Po - Pe) / (1 - Pe), 4)
-            total['kappa'] = kappa
-        except ZeroDivisionError:
-            msg = _("ZeroDivisionError. unique_codings:") + str(unique_codings)
-            logger.debug(msg)
-        return total
+        self.ui.tableWidget.clear()
+        self.ui.tableWidget.setRowCount(0)
+        self.ui.tableWidget.setColumnCount(0)
+        items = self.ui.treeWidget.selectedItems()
+        if self.agreements == {} or items == [] or items[0].text(1)[0:4] != 'cid:':
+            return
+        agreement = self.agreements[int(items[0].text(1)[4:])]
+        coders = self.selected_coders
+        self.ui.tableWidget.setRowCount(len(coders))
+        self.ui.tableWidget.setColumnCount(len(coders))
+        self.ui.tableWidget.setHorizontalHeaderLabels(coders)
+        self.ui.tableWidget.setVerticalHeaderLabels(coders)
+        for (a, b), kappa in agreement['cohen'].items():
+            for row, column in ((coders.index(a), coders.index(b)), (coders.index(b), coders.index(a))):
+                cell = QtWidgets.QTableWidgetItem(self.statistic_text(kappa))
+                cell.setFlags(Qt.ItemIsEnabled)
+                self.ui.tableWidget.setItem(row, column, cell)
+        self.ui.tableWidget.resizeColumnsToContents()
 
     def fill_tree(self):
         """ Fill tree widget, top level items are main categories and unlinked codes. """
 
-        cats = copy(self.categories)
-        codes = copy(self.code_names)
         self.ui.treeWidget.clear()
-        self.ui.treeWidget.setColumnCount(7)
-        self.ui.treeWidget.setHeaderLabels([_("Code Tree"), "Id","Agree %", "A and B %", "Not A Not B %", "Disagree %", "Kappa"])
+        self.ui.treeWidget.setColumnCount(9)
+        self.ui.treeWidget.setHeaderLabels([_("Code Tree"), "Id", "Agree %", "All coded %",
+            "None coded %", "Disagree %", "Kappa", "Fleiss' Kappa", "Alpha"])
         self.ui.treeWidget.header().setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
         self.ui.treeWidget.header().setStretchLastSection(False)
-        # add top level categories
-        remove_list = []
-        for c in cats:
-            if c['supercatid'] is None:
-                top_item = QtWidgets.QTreeWidgetItem([c['name'], 'catid:' + str(c['catid']) ])
-                top_item.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-                self.ui.treeWidget.addTopLevelItem(top_item)
-                remove_list.append(c)
-        for item in remove_list:
-            #try:
-            cats.remove(item)
-            #except Exception as e:
-            #    logger.debug(str(e) + " item:" + str(item))
-
-        ''' Add child categories. Look at each unmatched category, iterate through tree to
-        add as child then remove matched categories from the list. '''
-        count = 0
-        while len(cats) > 0 or count < 10000:
-            remove_list = []
-            #logger.debug("cats:" + str(cats))
-            for c in cats:
-                it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
-                item = it.value()
-                while item:  # while there is an item in the list
-                    #logger.debug("While: ", item.text(0), item.text(1), c['catid'], c['supercatid'])
-                    if item.text(1) == 'catid:' + str(c['supercatid']):
-                        child = QtWidgets.QTreeWidgetItem([c['name'], 'catid:' + str(c['catid']) ])
-                        child.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-                        item.addChild(child)
-                        #logger.debug("Adding: " + c['name'])
-                        remove_list.append(c)
-                    it += 1
-                    item = it.value()
-            for item in remove_list:
-                cats.remove(item)
-            count += 1
-
-        # add unlinked codes as top level items
-        remove_items = []
-        for c in codes:
-            if c['catid'] is None:
-                #logger.debug("c[catid] is None: new top item c[name]:" + c['name'])
-                top_item = QtWidgets.QTreeWidgetItem([c['name'], 'cid:' + str(c['cid']) ])
-                top_item.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-                top_item.setBackground(0, QBrush(QtGui.QColor(c['color']), Qt.SolidPattern))
-                top_item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-                self.ui.treeWidget.addTopLevelItem(top_item)
-                remove_items.append(c)
-        for item in remove_items:
-            codes.remove(item)
-
-        # add codes as children
-        for c in codes:
-            it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
-            item = it.value()
-            while item:
-                #logger.debug("for c in codes, item:" + item.text(0) +"|" + item.text(1) + ", c[cid]:" + str(c['cid']) +", c[catid]:" + str(c['catid']))
-                if item.text(1) == 'catid:' + str(c['catid']):
-                    child = QtWidgets.QTreeWidgetItem([c['name'], 'cid:' + str(c['cid']) ])
-                    child.setBackground(0, QBrush(QtGui.QColor(c['color']), Qt.SolidPattern))
-                    child.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-                    child.setFlags(Qt.ItemIsSelectable | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-                    item.addChild(child)
-                    c['catid'] = -1  # make unmatchable
-                it += 1
-                item = it.value()
+        fill_code_tree(self.ui.treeWidget, self.categories, self.code_names,
+            category_columns=lambda c: [c['name'], 'catid:' + str(c['catid'])],
+            code_columns=lambda c: [c['name'], 'cid:' + str(c['cid'])])
         self.ui.treeWidget.expandAll()
 
 
@@ -645,26 +490,26 @@ class DialogReportCodes(QtWidgets.QDialog):
     code_names = []
     coders = [""]
     categories = []
-    html_links = []  # For html output with media link (images, av)
-    text_results = []
-    image_results = []
-    av_results = []
+    coding_query = None  # CodingQuery of the last search, holding its results
+    file_or_case = ""
+    search_header = ""
     # variables for search restrictions
     file_ids = ""
     case_ids = ""
-    attribute_selection = ""
+    attribute_selection = []
 
-    def __init__(self, settings, parent_textEdit):
+    def __init__(self, app, parent_textEdit):
         sys.excepthook = exception_handler
-        self.settings = settings
+        self.app = app
+        self.settings = app.settings
         self.parent_textEdit = parent_textEdit
         self.get_data()
         QtWidgets.QDialog.__init__(self)
         self.ui = Ui_Dialog_reportCodings()
         self.ui.setupUi(self)
-        newfont = QtGui.QFont(settings['font'], settings['fontsize'], QtGui.QFont.Normal)
+        newfont = QtGui.QFont(self.settings['font'], self.settings['fontsize'], QtGui.QFont.Normal)
         self.setFont(newfont)
-        treefont = QtGui.QFont(settings['font'], settings['treefontsize'], QtGui.QFont.Normal)
+        treefont = QtGui.QFont(self.settings['font'], self.settings['treefontsize'], QtGui.QFont.Normal)
         self.ui.treeWidget.setFont(treefont)
         self.ui.treeWidget.setSelectionMode(QtWidgets.QTreeWidget.ExtendedSelection)
         self.ui.comboBox_coders.insertItems(0, self.coders)
@@ -677,25 +522,22 @@ class DialogReportCodes(QtWidgets.QDialog):
         self.ui.pushButton_exporthtml.clicked.connect(self.export_html_file)
         self.ui.pushButton_exportodt.clicked.connect(self.export_odt_file)
         self.ui.pushButton_export_csv.clicked.connect(self.export_csv_file)
+        self.ui.pushButton_export_csv_rows.clicked.connect(self.export_csv_rows_file)
+        self.results_model = ResultListModel()
+        self.ui.listView_results.setModel(self.results_model)
+        self.ui.listView_results.selectionModel().currentChanged.connect(self.show_result)
+        self.matrix_model = MatrixModel()
+        self.ui.tableView.setModel(self.matrix_model)
+        self.ui.tableView.clicked.connect(self.show_matrix_cell)
+        self.ui.tableView.horizontalHeader().setResizeContentsPrecision(0)
         self.ui.splitter.setSizes([100, 200, 0])
 
     def get_data(self):
-        """ Called from init, delete category. Load codes, categories, and coders. """
+        """ Called from init. Codes and categories from the App code repository, and coders. """
 
-        self.categories = []
+        self.categories = self.app.code_repository.categories
+        self.code_names = self.app.code_repository.codes
         cur = self.settings['conn'].cursor()
-        cur.execute("select name, catid, owner, date, memo, supercatid from code_cat")
-        result = cur.fetchall()
-        for row in result:
-            self.categories.append({'name': row[0], 'catid': row[1], 'owner': row[2],
-            'date': row[3], 'memo': row[4], 'supercatid': row[5]})
-        self.code_names = []
-        cur = self.settings['conn'].cursor()
-        cur.execute("select name, memo, owner, date, cid, catid, color from code_name")
-        result = cur.fetchall()
-        for row in result:
-            self.code_names.append({'name': row[0], 'memo': row[1], 'owner': row[2], 'date': row[3],
-            'cid': row[4], 'catid': row[5], 'color': row[6]})
         self.coders = []
         cur.execute("select distinct owner from code_text")
         result = cur.fetchall()
@@ -706,91 +548,13 @@ class DialogReportCodes(QtWidgets.QDialog):
     def fill_tree(self):
         """ Fill tree widget, top level items are main categories and unlinked codes. """
 
-        cats = copy(self.categories)
-        codes = copy(self.code_names)
         self.ui.treeWidget.clear()
         self.ui.treeWidget.setColumnCount(3)
         self.ui.treeWidget.setHeaderLabels([_("Name"), "Id", _("Memo")])
         self.ui.treeWidget.header().setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
         self.ui.treeWidget.header().setStretchLastSection(False)
-        # add top level categories
-        remove_list = []
-        for c in cats:
-            if c['supercatid'] is None:
-                memo = ""
-                if c['memo'] != "":
-                    memo = _("Memo")
-                top_item = QtWidgets.QTreeWidgetItem([c['name'], 'catid:' + str(c['catid']), memo])
-                top_item.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-                self.ui.treeWidget.addTopLevelItem(top_item)
-                remove_list.append(c)
-        for item in remove_list:
-            #try:
-            cats.remove(item)
-            #except Exception as e:
-            #    logger.debug("item:" + str(item) + ", e:" + str(e))
-
-        ''' Add child categories. Look at each unmatched category, iterate through tree
-        to add as child then remove matched categories from the list. '''
-        count = 0
-        while len(cats) > 0 or count < 10000:
-            remove_list = []
-            #logger.debug(cats)
-            for c in cats:
-                it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
-                item = it.value()
-                while item:  # while there is an item in the list
-                    #logger.debug("While item in list: " + item.text(0) + "|" + item.text(1) + ", c[catid]:" + str(c['catid']) + ", supercatid:" + str(c['supercatid']))
-                    if item.text(1) == 'catid:' + str(c['supercatid']):
-                        memo = ""
-                        if c['memo'] != "":
-                            memo = "Memo"
-                        child = QtWidgets.QTreeWidgetItem([c['name'], 'catid:' + str(c['catid']), memo])
-                        child.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-                        item.addChild(child)
-                        #logger.debug("Adding item: " + c['name'])
-                        remove_list.append(c)
-                    it += 1
-                    item = it.value()
-            for item in remove_list:
-                cats.remove(item)
-            count += 1
-
-        # add unlinked codes as top level items
-        remove_items = []
-        for c in codes:
-            if c['catid'] is None:
-                #logger.debug("add unlinked code:" + c['name'])
-                memo = ""
-                if c['memo'] != "":
-                    memo = "Memo"
-                top_item = QtWidgets.QTreeWidgetItem([c['name'], 'cid:' + str(c['cid']), memo])
-                top_item.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-                top_item.setBackground(0, QBrush(QtGui.QColor(c['color']), Qt.SolidPattern))
-                top_item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled | Qt.ItemIsDragEnabled)
-                self.ui.treeWidget.addTopLevelItem(top_item)
-                remove_items.append(c)
-        for item in remove_items:
-            codes.remove(item)
-
-        # add codes as children
-        for c in codes:
-            it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
-            item = it.value()
-            while item:
-                #logger.debug("add codes as children, item:" + item.text(0) + "|" + item.text(1) + ", c[id]:" + str(c['cid']) + ", c[catid]:" + str(c['catid']))
-                if item.text(1) == 'catid:' + str(c['catid']):
-                    memo = ""
-                    if c['memo'] != "":
-                        memo = _("Memo")
-                    child = QtWidgets.QTreeWidgetItem([c['name'], 'cid:' + str(c['cid']), memo])
-                    child.setBackground(0, QBrush(QtGui.QColor(c['color']), Qt.SolidPattern))
-                    child.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-                    child.setFlags(Qt.ItemIsSelectable | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled | Qt.ItemIsDragEnabled)
-                    item.addChild(child)
-                    c['catid'] = -1  # make unmatchable
-                it += 1
-                item = it.value()
+        fill_code_tree(self.ui.treeWidget, self.categories, self.code_names,
+            code_flags=CODE_DRAG_FLAGS)
         self.ui.treeWidget.expandAll()
 
     def export_text_file(self):
@@ -799,7 +563,7 @@ class DialogReportCodes(QtWidgets.QDialog):
         TODO? add default directory to export to
         """
 
-        if len(self.ui.textEdit.document().toPlainText()) == 0:
+        if self.coding_query is None:
             return
         filename = QtWidgets.QFileDialog.getSaveFileName(None, _("Save text file"),
             self.settings['directory'])
@@ -809,7 +573,8 @@ class DialogReportCodes(QtWidgets.QDialog):
         tw = QtGui.QTextDocumentWriter()
         tw.setFileName(filename)
         tw.setFormat(b'plaintext')  # byte array needed for Windows 10
-        tw.write(self.ui.textEdit.document())
+        text_edit = self.report_text_edit()
+        tw.write(text_edit.document())
         self.parent_textEdit.append(_("Report exported: ") + filename)
         QtWidgets.QMessageBox.information(None, _("Report exported"), filename)
 
@@ -818,7 +583,7 @@ class DialogReportCodes(QtWidgets.QDialog):
         QTextWriter supports plaintext, ODF and HTML .
         """
 
-        if len(self.ui.textEdit.document().toPlainText()) == 0:
+        if self.coding_query is None:
             return
         filename = QtWidgets.QFileDialog.getSaveFileName(None, _("Save Open Document Text file"),
             self.settings['directory'])
@@ -829,195 +594,126 @@ class DialogReportCodes(QtWidgets.QDialog):
         tw = QtGui.QTextDocumentWriter()
         tw.setFileName(filename)
         tw.setFormat(b'ODF')  # byte array needed for Windows 10
-        tw.write(self.ui.textEdit.document())
+        text_edit = self.report_text_edit()
+        tw.write(text_edit.document())
         self.parent_textEdit.append(_("Report exported: ") + filename)
         QtWidgets.QMessageBox.information(None, _("Report exported"), filename)
 
     def export_csv_file(self):
         """ Export report to csv file.
         Export coded data as csv with codes as column headings.
-        Draw data from self.text_results, self.image_results, self.av_results
-        First need to determine number of columns based on the distinct number of codes in the results.
-        Then the number of rows based on the most frequently assigned code.
         Each data cell contains coded text, or the memo if A/V or image and the file or case name.
+        The results are grouped by code in one pass through the query and the rows are made
+        from the code columns by zip_longest, so there is no table of empty cells.
         """
 
-        if self.text_results == [] and self.image_results == [] and self.av_results == []:
+        columns = {}
+        for result in self.result_rows():
+            columns.setdefault(result['codename'], []).append(self.csv_cell(result))
+        if columns == {}:
             return
+        codes = sorted(columns)
+        filename = QtWidgets.QFileDialog.getSaveFileName(None, _("Save CSV file"),
+            self.settings['directory'])
+        if filename[0] == "":
+            return
+        filename = filename[0] + ".csv"
+        with open(filename, 'w', newline='') as csvfile:
+            filewriter = csv.writer(csvfile, delimiter=',',
+                quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            filewriter.writerow(codes)  # header row
+            filewriter.writerows(zip_longest(*[columns[code] for code in codes], fillvalue=""))
+        self.parent_textEdit.append(_("Report exported: ") + filename)
+        QtWidgets.QMessageBox.information(None, _("Report exported"), filename)
 
-        codes_all = []
-        codes_set = []
-        codes_freq_list = []
-
-        #print("TEXT")  # tmp
-        for i in self.text_results:
-            codes_all.append(i['codename'])
-            #print(i)
-        #print("IMAGES")  # tmp
-        for i in self.image_results:
-            codes_all.append(i['codename'])
-            #print(i)
-        #print("AUDIO/VIDEO")  # tmp
-        for i in self.av_results:
-            codes_all.append(i['codename'])
-            #print(i)
-
-        codes_set = list(set(codes_all))
-        codes_set.sort()
-        for x in codes_set:
-            codes_freq_list.append(codes_all.count(x))
-
-        #print(codes_all)
-        #print(codes_set)
-        #print(codes_freq_list)
-
-        ncols = len(codes_set)
-        nrows = sorted(codes_freq_list)[-1]
-        #print("ncols:", ncols, "nrows:", nrows)
-
-        # Prepare data rows for csv writer
-        csv_data = []
-        for r in range(0, nrows):
-            row = []
-            for c in range(0, ncols):
-                row.append("")
-            csv_data.append(row)
-
-        # Look at each code and fill column with data
-        for col, code in enumerate(codes_set):
-            row = 0
-            for i in self.text_results:
-                if i['codename'] == code:
-                    d = i['text'] + "\n" + i['file_or_casename']
-                     # Add file id if results are based on attribute selection
-                    if i['file_or_case'] == "":
-                        d += " fid:" + str(i['fid'])
-                    csv_data[row][col]  = d
-                    row += 1
-            for i in self.image_results:
-                if i['codename'] == code:
-                    d = i['memo']
-                    if d == "":
-                        d = "NO MENO"
-                    d += "\n" + i['file_or_casename']
-                    # Add filename if results are based on attribute selection
-                    if i['file_or_case'] == "":
-                        d += " " + i['mediapath'][8:]
-                    csv_data[row][col] = d
-                    row +=1
-            for i in self.av_results:
-                if i['codename'] == code:
-                    d = i['memo']
-                    if d == "":
-                        d = "NO MEMO"
-                    d += "\n"
-                    # av 'text' contains video/filename, time slot and memo, so trim some out
-                    trimmed = i['text'][6:]
-                    pos = trimmed.find(']')
-                    trimmed = trimmed[:pos + 1]
-                    # Add case name as well as file name and time slot
-                    if i['file_or_case'] != "File":
-                        trimmed = i['file_or_casename'] + " " + trimmed
-                    d += trimmed
-                    csv_data[row][col] = d
-                    row += 1
+    @staticmethod
+    def csv_cell(result):
+        """ Csv data cell for a result: coded text, or the memo if A/V or image,
+        and the file or case name. """
+
+        if result['result_type'] == 'text':
+            cell = result['text'] + "\n" + result['file_or_casename']
+            # Add file id if results are based on attribute selection
+            if result['file_or_case'] == "":
+                cell += " fid:" + str(result['fid'])
+            return cell
+        cell = result['memo']
+        if cell == "":
+            cell = "NO MEMO"
+        cell += "\n"
+        if result['result_type'] == 'image':
+            cell += result['file_or_casename']
+            # Add filename if results are based on attribute selection
+            if result['file_or_case'] == "":
+                cell += " " + result['mediapath'][8:]
+            return cell
+        # av 'avtext' contains video/filename and time slot, trim the folder
+        if result['file_or_case'] != "File":
+            cell += result['file_or_casename'] + " "
+        return cell + result['avtext'][6:]
+
+    def export_csv_rows_file(self):
+        """ Export report to csv file with one row for each coded text, image area and
+        a/v segment, with all details. Rows are written as they are read from the query.
+        """
 
+        if self.coding_query is None:
+            return
         filename = QtWidgets.QFileDialog.getSaveFileName(None, _("Save CSV file"),
             self.settings['directory'])
         if filename[0] == "":
             return
         filename = filename[0] + ".csv"
+        header = ["Code", "Coder", "Type", "File or case", "Name", "File id", "Pos0", "Pos1",
+            "X1", "Y1", "Width", "Height", "Text", "Memo", "Media"]
         with open(filename, 'w', newline='') as csvfile:
             filewriter = csv.writer(csvfile, delimiter=',',
                 quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            filewriter.writerow(codes_set)  # header row
-            for row in csv_data:
-                filewriter.writerow(row)
+            filewriter.writerow(header)
+            filewriter.writerows(self.csv_row(result) for result in self.result_rows())
+        self.parent_textEdit.append(_("Report exported: ") + filename)
+        QtWidgets.QMessageBox.information(None, _("Report exported"), filename)
+
+    @staticmethod
+    def csv_row(result):
+        """ Csv row for one result of export_csv_rows_file. """
+
+        text = ""
+        if result['result_type'] == 'text':
+            text = result['text']
+        return [result['codename'], result['coder'], result['result_type'],
+            result['file_or_case'], result['file_or_casename'], result['fid'],
+            result.get('pos0', ""), result.get('pos1', ""), result.get('x1', ""),
+            result.get('y1', ""), result.get('width', ""), result.get('height', ""),
+            text, result.get('memo', ""), result.get('mediapath', "")]
 
     def export_html_file(self):
-        """ Export report to a html file. Create folder of images and change refs to the
-        folder.
-        POSSIBLY TODO: an alternative is to have picture data in base64 so there is no
-        need for a separate folder that the html file links to.
-        TODO? add default directory to export to
+        """ Export report to a html file. The html is written from the results of the
+        search by HtmlReport. Images are put in a folder named after the html file, or
+        optionally included in the html file as base64 data. Audio and video files are
+        linked or copied into the folder.
         """
 
-        if len(self.ui.textEdit.document().toPlainText()) == 0:
+        if self.coding_query is None:
             return
         filename = QtWidgets.QFileDialog.getSaveFileName(None, _("Save html file"),
             self.settings['directory'])
         if filename[0] == "":
             return
         filename = filename[0] + ".html"
-        tw = QtGui.QTextDocumentWriter()
-        tw.setFileName(filename)
-        tw.setFormat(b'HTML')  # byte array needed for Windows 10
-        tw.setCodec(QTextCodec.codecForName('UTF-8'))  # for Windows 10
-        tw.write(self.ui.textEdit.document())
-
-        # Create folder of images and media and change html links
-        foldername = filename[:-5]
-        foldername_without_path = foldername.split('/')[-1]
-        try:
-            os.mkdir(foldername)
-            os.mkdir(foldername + "/audio")
-            os.mkdir(foldername + "/video")
-        except Exception as e:
-            logger.warning(_("html folder creation error ") + str(e))
-            QtWidgets.QMessageBox.warning(None, _("Folder creation"), foldername + _(" error"))
-            return
-        html = ""
+        inline = QtWidgets.QMessageBox.question(None, _("Images"),
+            _("Include images in the html file?"), QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
+            QtWidgets.QMessageBox.No) == QtWidgets.QMessageBox.Yes
+        report = HtmlReport(filename, self.settings['path'], self.app.get_thumbnails(), inline)
         try:
-            with open(filename, 'r') as f:
-                html = f.read()
-        except Exception as e:
-            logger.warning(_('html file reading error:') + str(e))
+            report.write(_("Coding report"), self.search_header, self.result_rows())
+        except OSError as e:
+            logger.warning(_("html file creation error ") + str(e))
+            QtWidgets.QMessageBox.warning(None, _("HTML file creation exception"), str(e))
             return
-
-        for item in self.html_links:
-            if item['imagename'] is not None:
-                # [-3] has a counter, e.g. 1_, 2_ for each image eto make it distinct
-                imagename = item['imagename'].split('/')[-3] + item['imagename'].split('/')[-1]
-                #print("IN: ", imagename)
-                folder_link = filename[:-5] + "/" + imagename
-                #print("FL:" ,folder_link)
-                item['image'].save(folder_link)
-                html_link = foldername_without_path + "/" + imagename
-                ''' Replace html links, with fix for Windows 10, item[imagename] contains a lower case directory but
-                this needs to be upper case for the replace method to work:  c:  =>  C:
-                '''
-                unreplaced_html = copy(html)  # for Windows 10 directory name upper/lower case issue
-                html = html.replace(item['imagename'], html_link)
-                if unreplaced_html == html:
-                    html = html.replace(item['imagename'][0].upper() + item['imagename'][1:], html_link)
-                #print("Windows 10 not replacing issue ", item['imagename'], html_link)
-                #logger.debug("Windows 10 not replacing issue: item[imagename]: " + item['imagename'] + ", html_link: " + html_link)
-            if item['avname'] is not None:
-                try:
-                    # add audio/video to folder
-                    if not os.path.isfile(foldername + item['avname']):
-                        copyfile(self.settings['path'] + item['avname'], foldername + item['avname'])
-                    mediatype = item['avname'][1:6]
-                    extension = item['avname'][item['avname'].rfind('.') + 1:]
-                    extra = "</p><" + mediatype + " controls>"
-                    extra += '<source src="' + foldername + item['avname']
-                    extra += '#t=' + item['av0'] +',' + item['av1'] + '"'
-                    extra += ' type="' + mediatype + '/' + extension + '">'
-                    extra += '</' + mediatype + '><p>'
-                    #print("EXTRA:", extra)
-                    # hopefully only one location with video/link: [mins.secs - mins.secs]
-                    location = html.find(item['avtext'])
-                    location = location + len(['avtext'])- 1
-                    tmp = html[:location] + extra + html[location:]
-                    html = tmp
-                except Exception as e:
-                    print(e)
-                    QtWidgets.QMessageBox.warning(None, _("HTML file creation exception"), str(e))
-
-        with open(filename, 'w') as f:
-            f.write(html)
         msg = _("Report exported to: ") + filename
-        msg += "\n" + _("Image folder: ") + foldername
+        if os.path.isdir(report.folder):
+            msg += "\n" + _("Media folder: ") + report.folder
         self.parent_textEdit.append(msg)
         QtWidgets.QMessageBox.information(None, _("HTML file saved"), msg)
 
@@ -1041,20 +737,18 @@ class DialogReportCodes(QtWidgets.QDialog):
         the user has entered.
         The third pathway is based on attribute selection, which may include files or cases.
 
-        The textEdit.document is filled with the search results.
-        Results are drawn from the textEdit.document to fill reports in .txt and .odt formats.
-        Results are drawn from the textEdit.document and html_links variable to fill reports in html format.
-        Results are drawn from self.text_results, self.image_results and self.av_results to prepare a csv file.
+        One parameterised query for text, images and a/v is built by CodingQuery, and its
+        results are saved in a temporary table of the CodingQuery in self.coding_query.
+        The results are read from it into the results list view, a page at a time as the
+        list is scrolled.
+        The selected result is shown in the textEdit.
+        Exports read the saved results again through result_rows.
         """
 
         coder = self.ui.comboBox_coders.currentText()
-        #self.html_results = ""
-        self.html_links = []  # For html file output with media
         search_text = self.ui.lineEdit.text()
 
-        rows = self.ui.tableWidget.rowCount()
-        for r in range(0, rows):
-            self.ui.tableWidget.removeRow(0)
+        self.matrix_model.reset_data([], [], {})
 
         # set all items under selected categories to be selected
         self.recursive_set_selected(self.ui.treeWidget.invisibleRootItem())
@@ -1067,461 +761,167 @@ class DialogReportCodes(QtWidgets.QDialog):
                 _("No files, cases or attributes have been selected."))
             return
 
-        # Add search terms to textEdit
-        self.ui.textEdit.clear()
+        # Search terms, shown in the textEdit and at the top of exported reports
         parameters = self.ui.label_selections.text()
-        self.ui.textEdit.insertPlainText(_("Search parameters") + ":\n" + parameters + "\n")
+        self.search_header = _("Search parameters") + ":\n" + parameters + "\n"
         if coder == "":
-            self.ui.textEdit.insertPlainText(_("Coding by: All coders"))
+            self.search_header += _("Coding by: All coders")
         else:
-            self.ui.textEdit.insertPlainText(_("Coding by: ") + coder)
+            self.search_header += _("Coding by: ") + coder
         if search_text != "":
-            self.ui.textEdit.insertPlainText(_("Search text: ") + search_text)
-        codes_string = "\n" + _("Codes: ")
+            self.search_header += _("Search text: ") + search_text
+        self.search_header += "\n" + _("Codes: ")
         for i in items:
-            codes_string += i.text(0) + ". "
-        self.ui.textEdit.insertPlainText(codes_string)
-        self.ui.textEdit.insertPlainText("\n==========\n")
+            self.search_header += i.text(0) + ". "
+        self.search_header += "\n==========\n"
 
+        self.drop_query()
         # get selected codes from selected items
-        code_ids = ""
-        for i in items:
-            if i.text(1)[0:3] == 'cid':
-                code_ids += "," + i.text(1)[4:]
-        code_ids = code_ids[1:]
-        #logger.debug("File ids\n",self.file_ids, type(self.file_ids))
-        #logger.debug("Case ids\n",self.case_ids, type(self.case_ids))
-        self.text_results = []
-        self.image_results = []
-        self.av_results = []
-        cur = self.settings['conn'].cursor()
-
-        # get coded text/images/av via selected files
-        parameters = []
+        cids = [int(i.text(1)[4:]) for i in items if i.text(1)[0:3] == 'cid']
+        query = CodingQuery(self.app, cids, coder, search_text)
         if self.file_ids != "":
-            # coded text
-            sql = "select code_name.name, color, source.name, pos0, pos1, seltext, "
-            sql += "code_text.owner, fid from code_text join code_name "
-            sql += "on code_name.cid = code_text.cid join source on fid = source.id "
-            sql += "where code_name.cid in (" + code_ids + ") "
-            sql += "and source.id in (" + self.file_ids + ") "
-            if coder != "":
-                sql += " and code_text.owner=? "
-                parameters.append(coder)
-            if search_text != "":
-                sql += " and seltext like ? "
-                parameters.append("%" + str(search_text) + "%")
-            if parameters == []:
-                cur.execute(sql)
-            else:
-                #logger.info("SQL:" + sql)
-                #logger.info("Parameters:" + str(parameters))
-                cur.execute(sql, parameters)
-            result = cur.fetchall()
-            for row in result:
-                self.text_results.append(row)
-
-            # coded images
-            parameters = []
-            sql = "select code_name.name, color, source.name, x1, y1, width, height,"
-            sql += "code_image.owner, source.mediapath, source.id, code_image.memo "
-            sql += " from code_image join code_name "
-            sql += "on code_name.cid = code_image.cid join source on code_image.id = source.id "
-            sql += "where code_name.cid in (" + code_ids + ") "
-            sql += "and source.id in (" + self.file_ids + ") "
-            if coder != "":
-                sql += " and code_image.owner=? "
-                parameters.append(coder)
-            if search_text != "":
-                sql += " and code_image.memo like ? "
-                parameters.append("%" + str(search_text) + "%")
-            if parameters == []:
-                cur.execute(sql)
-            else:
-                #logger.info("SQL:" + sql)
-                #logger.info("Parameters:" + str(parameters))
-                cur.execute(sql, parameters)
-            result = cur.fetchall()
-            for row in result:
-                self.image_results.append(row)
-
-            # coded audio and video, also looks for search_text in coded segment meno
-            parameters = []
-            sql = "select code_name.name, color, source.name, pos0, pos1, code_av.memo, "
-            sql += "code_av.owner, source.mediapath, source.id from code_av join code_name "
-            sql += "on code_name.cid = code_av.cid join source on code_av.id = source.id "
-            sql += "where code_name.cid in (" + code_ids + ") "
-            sql += "and source.id in (" + self.file_ids + ") "
-            if coder != "":
-                sql += " and code_av.owner=? "
-                parameters.append(coder)
-            if search_text != "":
-                sql += " and code_av.memo like ? "
-                parameters.append("%" + str(search_text) + "%")
-            if parameters == []:
-                cur.execute(sql)
-            else:
-                #logger.info("SQL:" + sql)
-                #logger.info("Parameters:" + str(parameters))
-                cur.execute(sql, parameters)
-            result = cur.fetchall()
-            for row in result:
-                self.av_results.append(row)
-
-        # get coded text/images/av via selected cases
+            query.select_files([int(i) for i in self.file_ids.split(',')])
         if self.case_ids != "":
-            # coded text
-            sql = "select code_name.name, color, cases.name, "
-            sql += "code_text.pos0, code_text.pos1, seltext, code_text.owner, code_text.fid from "
-            sql += "code_text join code_name on code_name.cid = code_text.cid "
-            sql += "join (case_text join cases on cases.caseid = case_text.caseid) on "
-            sql += "code_text.fid = case_text.fid "
-            sql += "where code_name.cid in (" + code_ids + ") "
-            sql += "and case_text.caseid in (" + self.case_ids + ") "
-            sql += "and (code_text.pos0 >= case_text.pos0 and code_text.pos1 <= case_text.pos1)"
-            if coder != "":
-                sql += " and code_text.owner=? "
-                parameters.append(coder)
-            if search_text != "":
-                sql += " and seltext like ? "
-                parameters.append("%" + str(search_text) + "%")
-
-            if parameters == []:
-                cur.execute(sql)
-            else:
-                cur.execute(sql, parameters)
-            result = cur.fetchall()
-            for row in result:
-                self.text_results.append(row)
-
-            # coded images
-            parameters = []
-            sql = "select code_name.name, color, cases.name, "
-            sql += "x1, y1, width, height, code_image.owner,source.mediapath, source.id, "
-            sql += "code_image.memo from "
-            sql += "code_image join code_name on code_name.cid = code_image.cid "
-            sql += "join (case_text join cases on cases.caseid = case_text.caseid) on "
-            sql += "code_image.id = case_text.fid "
-            sql += " join source on case_text.fid = source.id "
-            sql += "where code_name.cid in (" + code_ids + ") "
-            sql += "and case_text.caseid in (" + self.case_ids + ") "
-            if coder != "":
-                sql += " and code_image.owner=? "
-                parameters.append(coder)
-            if search_text != "":
-                sql += " and code_image.memo like ? "
-                parameters.append("%" + str(search_text) + "%")
-            if parameters == []:
-                cur.execute(sql)
-            else:
-                #logger.info("SQL:" + sql)
-                #logger.info("Parameters:" + str(parameters))
-                cur.execute(sql, parameters)
-            result = cur.fetchall()
-            for row in result:
-                self.image_results.append(row)
-
-            # coded audio and video
-            parameters = []
-            sql = "select code_name.name, color, cases.name, "
-            sql += "code_av.pos0, code_av.pos1, code_av.memo, code_av.owner,source.mediapath, "
-            sql += "source.id from "
-            sql += "code_av join code_name on code_name.cid = code_av.cid "
-            sql += "join (case_text join cases on cases.caseid = case_text.caseid) on "
-            sql += "code_av.id = case_text.fid "
-            sql += " join source on case_text.fid = source.id "
-            sql += "where code_name.cid in (" + code_ids + ") "
-            sql += "and case_text.caseid in (" + self.case_ids + ") "
-            if coder != "":
-                sql += " and code_av.owner=? "
-                parameters.append(coder)
-            if search_text != "":
-                sql += " and code_av.memo like ? "
-                parameters.append("%" + str(search_text) + "%")
-            if parameters == []:
-                cur.execute(sql)
-            else:
-                #logger.info("SQL:" + sql)
-                #logger.info("Parameters:" + str(parameters))
-                cur.execute(sql, parameters)
-            result = cur.fetchall()
-            for row in result:
-                self.av_results.append(row)
-
-        # get coded text and images from attribute selection
+            query.select_cases([int(i) for i in self.case_ids.split(',')])
         if self.attribute_selection != []:
             logger.debug("attributes:" + str(self.attribute_selection))
-            # convert each row into sql and add to case or file lists
-            file_sql = []
-            case_sql = []
-            for a in self.attribute_selection:
-                #print(a)
-                sql = " select id from attribute where attribute.name = '" + a[0] + "' "
-                sql += " and attribute.value " + a[3] + " "
-                if a[3] in ('in', 'not in', 'between'):
-                    sql += "("
-                sql += ','.join(a[4])
-                if a[3] in ('in', 'not in', 'between'):
-                    sql += ")"
-                if a[2] == 'numeric':
-                    sql = sql.replace(' attribute.value ', ' cast(attribute.value as real) ')
-                if a[1] == "file":
-                    sql += " and attribute.attr_type='file' "
-                    file_sql.append(sql)
-                else:
-                    sql += " and attribute.attr_type='case' "
-                    case_sql.append(sql)
-
-            # find file_ids matching criteria, nested sqls for each parameter
-            sql = ""
-            if len(file_sql) > 0:
-                sql = file_sql[0]
-                del file_sql[0]
-            while len(file_sql) > 0:
-                    sql += " and id in ( " + file_sql[0] + ") "
-                    del file_sql[0]
-            logger.debug(sql)
-            cur.execute(sql)
-            result = cur.fetchall()
-            file_ids = ""
-            for i in result:
-                file_ids += "," + str(i[0])
-            if len(file_ids) > 0:
-                file_ids = file_ids[1:]
-            logger.debug("file_ids: " + file_ids)
-
-            # find case_ids matching criteria, nested sqls for each parameter
-            # can get multiple case ids
-            sql = ""
-            if len(case_sql) > 0:
-                sql = case_sql[0]
-                del case_sql[0]
-            while len(case_sql) > 0:
-                    sql += " and id in ( " + case_sql[0] + ") "
-                    del case_sql[0]
-            logger.debug(sql)
-            cur.execute(sql)
-            result = cur.fetchall()
-            case_ids = ""
-            for i in result:
-                case_ids += "," + str(i[0])
-            if len(case_ids) > 0:
-                case_ids = case_ids[1:]
-            logger.debug("case_ids: " + case_ids)
-
-            # text from attribute selection
-            sql = ""
-            # first sql is for cases with/without file parameters
-            if case_ids != "":
-                sql = "select code_name.name, color, cases.name, "
-                sql += "code_text.pos0, code_text.pos1, seltext, code_text.owner, code_text.fid from "
-                sql += "code_text join code_name on code_name.cid = code_text.cid "
-                sql += "join (case_text join cases on cases.caseid = case_text.caseid) on "
-                sql += "code_text.fid = case_text.fid "
-                sql += "where code_name.cid in (" + code_ids + ") "
-                sql += "and case_text.caseid in (" + case_ids + ") "
-                sql += "and (code_text.pos0 >= case_text.pos0 and code_text.pos1 <= case_text.pos1) "
-                if file_ids != "":
-                    sql += "and code_text.fid in (" + file_ids + ") "
-            else:
-                # second sql is for file parameters only
-                sql = "select code_name.name, color, source.name, pos0, pos1, seltext, "
-                sql += "code_text.owner, fid from code_text join code_name "
-                sql += "on code_name.cid = code_text.cid join source on fid = source.id "
-                sql += "where code_name.cid in (" + code_ids + ") "
-                sql += "and source.id in (" + file_ids + ") "
-            if coder != "":
-                sql += " and code_text.owner=? "
-                parameters.append(coder)
-            if search_text != "":
-                sql += " and seltext like ? "
-                parameters.append("%" + str(search_text) + "%")
-            if parameters == []:
-                cur.execute(sql)
-            else:
-                cur.execute(sql, parameters)
-            result = cur.fetchall()
-            for row in result:
-                self.text_results.append(row)
-
-            # images from attribute selection
-            sql = ""
-            # first sql is for cases with/without file parameters
-            if case_ids != "":
-                sql = "select code_name.name, color, cases.name, "
-                sql += "x1, y1, width, height, code_image.owner,source.mediapath, source.id, code_image.memo "
-                sql += "from code_image join code_name on code_name.cid = code_image.cid "
-                sql += "join (case_text join cases on cases.caseid = case_text.caseid) on "
-                sql += "code_image.id = case_text.fid "
-                sql += " join source on case_text.fid = source.id "
-                sql += "where code_name.cid in (" + code_ids + ") "
-                sql += "and case_text.caseid in (" + case_ids + ") "
-                if file_ids != "":
-                    sql += "and case_text.fid in (" + file_ids + ") "
-            else:
-                # second sql is for file parameters only
-                sql = "select code_name.name, color, source.name, x1, y1, width, height,"
-                sql += "code_image.owner, source.mediapath, source.id, code_image.memo "
-                sql += " from code_image join code_name "
-                sql += "on code_name.cid = code_image.cid join source on code_image.id = source.id "
-                sql += "where code_name.cid in (" + code_ids + ") "
-                sql += "and source.id in (" + file_ids + ") "
-            if coder != "":
-                sql += " and code_image.owner=? "
-            if search_text != "":
-                sql += " and code_image.memo like ? "
-                parameters.append("%" + str(search_text) + "%")
-                parameters.append(coder)
-            if parameters == []:
-                cur.execute(sql)
-            else:
-                #logger.info("SQL:" + sql)
-                #logger.info("Parameters:" + str(parameters))
-                cur.execute(sql, parameters)
-            result = cur.fetchall()
-            for row in result:
-                self.image_results.append(row)
-
-            # audio and video from attribute selection
-            sql = ""
-            # first sql is for cases with/without file parameters
-            if case_ids != "":
-                sql = "select code_name.name, color, cases.name, "
-                sql += "code_av.pos0, code_av.pos1, code_av.memo, code_av.owner,"
-                sql += "source.mediapath, source.id from "
-                sql += "code_av join code_name on code_name.cid = code_av.cid "
-                sql += "join (case_text join cases on cases.caseid = case_text.caseid) on "
-                sql += "code_av.id = case_text.fid "
-                sql += " join source on case_text.fid = source.id "
-                sql += "where code_name.cid in (" + code_ids + ") "
-                sql += "and case_text.caseid in (" + case_ids + ") "
-                if file_ids != "":
-                    sql += "and case_text.fid in (" + file_ids + ") "
-            else:
-                # second sql is for file parameters only
-                sql = "select code_name.name, color, source.name, code_av.pos0, "
-                sql += "code_av.pos1, code_av.memo,"
-                sql += "code_av.owner, source.mediapath, source.id from code_av join code_name "
-                sql += "on code_name.cid = code_av.cid join source on code_av.id = source.id "
-                sql += "where code_name.cid in (" + code_ids + ") "
-                sql += "and source.id in (" + file_ids + ") "
-            if coder != "":
-                sql += " and code_av.owner=? "
-                parameters.append(coder)
-            if search_text != "":
-                sql += " and code_av.memo like ? "
-                parameters.append("%" + str(search_text) + "%")
-            if parameters == []:
-                cur.execute(sql)
-            else:
-                #logger.info("SQL:" + sql)
-                #logger.info("Parameters:" + str(parameters))
-                cur.execute(sql, parameters)
-            result = cur.fetchall()
-            for row in result:
-                self.av_results.append(row)
-
-        fileOrCase = ""  # default for attributes selection
+            query.select_attributes(self.attribute_selection)
+
+        self.file_or_case = ""  # default for attributes selection
         if self.file_ids != "":
-            fileOrCase = "File"
+            self.file_or_case = "File"
         if self.case_ids != "":
-            fileOrCase = "Case"
-
-        # convert results to dictionaries for ease of use
-        tmp = []
-        for i in self.text_results:
-            tmp.append({'codename': i[0], 'color': i[1], 'file_or_casename': i[2], 'pos0': i[3],
-                'pos1': i[4], 'text': i[5], 'coder': i[6], 'fid': i[7], 'file_or_case': fileOrCase})
-        self.text_results = tmp
-        tmp = []
-        for i in self.image_results:
-            tmp.append({'codename': i[0], 'color': i[1], 'file_or_casename': i[2], 'x1': i[3],
-                'y1': i[4], 'width': i[5], 'height': i[6], 'coder': i[7], 'mediapath': i[8],
-                'fid': i[9], 'memo': i[10], 'file_or_case': fileOrCase})
-        self.image_results = tmp
-        tmp = []
-        for i in self.av_results:
-            # prepare additional text describing coded segment
-            text = ""
-            if i[7] is None:
-                msg = "Should not have a None value for a/v media name.\n"
-                msg += str(i)
-                msg += "\nFirst backup project then: delete from code_av where id=" + str(i[9])
-                QtWidgets.QMessageBox.information(None, _("No media name in AV results"), msg)
-                logger.error("None value for a/v media name in AV results\n" + str(i))
-            if i[7] is not None:
-                text = i[7][1:] + ": "
-            secs0 = int(i[3] / 1000)
-            mins = int(secs0 / 60)
-            remainder_secs = str(secs0 - mins * 60)
-            if len(remainder_secs) == 1:
-                remainder_secs = "0" + remainder_secs
-            text += " [" + str(mins) + "." + remainder_secs
-            secs1 = int(i[4] / 1000)
-            mins = int(secs1 / 60)
-            remainder_secs = str(secs1 - mins * 60)
-            if len(remainder_secs) == 1:
-                remainder_secs = "0" + remainder_secs
-            text += " - " + str(mins) + "." + remainder_secs + "]"
-            self.html_links.append({'imagename': None, 'image': None,
-                'avname': i[7], 'av0': str(secs0), 'av1': str(secs1), 'avtext': text})
-            if len(i[5]) > 0:
-                text += "\nMemo: " + i[5]
-            tmp.append({'codename': i[0], 'color': i[1], 'file_or_casename': i[2],
-            'pos0': i[3], 'pos1': i[4], 'memo': i[5], 'coder': i[6], 'mediapath': i[7],
-                'fid': i[8], 'file_or_case': fileOrCase, 'text': text})
-        self.av_results = tmp
-
-        # Put results into the textEdit.document
-        for row in self.text_results:
-            self.ui.textEdit.insertHtml(self.html_heading(row))
-            self.ui.textEdit.insertPlainText(row['text'] + "\n")
-        for i, row in enumerate(self.image_results):
-            self.ui.textEdit.insertHtml(self.html_heading(row))
-            self.put_image_into_textedit(row, i, self.ui.textEdit)
-        for i, row in enumerate(self.av_results):
-            self.ui.textEdit.insertHtml(self.html_heading(row))
-            self.ui.textEdit.insertPlainText(row['text'] + "\n")
+            self.file_or_case = "Case"
+        query.save_results()
+        self.coding_query = query
+
+        self.ui.textEdit.setPlainText(self.search_header)
+        self.results_model.reset_data(self.result_rows())
         # Need to resize splitter as it automatically adjusts to 50%/50%
         self.ui.splitter.setSizes([100, 300])
 
         # Fill case matrix
         if self.case_ids != "":
-            self.fill_matrix(self.text_results, self.image_results, self.av_results, self.case_ids)
+            self.fill_matrix()
+
+    def drop_query(self):
+        """ Stop reading the results of the last search and drop its tables. """
+
+        self.results_model.reset_data([])
+        if self.coding_query is not None:
+            try:
+                self.coding_query.drop()
+            except sqlite3.Error as e:
+                logger.debug("Drop report tables " + str(e))
+            self.coding_query = None
+
+    def done(self, result):
+        """ Called when the dialog is closed. """
+
+        self.drop_query()
+        super(DialogReportCodes, self).done(result)
 
-    def put_image_into_textedit(self, img, counter, text_edit):
+    def result_rows(self):
+        """ Yield each coded segment of the last search as a dictionary.
+        Text results come first, then images, then audio/video. """
+
+        if self.coding_query is None:
+            return
+        for row in self.coding_query.results():
+            yield self.result_dict(row)
+
+    def result_dict(self, i):
+        """ Convert a result row from CodingQuery into a dictionary for ease of use. """
+
+        if i[0] == 'text':
+            return {'result_type': 'text', 'codename': i[1], 'color': i[2],
+                'file_or_casename': i[3], 'fid': i[4], 'coder': i[5], 'pos0': i[6],
+                'pos1': i[7], 'text': i[12], 'file_or_case': self.file_or_case}
+        if i[0] == 'image':
+            return {'result_type': 'image', 'codename': i[1], 'color': i[2],
+                'file_or_casename': i[3], 'fid': i[4], 'coder': i[5], 'x1': i[8],
+                'y1': i[9], 'width': i[10], 'height': i[11], 'memo': i[12],
+                'mediapath': i[13], 'file_or_case': self.file_or_case}
+        # prepare additional text describing coded audio/video segment
+        text = ""
+        if i[13] is None:
+            logger.error("None value for a/v media name in AV results\n" + str(i))
+        if i[13] is not None:
+            text = i[13][1:] + ": "
+        secs0 = int(i[6] / 1000)
+        mins = int(secs0 / 60)
+        remainder_secs = str(secs0 - mins * 60)
+        if len(remainder_secs) == 1:
+            remainder_secs = "0" + remainder_secs
+        text += " [" + str(mins) + "." + remainder_secs
+        secs1 = int(i[7] / 1000)
+        mins = int(secs1 / 60)
+        remainder_secs = str(secs1 - mins * 60)
+        if len(remainder_secs) == 1:
+            remainder_secs = "0" + remainder_secs
+        text += " - " + str(mins) + "." + remainder_secs + "]"
+        avtext = text
+        if len(i[12]) > 0:
+            text += "\nMemo: " + i[12]
+        return {'result_type': 'av', 'codename': i[1], 'color': i[2],
+            'file_or_casename': i[3], 'fid': i[4], 'coder': i[5], 'pos0': i[6],
+            'pos1': i[7], 'memo': i[12], 'mediapath': i[13], 'file_or_case': self.file_or_case,
+            'text': text, 'avtext': avtext, 'av0': str(secs0), 'av1': str(secs1)}
+
+    def show_result(self, current, previous):
+        """ Show the selected result in the textEdit. """
+
+        self.ui.textEdit.clear()
+        if not current.isValid():
+            self.ui.textEdit.setPlainText(self.search_header)
+            return
+        self.insert_result(current.data(Qt.UserRole), current.row(), self.ui.textEdit)
+
+    def insert_result(self, row, counter, text_edit, full_size=False):
+        """ Insert the heading and coded text, image or a/v segment of a result. """
+
+        text_edit.insertHtml(self.html_heading(row))
+        if row['result_type'] == 'image':
+            self.put_image_into_textedit(row, counter, text_edit, full_size)
+            return
+        text_edit.insertPlainText(row['text'] + "\n")
+
+    def report_text_edit(self):
+        """ A text edit with the search parameters and all results of the last search,
+        for export to text and odt files. """
+
+        text_edit = QtWidgets.QTextEdit()
+        text_edit.insertPlainText(self.search_header)
+        for counter, row in enumerate(self.result_rows()):
+            self.insert_result(row, counter, text_edit, True)
+        return text_edit
+
+    def put_image_into_textedit(self, img, counter, text_edit, full_size=False):
         """ Scale image, add resource to document, insert image.
+        With full_size the resource is the full resolution area, for exported files,
+        otherwise a thumbnail. Both are shown at most 300 wide or high.
         """
 
-        path = self.settings['path'] + img['mediapath']
         document = text_edit.document()
-        image = QtGui.QImageReader(path).read()
-        image = image.copy(img['x1'], img['y1'], img['width'], img['height'])
-        # scale to max 300 wide or high. perhaps add option to change maximum limit?
-        scaler = 1.0
-        scaler_w = 1.0
-        scaler_h = 1.0
-        if image.width() > 300:
-            scaler_w = 300 / image.width()
-        if image.height() > 300:
-            scaler_h = 300 / image.height()
-        if scaler_w < scaler_h:
-            scaler = scaler_w
+        # scaled to max 300 wide or high. perhaps add option to change maximum limit?
+        thumbnails = self.app.get_thumbnails()
+        rect = (img['x1'], img['y1'], img['width'], img['height'])
+        if full_size:
+            image = thumbnails.crop(img['mediapath'], rect)
         else:
-            scaler = scaler_h
+            image = thumbnails.image(img['mediapath'], rect, 300)
+        size = thumbnails.fit(image, 300)
         # need unique image names or the same image from the same path is reproduced
         imagename = self.settings['path'] + '/images/' + str(counter) + '-' + img['mediapath']
         url = QtCore.QUrl(imagename)
         document.addResource(QtGui.QTextDocument.ImageResource, url, QtCore.QVariant(image))
         cursor = text_edit.textCursor()
         image_format = QtGui.QTextImageFormat()
-        image_format.setWidth(image.width() * scaler)
-        image_format.setHeight(image.height() * scaler)
+        image_format.setWidth(size.width())
+        image_format.setHeight(size.height())
         image_format.setName(url.toString())
         cursor.insertImage(image_format)
         text_edit.insertHtml("<br />")
-        self.html_links.append({'imagename': imagename, 'image': image,
-            'avname': None, 'av0': None, 'av1': None, 'avtext': None})
         if img['memo'] != "":
             text_edit.insertPlainText(_("Memo: ") + img['memo'] + "\n")
 
@@ -1534,92 +934,49 @@ class DialogReportCodes(QtWidgets.QDialog):
         html += " "+ item['file_or_case'] + ": " + item['file_or_casename'] + ", " + item['coder'] + "</em><br />"
         return html
 
-    def fill_matrix(self, text_results, image_results, av_results, case_ids):
-        """ Fill a tableWidget with rows of cases and columns of categories.
-        First identify top-lvel categories and codes. Then map all other codes to the
-        top-level cataegories. Fill tableWidget with columns of top-level items and rows
-        of cases. """
+    def fill_matrix(self):
+        """ Fill the matrix table with rows of cases and columns of top-level categories
+        and codes. Each selected code is mapped to its top-level item once, then the results
+        are grouped by (case, top-level item) in a single pass. Cells show the number of
+        results, the results of a cell are shown in the textEdit when it is clicked. """
 
         self.ui.splitter.setSizes([0, 300, 300])
 
-        # get top level categories and codes
-        items = self.ui.treeWidget.selectedItems()
-        top_level = []
-        horizontal_labels = []
-        sub_codes = []
-        for item in items:
-            root = self.ui.treeWidget.indexOfTopLevelItem(item)
-            #print(item.text(0), item.text(1), "root", root)
-            if root > -1:
-                top_level.append({'name': item.text(0), 'cat_or_cid': item.text(1)})
-                horizontal_labels.append(item.text(0))
-            #find sub-code and traverse upwards to map to top-level category
-            if root == -1 and item.text(1)[0:3] == 'cid':
-                #print("sub", item.text(0), item.text(1))
-                not_top = True
-                sub_code = {'codename': item.text(0), 'cid': item.text(1)}
-                while not_top:
-                    item = item.parent()
-                    if self.ui.treeWidget.indexOfTopLevelItem(item) > -1:
-                        not_top = False
-                        sub_code['top'] = item.text(0)
-                        sub_codes.append(sub_code)
-
-        # add the top-level name - which will match the tableWidget column name
-        for i in text_results:
-            # this assumes the code is already a top-level name (i.e. column in tableWidget)
-            i['top'] = i['codename']
-            # this replaces the top-level name by mapping to the correct top-level category (i.e. column)
-            for s in sub_codes:
-                if i['codename'] == s['codename']:
-                    i['top'] = s['top']
-        for i in image_results:
-            # this assumes the code is already a top-level name (i.e. column in tableWidget)
-            i['top'] = i['codename']
-            # this replaces the top-level name by mapping to the correct top-level category (i.e. column)
-            for s in sub_codes:
-                if i['codename'] == s['codename']:
-                    i['top'] = s['top']
-        for i in av_results:
-            # this assumes the code is already a top-level name (i.e. column in tableWidget)
-            i['top'] = i['codename']
-            # this replaces the top-level name by mapping to the correct top-level category (i.e. column)
-            for s in sub_codes:
-                if i['codename'] == s['codename']:
-                    i['top'] = s['top']
+        # map selected codes to the selected top-level item, which is their column
+        columns = {}
+        top_of_code = {}
+        for item in self.ui.treeWidget.selectedItems():
+            top = item
+            while top.parent() is not None:
+                top = top.parent()
+            if item is top:
+                columns.setdefault(item.text(0), len(columns))
+            if item.text(1)[0:3] == 'cid':
+                top_of_code[item.text(0)] = top.text(0)
 
         cur = self.settings['conn'].cursor()
-        cur.execute("select caseid, name from cases where caseid in (" + case_ids + ")")
-        cases = cur.fetchall()
-        vertical_labels = []
-        for c in cases:
-            vertical_labels.append(c[1])
-        self.ui.tableWidget.setColumnCount(len(horizontal_labels))
-        self.ui.tableWidget.setHorizontalHeaderLabels(horizontal_labels)
-        self.ui.tableWidget.setRowCount(len(cases))
-        self.ui.tableWidget.setVerticalHeaderLabels(vertical_labels)
-        for row, case in enumerate(cases):
-            for col, colname in enumerate(horizontal_labels):
-                txt_edit = QtWidgets.QTextEdit("")
-                for t in text_results:
-                    if t['file_or_casename'] == vertical_labels[row] and t['top'] == horizontal_labels[col]:
-                        txt_edit.insertHtml(self.html_heading(t))
-                        txt_edit.insertPlainText(t['text'] + "\n")
-                for a in av_results:
-                    if a['file_or_casename'] == vertical_labels[row] and a['top'] == horizontal_labels[col]:
-                        txt_edit.insertHtml(self.html_heading(a))
-                        txt_edit.insertPlainText(a['text'] + "\n")
-                for counter, i in enumerate(image_results):
-                    if i['file_or_casename'] == vertical_labels[row] and i['top'] == horizontal_labels[col]:
-                        txt_edit.insertHtml(self.html_heading(i))
-                        self.put_image_into_textedit(i, counter, txt_edit)
-                self.ui.tableWidget.setCellWidget(row, col, txt_edit)
-        self.ui.tableWidget.resizeColumnsToContents()
-        self.ui.tableWidget.resizeRowsToContents()
+        cur.execute("select name from cases where caseid in (" + self.case_ids + ")")
+        rows = dict((row[0], i) for i, row in enumerate(cur.fetchall()))
+        cells = {}
+        for result in self.result_rows():
+            row = rows.get(result['file_or_casename'])
+            column = columns.get(top_of_code.get(result['codename']))
+            if row is not None and column is not None:
+                cells.setdefault((row, column), []).append(result)
+        self.matrix_model.reset_data(list(rows), list(columns), cells)
+        # resize once the splitter has shown the table, so only the visible cells are measured
+        QtCore.QTimer.singleShot(0, self.ui.tableView.resizeColumnsToContents)
+
+    def show_matrix_cell(self, index):
+        """ Show the results of a matrix cell in the textEdit. """
+
+        self.ui.textEdit.clear()
+        for counter, result in enumerate(index.data(Qt.UserRole)):
+            self.insert_result(result, counter, self.ui.textEdit)
 
     def select_attributes(self):
         """ Select attributes from case or file attributes for search method.
-        Text values will be quoted.print("i[7]:  ", i[7])  # tmp
+        The values are passed to the search query as SQL parameters, see attribute_sql.
         """
 
         self.ui.splitter.setSizes([300, 300, 0])
@@ -100,6 +100,11 @@ class DialogSettings(QtWidgets.QDialog):
             self.ui.checkBox_backup_AV_files.setChecked(True)
         else:
             self.ui.checkBox_backup_AV_files.setChecked(False)
+        self.ui.spinBox_backups_kept.setValue(self.settings['backups_kept'])
+        if self.settings['fast_pdf_import'] is True:
+            self.ui.checkBox_fast_pdf.setChecked(True)
+        else:
+            self.ui.checkBox_fast_pdf.setChecked(False)
         if self.settings['directory'] == "":
             self.settings['directory'] = os.path.expanduser("~")
         self.ui.label_directory.setText(self.settings['directory'])
@@ -110,8 +115,10 @@ class DialogSettings(QtWidgets.QDialog):
 
         if self.ui.checkBox_auto_backup.isChecked():
             self.ui.checkBox_backup_AV_files.setEnabled(True)
+            self.ui.spinBox_backups_kept.setEnabled(True)
         else:
             self.ui.checkBox_backup_AV_files.setEnabled(False)
+            self.ui.spinBox_backups_kept.setEnabled(False)
 
     def comboBox_coder_changed(self):
         ''' Set the coder name to the current selection. '''
@@ -148,6 +155,11 @@ class DialogSettings(QtWidgets.QDialog):
             self.settings['backup_av_files'] = True
         else:
             self.settings['backup_av_files'] = False
+        if self.ui.checkBox_fast_pdf.isChecked():
+            self.settings['fast_pdf_import'] = True
+        else:
+            self.settings['fast_pdf_import'] = False
+        self.settings['backups_kept'] = self.ui.spinBox_backups_kept.value()
         self.save_settings()
         self.close()
 
@@ -164,7 +176,9 @@ class DialogSettings(QtWidgets.QDialog):
         txt += 'showIDs:' + str(self.settings['showIDs']) + "\n"
         txt += 'language:' + self.settings['language'] + "\n"
         txt += 'backup_on_open:' + str(self.settings['backup_on_open']) + '\n'
-        txt += 'backup_av_files:' + str(self.settings['backup_av_files'])
+        txt += 'backup_av_files:' + str(self.settings['backup_av_files']) + '\n'
+        txt += 'fast_pdf_import:' + str(self.settings['fast_pdf_import']) + '\n'
+        txt += 'backups_kept:' + str(self.settings['backups_kept'])
         with open(home + '/.qualcoder/QualCoder_settings.txt', 'w') as f:
             f.write(txt)
 
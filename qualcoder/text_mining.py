@@ -27,14 +27,13 @@ https://qualcoder.wordpress.com/
 '''
 
 from PyQt5 import QtGui, QtWidgets
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QBrush
 import os
 import sys
-from copy import copy
 import logging
 import traceback
 
+from .code_tree import fill_code_tree
+from .helpers import case_text_join_sql
 from .select_file import DialogSelectFile
 from .GUI.ui_dialog_text_mining import Ui_Dialog_text_mining
 
@@ -67,21 +66,22 @@ class DialogTextMining(QtWidgets.QDialog):
     ID_COLUMN = 1
     plain_text_results = ""
 
-    def __init__(self, settings, parent_textEdit):
+    def __init__(self, app, parent_textEdit):
 
         sys.excepthook = exception_handler
-        self.settings = settings
+        self.app = app
+        self.settings = app.settings
         self.parent_textEdit = parent_textEdit
         self.get_data()
         QtWidgets.QDialog.__init__(self)
         self.ui = Ui_Dialog_text_mining()
         self.ui.setupUi(self)
         self.ui.tableWidget.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
-        newfont = QtGui.QFont(settings['font'], settings['fontsize'], QtGui.QFont.Normal)
+        newfont = QtGui.QFont(self.settings['font'], self.settings['fontsize'], QtGui.QFont.Normal)
         self.setFont(newfont)
-        newfont = QtGui.QFont(settings['font'], 6, QtGui.QFont.Normal)
+        newfont = QtGui.QFont(self.settings['font'], 6, QtGui.QFont.Normal)
         self.ui.label_selections.setFont(newfont)
-        treefont = QtGui.QFont(settings['font'], settings['treefontsize'], QtGui.QFont.Normal)
+        treefont = QtGui.QFont(self.settings['font'], self.settings['treefontsize'], QtGui.QFont.Normal)
         self.ui.treeWidget.setFont(treefont)
         self.ui.treeWidget.setSelectionMode(QtWidgets.QTreeWidget.ExtendedSelection)
         self.ui.comboBox_coders.insertItems(0, self.coders)
@@ -101,20 +101,8 @@ class DialogTextMining(QtWidgets.QDialog):
         <<<filename>>>\n and suffixed with \n. '''
 
         cur = self.settings['conn'].cursor()
-        self.categories = []
-        cur.execute("select name, catid, owner, date, memo, supercatid from code_cat")
-        result = cur.fetchall()
-        for row in result:
-            self.categories.append({'name': row[0], 'catid': row[1], 'owner': row[2],
-            'date': row[3], 'memo': row[4], 'supercatid': row[5]})
-
-        self.code_names = []
-        cur.execute("select name, memo, owner, date, cid, catid, color from code_name")
-        result = cur.fetchall()
-        for row in result:
-            self.code_names.append({'name': row[0], 'memo': row[1], 'owner': row[2], 'date': row[3],
-            'cid': row[4], 'catid': row[5], 'color': row[6]})
-
+        self.categories = self.app.code_repository.categories
+        self.code_names = self.app.code_repository.codes
         self.coders = []
         cur.execute("select distinct owner from code_text")
         result = cur.fetchall()
@@ -183,79 +171,14 @@ class DialogTextMining(QtWidgets.QDialog):
     def fill_tree(self):
         ''' Fill tree widget, top level items are main categories and unlinked codes '''
 
-        cats = copy(self.categories)
-        codes = copy(self.code_names)
         self.ui.treeWidget.clear()
         self.ui.treeWidget.setColumnCount(2)
         self.ui.treeWidget.setHeaderLabels(["Name", "Id"])
         self.ui.treeWidget.header().setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
         self.ui.treeWidget.header().setStretchLastSection(False)
-        # add top level categories
-        remove_list = []
-        for c in cats:
-            if c['supercatid'] is None:
-                top_item = QtWidgets.QTreeWidgetItem([c['name'], 'catid:' + str(c['catid'])])
-                top_item.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-                self.ui.treeWidget.addTopLevelItem(top_item)
-                remove_list.append(c)
-        for item in remove_list:
-            #try:
-            cats.remove(item)
-            #except Exception as e:
-            #    print(e, item)
-
-        ''' Add child categories. Look at each unmatched category, iterate through tree
-        to add as child then remove matched categories from the list. '''
-        count = 0
-        while len(cats) > 0 or count < 10000:
-            remove_list = []
-            #logger.debug("cats:" + str(cats))
-            for c in cats:
-                it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
-                item = it.value()
-                while item:  # while there is an item in the list
-                    #logger.debug("While: " +  item.text(0) + "|"+ item.text(1) + ", c[catid]:" + str(c['catid']) + ", c[supercatid]:" + str(c['supercatid']))
-                    if item.text(1) == 'catid:' + str(c['supercatid']):
-                        child = QtWidgets.QTreeWidgetItem([c['name'], 'catid:' + str(c['catid'])])
-                        child.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-                        item.addChild(child)
-                        #logger.debug("Adding: " + c['name'])
-                        remove_list.append(c)
-                    it += 1
-                    item = it.value()
-            for item in remove_list:
-                cats.remove(item)
-            count += 1
-
-        # add unlinked codes as top level items
-        remove_items = []
-        for c in codes:
-            if c['catid'] is None:
-                #logger.debug("add unlinked code as top level item:" + c['name'])
-                top_item = QtWidgets.QTreeWidgetItem([c['name'], 'cid:' + str(c['cid'])])
-                top_item.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-                top_item.setBackground(0, QBrush(QtGui.QColor(c['color']), Qt.SolidPattern))
-                top_item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-                self.ui.treeWidget.addTopLevelItem(top_item)
-                remove_items.append(c)
-        for item in remove_items:
-            codes.remove(item)
-
-        # add codes as children
-        for c in codes:
-            it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
-            item = it.value()
-            while item:
-                #logger.debug("" + item.text(0) + "|" + item.text(1) + ", c[cid]:" + str(c['cid']) + "c[catid]:" + str(c['catid']))
-                if item.text(1) == 'catid:' + str(c['catid']):
-                    child = QtWidgets.QTreeWidgetItem([c['name'], 'cid:' + str(c['cid'])])
-                    child.setBackground(0, QBrush(QtGui.QColor(c['color']), Qt.SolidPattern))
-                    child.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-                    child.setFlags(Qt.ItemIsSelectable | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
-                    item.addChild(child)
-                    c['catid'] = -1  # make unmatchable
-                it += 1
-                item = it.value()
+        fill_code_tree(self.ui.treeWidget, self.categories, self.code_names,
+            category_columns=lambda c: [c['name'], 'catid:' + str(c['catid'])],
+            code_columns=lambda c: [c['name'], 'cid:' + str(c['cid'])])
         self.ui.treeWidget.expandAll()
 
     def export_selected_file(self):
@@ -353,7 +276,7 @@ class DialogTextMining(QtWidgets.QDialog):
         # get coded text via selected files
         parameters = []
         if files_selected:
-            sql = "select code_name.name, source.name, selfirst, selend, seltext, code_text.owner from "
+            sql = "select code_name.name, source.name, pos0, pos1, seltext, code_text.owner from "
             sql += "code_text "
             sql += " join code_name on code_name.cid = code_text.cid join source on fid = source.id "
 
@@ -379,13 +302,11 @@ class DialogTextMining(QtWidgets.QDialog):
         # get coded text via selected cases
         if not files_selected:
             sql = "select code_name.name, color, cases.name, "
-            sql += "code_text.selfirst, code_text.selend, seltext, code_text.owner from code_text "
+            sql += "code_text.pos0, code_text.pos1, seltext, code_text.owner from code_text "
             sql += " join code_name on code_name.cid = code_text.cid "
-            sql += " join (case_text join cases on cases.caseid = case_text.caseid) on "
-            sql += " code_text.fid = case_text.fid "
+            sql += case_text_join_sql(self.app.case_text_rtree)
             sql += " where code_name.cid in (" + ','.join(code_ids) + ") "
             sql += " and case_text.caseid in (" + ','.join(ids) + ") "
-            sql += " and (code_text.selfirst >= case_text.selfirst and code_text.selend <= case_text.selend)"
 
             # need to group by or can get multiple results
             #sql += " group by cases.name, freecode.name, " + coder + ".selfirst, " + coder + ".selend"
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (c) 2019 Colin Curtain
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Author: Colin Curtain (ccbogel)
+https://github.com/ccbogel/QualCoder
+'''
+
+
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+
+from PyQt5 import QtCore, QtGui
+
+logger = logging.getLogger(__name__)
+
+
+class ThumbnailCache():
+    """ Cropped and scaled images of project images and coded image areas, shared by
+    the reports, graph and case views.
+    Images are kept in a least recently used memory cache, and saved as png files in
+    the thumbnails folder of the project, so each area is decoded from the original
+    image once. Only the needed area is decoded, at the needed size, through
+    QImageReader setClipRect and setScaledSize.
+    The file name of a saved thumbnail includes the modification time and size of the
+    original image, so thumbnails of replaced images are not used. """
+
+    def __init__(self, project_path, max_items=200):
+        self.project_path = project_path
+        self.folder = os.path.join(project_path, "thumbnails")
+        self.max_items = max_items
+        self.images = OrderedDict()
+
+    def image(self, mediapath, rect=None, max_size=300):
+        """ The image at mediapath, e.g. '/images/photo.jpg', cropped to rect (x, y,
+        width, height) or the whole image if rect is None, and scaled down so that width
+        and height are at most max_size. Returns a null QImage if the image cannot be read. """
+
+        path = self.project_path + mediapath
+        if rect is not None:
+            rect = tuple(int(i) for i in rect)
+        key = (mediapath, rect, max_size)
+        image = self.images.get(key)
+        if image is not None:
+            self.images.move_to_end(key)
+            return image
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            logger.warning("Cannot read image " + path + " " + str(e))
+            return QtGui.QImage()
+        key_text = "|".join(str(i) for i in (mediapath, rect, max_size, stat.st_mtime_ns, stat.st_size))
+        filename = os.path.join(self.folder, hashlib.sha1(key_text.encode('utf-8')).hexdigest() + ".png")
+        image = QtGui.QImage(filename) if os.path.isfile(filename) else QtGui.QImage()
+        if image.isNull():
+            image = self.read(path, rect, max_size)
+            if not image.isNull():
+                self.save(image, filename)
+        self.images[key] = image
+        if len(self.images) > self.max_items:
+            self.images.popitem(last=False)
+        return image
+
+    def crop(self, mediapath, rect):
+        """ The area rect (x, y, width, height) of the image at full resolution, for
+        exported reports. Only the area is decoded and it is not cached. """
+
+        return self.read(self.project_path + mediapath, tuple(int(i) for i in rect), None)
+
+    @staticmethod
+    def fit(image, max_size=300):
+        """ The size of image scaled down so that width and height are at most max_size. """
+
+        size = image.size()
+        if size.width() > max_size or size.height() > max_size:
+            size.scale(max_size, max_size, QtCore.Qt.KeepAspectRatio)
+        return size
+
+    @staticmethod
+    def read(path, rect, max_size):
+        """ Decode only the area of the image in rect, scaled to fit max_size.
+        A max_size of None keeps the full resolution. """
+
+        reader = QtGui.QImageReader(path)
+        size = reader.size()
+        if not size.isValid():
+            # the format does not give the size before decoding
+            image = reader.read()
+            if rect is not None:
+                image = image.copy(*rect)
+            if max_size is not None and (image.width() > max_size or image.height() > max_size):
+                image = image.scaled(max_size, max_size, QtCore.Qt.KeepAspectRatio,
+                    QtCore.Qt.SmoothTransformation)
+            return image
+        area = QtCore.QRect(0, 0, size.width(), size.height())
+        if rect is not None:
+            area = area.intersected(QtCore.QRect(*rect))
+            reader.setClipRect(area)
+        if max_size is not None and area.width() > 0 and area.height() > 0:
+            scaler = min(1.0, max_size / area.width(), max_size / area.height())
+            if scaler < 1.0:
+                reader.setScaledSize(QtCore.QSize(max(1, round(area.width() * scaler)),
+                    max(1, round(area.height() * scaler))))
+        image = reader.read()
+        if image.isNull():
+            logger.warning("Cannot read image " + path + " " + reader.errorString())
+        return image
+
+    def save(self, image, filename):
+        """ Save a thumbnail in the thumbnails folder. Failures are only logged. """
+
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+        except OSError as e:
+            logger.warning("Cannot create thumbnails folder " + str(e))
+            return
+        if not image.save(filename, "PNG"):
+            logger.warning("Cannot save thumbnail " + filename)
+
+    def clear(self):
+        """ Empty the memory cache. """
+
+        self.images.clear()
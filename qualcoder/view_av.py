@@ -26,29 +26,25 @@ https://github.com/ccbogel/QualCoder
 https://qualcoder.wordpress.com/
 '''
 
-from copy import deepcopy
 import datetime
 import logging
 import os
 import platform
-from random import randint
 import re
 import sys
 import traceback
 
 from PyQt5 import QtCore, QtGui, QtWidgets
-from PyQt5.Qt import QHelpEvent
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QBrush
 
 import vlc
 
-from .add_item_name import DialogAddItemName
-from .color_selector import DialogColorSelect
-from .color_selector import colors
+from .code_text import ToolTip_EventFilter
+from .code_tree import CodeTreeMixin
 from .confirm_delete import DialogConfirmDelete
 from .GUI.ui_dialog_code_av import Ui_Dialog_code_av
 from .GUI.ui_dialog_view_av import Ui_Dialog_view_av
+from .intervals import IntervalIndex
 from .memo import DialogMemo
 from .select_file import DialogSelectFile
 
@@ -77,7 +73,7 @@ def msecs_to_mins_and_secs(msecs):
     return str(mins) + "." + remainder_secs
 
 
-class DialogCodeAV(QtWidgets.QDialog):
+class DialogCodeAV(CodeTreeMixin, QtWidgets.QDialog):
     """ View and code audio and video segments.
     Create codes and categories.  """
 
@@ -99,23 +95,26 @@ class DialogCodeAV(QtWidgets.QDialog):
     timer = QtCore.QTimer()
 
     # for transcribed text
+    transcription = None
     annotations = []
     code_text = []
     time_positions = []  # transcribed timepositions as list of [text_pos0, text_pos1, milliseconds]
 
-    def __init__(self, settings, parent_textEdit):
+    def __init__(self, app, parent_textEdit):
         """ Show list of audio and video files.
         Can create a transcribe file from the audio / video.
         """
         #TODO maybe show other coders ?
 
         sys.excepthook = exception_handler
-        self.settings = settings
+        self.app = app
+        self.settings = app.settings
         self.parent_textEdit = parent_textEdit
         self.codes = []
         self.categories = []
         self.annotations = []
         self.code_text = []
+        self.code_text_index = IntervalIndex()
         self.time_positions = []
         self.media_data = None
         self.segment['start'] = None
@@ -140,27 +139,19 @@ class DialogCodeAV(QtWidgets.QDialog):
         self.ui.textEdit.setMouseTracking(True)
         self.ui.textEdit.setReadOnly(True)
         self.eventFilterTT = ToolTip_EventFilter()
+        self.eventFilterTT.set_index(self.code_text_index, self.app.code_repository)
         self.ui.textEdit.installEventFilter(self.eventFilterTT)
         self.ui.textEdit.setContextMenuPolicy(Qt.CustomContextMenu)
         self.ui.textEdit.customContextMenuRequested.connect(self.textEdit_menu)
 
-        newfont = QtGui.QFont(settings['font'], settings['fontsize'], QtGui.QFont.Normal)
+        newfont = QtGui.QFont(self.settings['font'], self.settings['fontsize'], QtGui.QFont.Normal)
         self.setFont(newfont)
-        treefont = QtGui.QFont(settings['font'],
-            settings['treefontsize'], QtGui.QFont.Normal)
-        self.ui.treeWidget.setFont(treefont)
-        self.ui.label_coder.setText(_("Coder: ") + settings['codername'])
+        self.ui.label_coder.setText(_("Coder: ") + self.settings['codername'])
         self.setWindowTitle(_("Media coding"))
         self.ui.pushButton_select.pressed.connect(self.select_media)
         #TODO show other coders, maybe?
         #self.ui.checkBox_show_coders.stateChanged.connect(self.show_or_hide_coders)
-        self.ui.treeWidget.setDragEnabled(True)
-        self.ui.treeWidget.setAcceptDrops(True)
-        self.ui.treeWidget.setDragDropMode(QtWidgets.QAbstractItemView.InternalMove)
-        self.ui.treeWidget.viewport().installEventFilter(self)
-        self.ui.treeWidget.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.ui.treeWidget.customContextMenuRequested.connect(self.tree_menu)
-        self.fill_tree()
+        self.setup_code_tree()
 
         # My solution to getting gui mouse events by putting vlc video in another dialog
         # a displaydialog named ddialog
@@ -205,115 +196,6 @@ class DialogCodeAV(QtWidgets.QDialog):
         self.ui.graphicsView.setScene(self.scene)
         self.ui.graphicsView.setContextMenuPolicy(QtCore.Qt.DefaultContextMenu)
 
-    def get_codes_categories(self):
-        """ Called from init, delete category/code. """
-
-        self.categories = []
-        cur = self.settings['conn'].cursor()
-        cur.execute("select name, catid, owner, date, memo, supercatid from code_cat")
-        result = cur.fetchall()
-        for row in result:
-            self.categories.append({'name': row[0], 'catid': row[1], 'owner': row[2],
-            'date': row[3], 'memo': row[4], 'supercatid': row[5]})
-        self.codes = []
-        cur = self.settings['conn'].cursor()
-        cur.execute("select name, memo, owner, date, cid, catid, color from code_name")
-        result = cur.fetchall()
-        for row in result:
-            self.codes.append({'name': row[0], 'memo': row[1], 'owner': row[2], 'date': row[3],
-            'cid': row[4], 'catid': row[5], 'color': row[6]})
-
-    def fill_tree(self):
-        """ Fill tree widget, tope level items are main categories and unlinked codes. """
-
-        cats = deepcopy(self.categories)
-        codes = deepcopy(self.codes)
-        self.ui.treeWidget.clear()
-        self.ui.treeWidget.setColumnCount(3)
-        self.ui.treeWidget.setHeaderLabels([_("Name"), _("Id"), _("Memo")])
-        self.ui.treeWidget.setColumnHidden(1, True)
-        self.ui.treeWidget.header().setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
-        self.ui.treeWidget.header().setStretchLastSection(False)
-        # add top level categories
-        remove_list = []
-        for c in cats:
-            if c['supercatid'] is None:
-                memo = ""
-                if c['memo'] != "":
-                    memo = "Memo"
-                top_item = QtWidgets.QTreeWidgetItem([c['name'], 'catid:' + str(c['catid']), memo])
-                top_item.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-                top_item.setToolTip(0, c['owner'] + "\n" + c['date'])
-                self.ui.treeWidget.addTopLevelItem(top_item)
-                remove_list.append(c)
-        for item in remove_list:
-            #try:
-            cats.remove(item)
-            #except Exception as e:
-            #    print(e, item)
-
-        ''' Add child categories. Look at each unmatched category, iterate through tree
-        to add as child, then remove matched categories from the list. '''
-        count = 0
-        while len(cats) > 0 or count < 10000:
-            remove_list = []
-            #logger.debug("cats:" + str(cats))
-            for c in cats:
-                it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
-                item = it.value()
-                while item:  # while there is an item in the list
-                    if item.text(1) == 'catid:' + str(c['supercatid']):
-                        memo = ""
-                        if c['memo'] != "":
-                            memo = "Memo"
-                        child = QtWidgets.QTreeWidgetItem([c['name'], 'catid:' + str(c['catid']), memo])
-                        child.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-                        child.setToolTip(0, c['owner'] + "\n" + c['date'])
-                        item.addChild(child)
-                        remove_list.append(c)
-                    it += 1
-                    item = it.value()
-            for item in remove_list:
-                cats.remove(item)
-            count += 1
-
-        # add unlinked codes as top level items
-        remove_items = []
-        for c in codes:
-            if c['catid'] is None:
-                memo = ""
-                if c['memo'] != "":
-                    memo = "Memo"
-                top_item = QtWidgets.QTreeWidgetItem([c['name'], 'cid:' + str(c['cid']), memo])
-                top_item.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-                top_item.setToolTip(0, c['owner'] + "\n" + c['date'])
-                top_item.setBackground(0, QBrush(QtGui.QColor(c['color']), Qt.SolidPattern))
-                top_item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled | Qt.ItemIsDragEnabled)
-                self.ui.treeWidget.addTopLevelItem(top_item)
-                remove_items.append(c)
-        for item in remove_items:
-            codes.remove(item)
-
-        # add codes as children
-        for c in codes:
-            it = QtWidgets.QTreeWidgetItemIterator(self.ui.treeWidget)
-            item = it.value()
-            while item:
-                if item.text(1) == 'catid:' + str(c['catid']):
-                    memo = ""
-                    if c['memo'] != "":
-                        memo = _("Memo")
-                    child = QtWidgets.QTreeWidgetItem([c['name'], 'cid:' + str(c['cid']), memo])
-                    child.setBackground(0, QBrush(QtGui.QColor(c['color']), Qt.SolidPattern))
-                    child.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-                    child.setToolTip(0, c['owner'] + "\n" + c['date'])
-                    child.setFlags(Qt.ItemIsSelectable | Qt.ItemIsUserCheckable | Qt.ItemIsEnabled | Qt.ItemIsDragEnabled)
-                    item.addChild(child)
-                    c['catid'] = -1  # make unmatchable
-                it += 1
-                item = it.value()
-        self.ui.treeWidget.expandAll()
-
     def select_media(self):
         """ Get all the media files. A dialog of filenames is presented to the user.
         The selected media file is then displayed for coding. """
@@ -451,8 +333,7 @@ class DialogCodeAV(QtWidgets.QDialog):
         for row in code_results:
             self.code_text.append({'cid': row[0], 'fid': row[1], 'seltext': row[2],
             'pos0': row[3], 'pos1':row[4], 'owner': row[5], 'date': row[6], 'memo': row[7]})
-        # update filter for tooltip
-        self.eventFilterTT.setCodes(self.code_text, self.codes)
+        self.code_text_index.build(self.code_text)
         # redo textEdit formatting
         self.unlight()
         self.highlight()
@@ -694,13 +575,11 @@ class DialogCodeAV(QtWidgets.QDialog):
             self.ui.label_segment.setText(text)
 
     def tree_menu(self, position):
-        """ Context menu for treeWidget items.
+        """ Context menu for treeView items.
         Add, rename, memo, move or delete code or category. Change code color. """
 
         menu = QtWidgets.QMenu()
-        selected = self.ui.treeWidget.currentItem()
-        #logger.debug("selected paremt: " + str(selected.parent()))
-        #logger.debug("index: " + str(self.ui.treeWidget.currentIndex()))
+        selected = self.selected_key()
         ActionItemAssignSegment = None
         if self.segment['end_msecs'] is not None and self.segment['start_msecs'] is not None:
             ActionItemAssignSegment = menu.addAction("Assign segment to code")
@@ -709,11 +588,11 @@ class DialogCodeAV(QtWidgets.QDialog):
         ActionItemRename = menu.addAction(_("Rename"))
         ActionItemEditMemo = menu.addAction(_("View or edit memo"))
         ActionItemDelete = menu.addAction(_("Delete"))
-        if selected is not None and selected.text(1)[0:3] == 'cid':
+        if selected is not None and selected[0:3] == 'cid':
             ActionItemChangeColor = menu.addAction(_("Change code color"))
 
-        action = menu.exec_(self.ui.treeWidget.mapToGlobal(position))
-        if selected is not None and selected.text(1)[0:3] == 'cid' and action == ActionItemChangeColor:
+        action = menu.exec_(self.ui.treeView.mapToGlobal(position))
+        if selected is not None and selected[0:3] == 'cid' and action == ActionItemChangeColor:
             self.change_code_color(selected)
         if action == ActionItemAddCategory:
             self.add_category()
@@ -722,29 +601,32 @@ class DialogCodeAV(QtWidgets.QDialog):
         if selected is not None and action == ActionItemRename:
             self.rename_category_or_code(selected)
         if selected is not None and action == ActionItemEditMemo:
-            self.add_edit_code_memo(selected)
+            self.add_edit_memo(selected)
         if selected is not None and action == ActionItemDelete:
             self.delete_category_or_code(selected)
-        if action == ActionItemAssignSegment:
+        if selected is not None and selected[0:3] == 'cid' and action == ActionItemAssignSegment:
             self.assign_segment_to_code(selected)
 
     def eventFilter(self, object, event):
-        """ Using this event filter to identify treeWidgetItem drop events.
+        """ Using this event filter to identify treeView drop events.
         http://doc.qt.io/qt-5/qevent.html#Type-enum
         QEvent::Drop	63	A drag and drop operation is completed (QDropEvent).
         https://stackoverflow.com/questions/28994494/why-does-qtreeview-not-fire-a-drop-or-move-event-during-drag-and-drop
         Also use eventFilter for QGraphicsView.
         """
 
-        if object is self.ui.treeWidget.viewport():
+        if object is self.ui.treeView.viewport():
             if event.type() == QtCore.QEvent.Drop:
-                item = self.ui.treeWidget.currentItem()
-                parent = self.ui.treeWidget.itemAt(event.pos())
-                self.item_moved_update_data(item, parent)
-                self.get_codes_categories()
-                self.fill_tree()
+                return self.code_tree_drop(event)
         return False
 
+    def codes_changed(self):
+        """ Called after a code is renamed, recoloured, merged or deleted. """
+
+        self.load_segments()
+        self.unlight()
+        self.highlight()
+
     def assign_segment_to_code(self, selected):
         """ Assign time segment to selected code. Insert an entry into the database.
         Then clear the segment for re-use."""
@@ -753,7 +635,7 @@ class DialogCodeAV(QtWidgets.QDialog):
             self.clear_segment()
             return
         sql = "insert into code_av (id, pos0, pos1, cid, memo, date, owner) values(?,?,?,?,?,?,?)"
-        cid = int(selected.text(1).split(':')[1])
+        cid = self.code_model.item(selected)['cid']
         values = [self.media_data['id'], self.segment['start_msecs'],
             self.segment['end_msecs'], cid, self.segment['memo'],
             datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -775,336 +657,6 @@ class DialogCodeAV(QtWidgets.QDialog):
         self.ui.label_segment.setText(_("Segment:"))
         self.ui.pushButton_coding.setText(_("Start segment"))
 
-    def item_moved_update_data(self, item, parent):
-        """ Called from drop event in treeWidget view port.
-        identify code or category to move.
-        Also merge codes if one code is dropped on another code. """
-
-        # find the category in the list
-        if item.text(1)[0:3] == 'cat':
-            found = -1
-            for i in range(0, len(self.categories)):
-                if self.categories[i]['catid'] == int(item.text(1)[6:]):
-                    found = i
-            if found == -1:
-                return
-            if parent is None:
-                self.categories[found]['supercatid'] = None
-            else:
-                if parent.text(1).split(':')[0] == 'cid':
-                    # parent is code (leaf) cannot add child
-                    return
-                supercatid = int(parent.text(1).split(':')[1])
-                if supercatid == self.categories[found]['catid']:
-                    # something went wrong
-                    logger.debug("supercatid== self.categories[found][catid]")
-                    return
-                self.categories[found]['supercatid'] = supercatid
-            cur = self.settings['conn'].cursor()
-            cur.execute("update code_cat set supercatid=? where catid=?",
-            [self.categories[found]['supercatid'], self.categories[found]['catid']])
-            self.settings['conn'].commit()
-
-        # find the code in the list
-        if item.text(1)[0:3] == 'cid':
-            found = -1
-            for i in range(0, len(self.codes)):
-                if self.codes[i]['cid'] == int(item.text(1)[4:]):
-                    found = i
-            if found == -1:
-                return
-            if parent is None:
-                self.codes[found]['catid'] = None
-            else:
-                if parent.text(1).split(':')[0] == 'cid':
-                    # parent is code (leaf) cannot add child, but can merge
-                    self.merge_codes(self.codes[found], parent)
-                    return
-                catid = int(parent.text(1).split(':')[1])
-                self.codes[found]['catid'] = catid
-
-            cur = self.settings['conn'].cursor()
-            cur.execute("update code_name set catid=? where cid=?",
-            [self.codes[found]['catid'], self.codes[found]['cid']])
-            self.settings['conn'].commit()
-
-    def merge_codes(self, item, parent):
-        """ Merge code or category with another code or category.
-        Called by item_moved_update_data when a code is moved onto another code. """
-
-        msg = _("Merge code: ") + item['name'] + "\n==> " + parent.text(0)
-        reply = QtWidgets.QMessageBox.question(None, _('Merge codes'),
-        msg, QtWidgets.QMessageBox.Yes, QtWidgets.QMessageBox.No)
-        if reply == QtWidgets.QMessageBox.No:
-            return
-        cur = self.settings['conn'].cursor()
-        old_cid = item['cid']
-        new_cid = int(parent.text(1).split(':')[1])
-        try:
-            cur.execute("update code_text set cid=? where cid=?", [new_cid, old_cid])
-            self.settings['conn'].commit()
-        except Exception as e:
-            e = str(e)
-            msg = _("Cannot merge codes, unmark overlapping text.") + "\n" + e
-            QtWidgets.QInformationDialog(None, _("Cannot merge"), msg)
-            return
-        cur.execute("delete from code_name where cid=?", [old_cid, ])
-        self.settings['conn'].commit()
-        self.parent_textEdit.append(msg)
-        self.load_segments()
-
-    def add_code(self):
-        """ Use add_item dialog to get new code text.
-        Add_code_name dialog checks for duplicate code name.
-        New code is added to data and database. """
-
-        ui = DialogAddItemName(self.codes, _("Add new code"))
-        ui.exec_()
-        new_name = ui.get_new_name()
-        if new_name is None:
-            return
-        code_color = colors[randint(0, len(colors) - 1)]
-        item = {'name': new_name, 'memo': "", 'owner': self.settings['codername'],
-        'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),'catid': None, 'color': code_color}
-        cur = self.settings['conn'].cursor()
-        cur.execute("insert into code_name (name,memo,owner,date,catid,color) values(?,?,?,?,?,?)"
-            , (item['name'], item['memo'], item['owner'], item['date'], item['catid'], item['color']))
-        self.settings['conn'].commit()
-        self.parent_textEdit.append(_("Code added: ") + item['name'])
-        cur.execute("select last_insert_rowid()")
-        cid = cur.fetchone()[0]
-        item['cid'] = cid
-        self.codes.append(item)
-        top_item = QtWidgets.QTreeWidgetItem([item['name'], 'cid:' + str(item['cid']), ""])
-        top_item.setIcon(0, QtGui.QIcon("GUI/icon_code.png"))
-        color = item['color']
-        top_item.setBackground(0, QBrush(QtGui.QColor(color), Qt.SolidPattern))
-        self.ui.treeWidget.addTopLevelItem(top_item)
-        self.ui.treeWidget.setCurrentItem(top_item)
-
-    def add_category(self):
-        """ Add a new category.
-        Note: the addItem dialog does the checking for duplicate category names
-        Add the new category as a top level item. """
-
-        ui = DialogAddItemName(self.categories, _("Category"))
-        ui.exec_()
-        new_name = ui.get_new_name()
-        if new_name is None:
-            return
-        # add to database
-        item = {'name': new_name, 'cid': None, 'memo': "",
-        'owner': self.settings['codername'],
-        'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-        cur = self.settings['conn'].cursor()
-        cur.execute("insert into code_cat (name, memo, owner, date, supercatid) values(?,?,?,?,?)"
-            , (item['name'], item['memo'], item['owner'], item['date'], None))
-        self.settings['conn'].commit()
-        cur.execute("select last_insert_rowid()")
-        catid = cur.fetchone()[0]
-        item['catid'] = catid
-        self.parent_textEdit.append(_("Category added: ") + item['name'])
-        self.categories.append(item)
-        # update widget
-        top_item = QtWidgets.QTreeWidgetItem([item['name'], 'catid:' + str(item['catid']), ""])
-        top_item.setIcon(0, QtGui.QIcon("GUI/icon_cat.png"))
-        self.ui.treeWidget.addTopLevelItem(top_item)
-
-    def delete_category_or_code(self, selected):
-        """ Determine if category or code is to be deleted. """
-
-        if selected.text(1)[0:3] == 'cat':
-            self.delete_category(selected)
-            return  # avoid error as selected is now None
-        if selected.text(1)[0:3] == 'cid':
-            self.delete_code(selected)
-
-    def delete_code(self, selected):
-        """ Find code, remove from database, refresh and code_name data and fill
-        treeWidget. """
-
-        # find the code_in the list, check to delete
-        found = -1
-        for i in range(0, len(self.codes)):
-            if self.codes[i]['cid'] == int(selected.text(1)[4:]):
-                found = i
-        if found == -1:
-            return
-        code_ = self.codes[found]
-        ui = DialogConfirmDelete(_("Code: ") + selected.text(0))
-        ok = ui.exec_()
-        if not ok:
-            return
-        cur = self.settings['conn'].cursor()
-        cur.execute("delete from code_name where cid=?", [code_['cid'], ])
-        cur.execute("delete from code_text where cid=?", [code_['cid'], ])
-        self.settings['conn'].commit()
-        self.parent_textEdit.append(_("Code deleted: ") + code_['name'])
-        selected = None
-        self.get_codes_categories()
-        self.fill_tree()
-        self.load_segments()
-
-    def delete_category(self, selected):
-        """ Find category, remove from database, refresh categories and code data
-        and fill treeWidget. """
-
-        found = -1
-        for i in range(0, len(self.categories)):
-            if self.categories[i]['catid'] == int(selected.text(1)[6:]):
-                found = i
-        if found == -1:
-            return
-        category = self.categories[found]
-        ui = DialogConfirmDelete(_("Category: ") + selected.text(0))
-        ok = ui.exec_()
-        if not ok:
-            return
-        cur = self.settings['conn'].cursor()
-        cur.execute("update code_name set catid=null where catid=?", [category['catid'], ])
-        cur.execute("update code_cat set supercatid=null where catid = ?", [category['catid'], ])
-        cur.execute("delete from code_cat where catid = ?", [category['catid'], ])
-        self.settings['conn'].commit()
-        self.parent_textEdit.append(_("Category deleted: ") + category['name'])
-        selected = None
-        self.get_codes_categories()
-        self.fill_tree()
-
-    def add_edit_code_memo(self, selected):
-        """ View and edit a memo. """
-
-        if selected.text(1)[0:3] == 'cid':
-            # find the code in the list
-            found = -1
-            for i in range(0, len(self.codes)):
-                if self.codes[i]['cid'] == int(selected.text(1)[4:]):
-                    found = i
-            if found == -1:
-                return
-            ui = DialogMemo(self.settings, _("Memo for Code ") + self.codes[found]['name'],
-            self.codes[found]['memo'])
-            ui.exec_()
-            memo = ui.memo
-            if memo == "":
-                selected.setData(2, QtCore.Qt.DisplayRole, "")
-            else:
-                selected.setData(2, QtCore.Qt.DisplayRole, _("Memo"))
-            # update codes list and database
-            if memo != self.codes[found]['memo']:
-                self.codes[found]['memo'] = memo
-                cur = self.settings['conn'].cursor()
-                cur.execute("update code_name set memo=? where cid=?", (memo, self.codes[found]['cid']))
-                self.settings['conn'].commit()
-
-        if selected.text(1)[0:3] == 'cat':
-            # find the category in the list
-            found = -1
-            for i in range(0, len(self.categories)):
-                if self.categories[i]['catid'] == int(selected.text(1)[6:]):
-                    found = i
-            if found == -1:
-                return
-            ui = DialogMemo(self.settings, _("Memo for Category ") + self.categories[found]['name'],
-            self.categories[found]['memo'])
-            ui.exec_()
-            memo = ui.memo
-            if memo == "":
-                selected.setData(2, QtCore.Qt.DisplayRole, "")
-            else:
-                selected.setData(2, QtCore.Qt.DisplayRole, _("Memo"))
-            # update codes list and database
-            if memo != self.categories[found]['memo']:
-                self.categories[found]['memo'] = memo
-                cur = self.settings['conn'].cursor()
-                cur.execute("update code_cat set memo=? where catid=?", (memo, self.categories[found]['catid']))
-                self.settings['conn'].commit()
-
-    def rename_category_or_code(self, selected):
-        """ Rename a code or category. Checks that the proposed code or category name is
-        not currently in use. """
-
-        if selected.text(1)[0:3] == 'cid':
-            new_name, ok = QtWidgets.QInputDialog.getText(self, _("Rename code"), _("New code name:"),
-            QtWidgets.QLineEdit.Normal, selected.text(0))
-            if not ok or new_name == '':
-                return
-            # check that no other code has this text
-            for c in self.codes:
-                if c['name'] == new_name:
-                    QtWidgets.QMessageBox.warning(None, _("Name in use"),
-                    new_name + _(" Name already in use, choose another."), QtWidgets.QMessageBox.Ok)
-                    return
-            # find the code in the list
-            found = -1
-            for i in range(0, len(self.codes)):
-                if self.codes[i]['cid'] == int(selected.text(1)[4:]):
-                    found = i
-            if found == -1:
-                return
-            # update codes list and database
-            cur = self.settings['conn'].cursor()
-            cur.execute("update code_name set name=? where cid=?", (new_name, self.codes[found]['cid']))
-            self.settings['conn'].commit()
-            self.parent_textEdit.append(_("Code renamed: ") + self.codes[found]['name'] + " ==> " + new_name)
-            self.codes[found]['name'] = new_name
-            selected.setData(0, QtCore.Qt.DisplayRole, new_name)
-            self.load_segments()
-            return
-
-        if selected.text(1)[0:3] == 'cat':
-            new_name, ok = QtWidgets.QInputDialog.getText(self, _("Rename category"), _("New category name:"),
-            QtWidgets.QLineEdit.Normal, selected.text(0))
-            if not ok or new_name == '':
-                return
-            # check that no other category has this text
-            for c in self.categories:
-                if c['name'] == new_name:
-                    msg = _("This category name is already in use")
-                    QtWidgets.QMessageBox.warning(None, _("Duplicate category name"), msg, QtWidgets.QMessageBox.Ok)
-                    return
-            # find the category in the list
-            found = -1
-            for i in range(0, len(self.categories)):
-                if self.categories[i]['catid'] == int(selected.text(1)[6:]):
-                    found = i
-            if found == -1:
-                return
-            # update category list and database
-            cur = self.settings['conn'].cursor()
-            cur.execute("update code_cat set name=? where catid=?",
-            (new_name, self.categories[found]['catid']))
-            self.settings['conn'].commit()
-            self.parent_textEdit.append(_("Category renamed: ") + self.categories[found]['name'] + " ==> " + new_name)
-            self.categories[found]['name'] = new_name
-            selected.setData(0, QtCore.Qt.DisplayRole, new_name)
-
-    def change_code_color(self, selected):
-        """ Change the color of the currently selected code. """
-
-        cid = int(selected.text(1)[4:])
-        found = -1
-        for i in range(0, len(self.codes)):
-            if self.codes[i]['cid'] == cid:
-                found = i
-        if found == -1:
-            return
-        ui = DialogColorSelect(self.codes[found]['color'])
-        ok = ui.exec_()
-        if not ok:
-            return
-        new_color = ui.get_color()
-        if new_color is None:
-            return
-        selected.setBackground(0, QBrush(QtGui.QColor(new_color), Qt.SolidPattern))
-        #update codes list and database
-        self.codes[found]['color'] = new_color
-        cur = self.settings['conn'].cursor()
-        cur.execute("update code_name set color=? where cid=?",
-        (self.codes[found]['color'], self.codes[found]['cid']))
-        self.settings['conn'].commit()
-        self.load_segments()
-
-    # Methods used with the textEdit transcribed text
     def unlight(self):
         """ Remove all text highlighting from current file. """
 
@@ -1214,13 +766,11 @@ class DialogCodeAV(QtWidgets.QDialog):
         if self.transcription is None or self.ui.textEdit.toPlainText() == "":
             QtWidgets.QMessageBox.warning(None, _('Warning'), _("No transcription"), QtWidgets.QMessageBox.Ok)
             return
-        item = self.ui.treeWidget.currentItem()
+        item = self.selected_code()
         if item is None:
             QtWidgets.QMessageBox.warning(None, _('Warning'), _("No code was selected"), QtWidgets.QMessageBox.Ok)
             return
-        if item.text(1).split(':')[0] == 'catid':  # must be a code
-            return
-        cid = int(item.text(1).split(':')[1])
+        cid = item['cid']
         selectedText = self.ui.textEdit.textCursor().selectedText()
         pos0 = self.ui.textEdit.textCursor().selectionStart()
         pos1 = self.ui.textEdit.textCursor().selectionEnd()
@@ -1230,8 +780,6 @@ class DialogCodeAV(QtWidgets.QDialog):
         coded = {'cid': cid, 'fid': self.transcription[0], 'seltext': selectedText,
         'pos0': pos0, 'pos1': pos1, 'owner': self.settings['codername'], 'memo': "",
         'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-        self.code_text.append(coded)
-        self.highlight()
         cur = self.settings['conn'].cursor()
 
         # check for an existing duplicated marking first
@@ -1243,6 +791,9 @@ class DialogCodeAV(QtWidgets.QDialog):
             _("This segment has already been coded with this code by ") + coded['owner'],
             QtWidgets.QMessageBox.Ok)
             return
+        self.code_text.append(coded)
+        self.code_text_index.add(coded)
+        self.highlight()
 
         #TODO should not get sqlite3.IntegrityError:
         #TODO UNIQUE constraint failed: code_text.cid, code_text.fid, code_text.pos0, code_text.pos1
@@ -1254,8 +805,6 @@ class DialogCodeAV(QtWidgets.QDialog):
             self.settings['conn'].commit()
         except Exception as e:
             logger.debug(str(e))
-        # update filter for tooltip
-        self.eventFilterTT.setCodes(self.code_text, self.codes)
 
     def unmark(self, location):
         """ Remove code marking by this coder from selected text in current file. """
@@ -1263,8 +812,8 @@ class DialogCodeAV(QtWidgets.QDialog):
         if self.transcription is None or self.ui.textEdit.toPlainText() == "":
             return
         unmarked = None
-        for item in self.code_text:
-            if location >= item['pos0'] and location <= item['pos1'] and item['owner'] == self.settings['codername']:
+        for item in self.code_text_index.at(location):
+            if item['owner'] == self.settings['codername']:
                 unmarked = item
         if unmarked is None:
             return
@@ -1276,9 +825,9 @@ class DialogCodeAV(QtWidgets.QDialog):
         self.settings['conn'].commit()
         if unmarked in self.code_text:
             self.code_text.remove(unmarked)
+        self.code_text_index.remove(unmarked)
 
-        # update filter for tooltip and update code colours
-        self.eventFilterTT.setCodes(self.code_text, self.codes)
+        # update code colours
         self.unlight()
         self.highlight()
 
@@ -1341,54 +890,6 @@ class DialogCodeAV(QtWidgets.QDialog):
         self.highlight()
 
 
-class ToolTip_EventFilter(QtCore.QObject):
-    """ Used to add a dynamic tooltip for the textEdit.
-    The tool top text is changed according to its position in the text.
-    If over a coded section the codename is displayed in the tooltip.
-    """
-
-    codes = None
-    code_text = None
-
-    def setCodes(self, code_text, codes):
-        self.code_text = code_text
-        self.codes = codes
-        for item in self.code_text:
-            for c in self.codes:
-                if item['cid'] == c['cid']:
-                    item['name'] = c['name']
-
-    def eventFilter(self, receiver, event):
-        #QtGui.QToolTip.showText(QtGui.QCursor.pos(), tip)
-        if event.type() == QtCore.QEvent.ToolTip:
-            helpEvent = QHelpEvent(event)
-            cursor = QtGui.QTextCursor()
-            cursor = receiver.cursorForPosition(helpEvent.pos())
-            pos = cursor.position()
-            receiver.setToolTip("")
-            displayText = ""
-            # occasional None type error
-            if self.code_text is None:
-                #Call Base Class Method to Continue Normal Event Processing
-                return super(ToolTip_EventFilter, self).eventFilter(receiver, event)
-            for item in self.code_text:
-                if item['pos0'] <= pos and item['pos1'] >= pos:
-                    if displayText == "":
-                        displayText = item['name']
-                    else:  # can have multiple codes on same selected area
-                        try:
-                            displayText += "\n" + item['name']
-                        except Exception as e:
-                            msg = "Codes ToolTipEventFilter " + str(e) + ". Possible key error: "
-                            msg += str(item) + "\n" + self.code_text
-                            logger.error(msg)
-            if displayText != "":
-                receiver.setToolTip(displayText)
-
-        #Call Base Class Method to Continue Normal Event Processing
-        return super(ToolTip_EventFilter, self).eventFilter(receiver, event)
-
-
 class GraphicsScene(QtWidgets.QGraphicsScene):
     """ set the scene for the graphics objects and re-draw events. """
 
@@ -42,7 +42,7 @@ from PyQt5 import QtCore, QtWidgets, QtGui
 from .GUI.ui_visualise_graph import Ui_Dialog_visualiseGraph
 from .information import DialogInformation
 from .memo import DialogMemo
-from .helpers import CodedMediaMixin
+from .helpers import CodedMediaMixin, case_text_join_sql
 
 path = os.path.abspath(os.path.dirname(__file__))
 logger = logging.getLogger(__name__)
@@ -470,16 +470,12 @@ class NodeGraphicsItem(CodedMediaMixin,QtWidgets.QGraphicsEllipseItem):
             ui = DialogMemo(self.settings,"Memo for Code " + data['name'], data['memo'])
             ui.exec_()
             self.data['memo'] = ui.memo
-            cur = self.app.conn.cursor()
-            cur.execute("update code_name set memo=? where cid=?", (self.data['memo'], self.data['cid']))
-            self.app.conn.commit()
+            self.app.code_repository.set_memo('cid:' + str(self.data['cid']), self.data['memo'])
         if data['catid'] is not None and data['cid'] is None:
             ui = DialogMemo(self.settings,"Memo for Category " + data['name'], data['memo'])
             ui.exec_()
             self.data['memo'] = ui.memo
-            cur = self.app.conn.cursor()
-            cur.execute("update code_cat set memo=? where catid=?", (self.data['memo'], self.data['catid']))
-            self.app.conn.commit()
+            self.app.code_repository.set_memo('catid:' + str(self.data['catid']), self.data['memo'])
 
     def case_media(self, data):
         """ Display all coded text and media for this code.
@@ -498,10 +494,7 @@ class NodeGraphicsItem(CodedMediaMixin,QtWidgets.QGraphicsEllipseItem):
         sql = "select code_name.name, color, cases.name, "
         sql += "code_text.pos0, code_text.pos1, seltext, code_text.owner from code_text "
         sql += " join code_name on code_name.cid = code_text.cid "
-        sql += " join (case_text join cases on cases.caseid = case_text.caseid) on "
-        sql += " code_text.fid = case_text.fid "
-        sql += "and (code_text.pos0 between case_text.pos0 and case_text.pos1) "
-        sql += "and (code_text.pos1 between case_text.pos0 and case_text.pos1) "
+        sql += case_text_join_sql(self.app.case_text_rtree)
         sql += " where code_name.cid=" + str(self.data['cid'])
         sql += " order by cases.name, code_text.pos0, code_text.owner "
 
@@ -571,30 +564,18 @@ class NodeGraphicsItem(CodedMediaMixin,QtWidgets.QGraphicsEllipseItem):
         the uniqueness to the name.
         """
 
-        path = self.settings['path'] + img['mediapath']
         document = text_edit.document()
-        image = QtGui.QImageReader(path).read()
-        image = image.copy(img['x1'], img['y1'], img['width'], img['height'])
-        # scale to max 300 wide or high. perhaps add option to change maximum limit?
-        scaler = 1.0
-        scaler_w = 1.0
-        scaler_h = 1.0
-        if image.width() > 300:
-            scaler_w = 300 / image.width()
-        if image.height() > 300:
-            scaler_h = 300 / image.height()
-        if scaler_w < scaler_h:
-            scaler = scaler_w
-        else:
-            scaler = scaler_h
+        # scaled to max 300 wide or high. perhaps add option to change maximum limit?
+        image = self.app.get_thumbnails().image(img['mediapath'],
+            (img['x1'], img['y1'], img['width'], img['height']), 300)
         # need unique image names or the same image from the same path is reproduced
         imagename = self.settings['path'] + '/images/' + str(counter) + '-' + img['mediapath']
         url = QtCore.QUrl(imagename)
         document.addResource(QtGui.QTextDocument.ImageResource, url, QtCore.QVariant(image))
         cursor = text_edit.textCursor()
         image_format = QtGui.QTextImageFormat()
-        image_format.setWidth(image.width() * scaler)
-        image_format.setHeight(image.height() * scaler)
+        image_format.setWidth(image.width())
+        image_format.setHeight(image.height())
         image_format.setName(url.toString())
         cursor.insertImage(image_format)
         text_edit.insertHtml("<br />")